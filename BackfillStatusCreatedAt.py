@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import DynamoDB
+import Storage
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+####################################### Backfill #######################################
+
+# Set status_created_at on every request in Dabao4Me_Requests that is missing it (written before it existed) or has it in an older form,
+# so the canteen and requester listings include them, in the order they were made. Safe to run again, and while the bot is running:
+# an item whose status changes after it is scanned is skipped, since the write that changed its status also set status_created_at.
+# Returns the number of requests updated.
+async def backfill(table):
+    from botocore.exceptions import ClientError
+
+    scanArgs = {"ProjectionExpression": "RequestID, request_status, status_created_at"}
+    updated = 0
+
+    while True:
+        response = await table.scan(**scanArgs)
+
+        for item in response["Items"]:
+            statusCreatedAt = Storage.statusCreatedAt(item["request_status"], item["RequestID"])
+
+            if item.get("status_created_at") == statusCreatedAt:
+                continue
+
+            try:
+                await table.update_item(
+                    Key = {"RequestID": item["RequestID"]},
+                    UpdateExpression = "SET status_created_at = :status_created_at",
+                    ConditionExpression = "request_status = :status",
+                    ExpressionAttributeValues = {":status_created_at": statusCreatedAt, ":status": item["request_status"]}
+                )
+            except ClientError as error:
+                if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+                continue
+
+            updated += 1
+
+        # No LastEvaluatedKey means this was the last page.
+        if "LastEvaluatedKey" not in response:
+            return updated
+
+        scanArgs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+if __name__ == "__main__":
+    logger.info("Set status_created_at on %s requests", asyncio.run(backfill(DynamoDB.table)))
@@ -0,0 +1,22 @@
+import asyncio
+import Settings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Blocking work that isn't a DynamoDB call (SQLite, the canteen catalogue, the request archive) runs on this pool
+# instead of the DynamoDB executor, so it never takes a thread away from the boto3 calls.
+
+####################################### Parameters #######################################
+
+# Maximum number of blocking calls that may run at the same time (one worker thread each).
+max_workers = Settings.config.getint("blocking_io", "max_workers", fallback = 4)
+
+executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "blocking_io")
+
+####################################### Helper Functions #######################################
+
+# Run a blocking function in the executor and wait for its result without blocking the event loop.
+async def runInExecutor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
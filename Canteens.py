@@ -0,0 +1,240 @@
+from datetime import datetime
+
+import json
+import logging
+import Settings
+import os
+import BlockingIO
+import GeoIndex
+import UserInterface
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# JSON file with the canteen catalogue (see README). If it doesn't exist, DEFAULT_CATALOGUE is used.
+catalogue_path = Settings.config.get("canteens", "path", fallback = "canteens.json")
+
+# Seconds between checks of the catalogue file for changes. 0 disables reloading.
+reload_interval = Settings.config.getfloat("canteens", "reload_interval", fallback = 30)
+
+# Time zone the opening hours are in, e.g. "Asia/Singapore". Defaults to the local time zone.
+time_zone = Settings.config.get("canteens", "timezone", fallback = None)
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# The canteens when there is no catalogue file: always open, no capacity hint.
+DEFAULT_CATALOGUE = {
+    "deck": {"name": "The Deck"},
+    "frontier": {"name": "Frontier"},
+    "fine_foods": {"name": "Fine Foods"},
+    "flavours": {"name": "Flavours @ Utown"},
+    "technoedge": {"name": "TechnoEdge"},
+    "pgpr": {"name": "PGPR"}
+}
+
+# The current catalogue (canteen ID -> Canteen), in the order they are shown. Replaced as a whole by install().
+canteens = {}
+
+# The canteens that have a location, for finding the ones near a fulfiller. Replaced with the catalogue.
+geoIndex = GeoIndex.GeoIndex({})
+
+# os.stat() of the catalogue file when it was last loaded, or None if the default catalogue is in use.
+loadedStat = None
+
+####################################### Catalogue #######################################
+
+class Canteen:
+    def __init__(self, canteenID, name, hours = None, capacity = None, location = None):
+        self.canteenID = canteenID
+        self.name = name
+
+        # (latitude, longitude), or None if the canteen isn't shown to fulfillers searching near them.
+        self.location = location
+
+        # Weekday (0 is Monday) -> list of (opening minute, closing minute) of the day. None if the canteen is always open.
+        self.hours = hours
+
+        # Rough number of open requests the canteen's fulfillers can keep up with, or None.
+        self.capacity = capacity
+
+    def isOpen(self, now):
+        if self.hours is None:
+            return True
+
+        minute = now.hour * 60 + now.minute
+
+        return any(opens <= minute < closes for opens, closes in self.hours.get(now.weekday(), ()))
+
+    # The opening hours on the day of now, e.g. "07:30-14:00, 17:00-21:00".
+    def hoursOn(self, now):
+        if self.hours is None:
+            return "open all day"
+
+        periods = self.hours.get(now.weekday())
+
+        if not periods:
+            return "closed all day"
+
+        return ", ".join(f"{opens // 60:02d}:{opens % 60:02d}-{closes // 60:02d}:{closes % 60:02d}" for opens, closes in periods)
+
+# Parse "HH:MM-HH:MM" into (opening minute, closing minute).
+def parsePeriod(period):
+    try:
+        opens, closes = (int(hour) * 60 + int(minute) for hour, minute in (time.split(":") for time in period.split("-")))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f"Invalid opening hours '{period}', expected 'HH:MM-HH:MM'")
+
+    if not 0 <= opens < closes <= 24 * 60:
+        raise ValueError(f"Invalid opening hours '{period}', the canteen must close after it opens on the same day")
+
+    return opens, closes
+
+# Parse the "hours" of a canteen: day ("mon" to "sun") -> "HH:MM-HH:MM" or a list of them. Days left out are closed.
+def parseHours(hours):
+    if hours is None:
+        return None
+
+    if not isinstance(hours, dict):
+        raise ValueError(f"Invalid hours '{hours}', expected an object of day -> periods")
+
+    parsed = {}
+
+    for day, periods in hours.items():
+        if day not in DAYS:
+            raise ValueError(f"Invalid day '{day}', expected one of {', '.join(DAYS)}")
+
+        if not isinstance(periods, (str, list)):
+            raise ValueError(f"Invalid opening hours '{periods}' on '{day}', expected 'HH:MM-HH:MM' or a list of them")
+
+        parsed[DAYS.index(day)] = [parsePeriod(period) for period in ([periods] if isinstance(periods, str) else periods)]
+
+    return parsed
+
+# Parse the "location" of a canteen: [latitude, longitude].
+def parseLocation(location):
+    if location is None:
+        return None
+
+    try:
+        latitude, longitude = (float(coordinate) for coordinate in location)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid location '{location}', expected [latitude, longitude]")
+
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f"Invalid location '{location}', out of range")
+
+    return latitude, longitude
+
+# Build the catalogue from its JSON form: canteen ID -> {"name": ..., "hours": {...}, "capacity": ..., "location": [...]}.
+# Raises ValueError if it is invalid, so a bad edit to the file never replaces a good catalogue.
+def parseCatalogue(data):
+    if not isinstance(data, dict) or not data:
+        raise ValueError("The canteen catalogue must be a non-empty JSON object")
+
+    catalogue = {}
+
+    for canteenID, details in data.items():
+        # The canteen ID is the callback data of its button, which Telegram limits to 64 bytes.
+        if not canteenID or "#" in canteenID or len(canteenID.encode()) > 64:
+            raise ValueError(f"Invalid canteen ID '{canteenID}'")
+
+        if not isinstance(details, dict):
+            raise ValueError(f"Canteen '{canteenID}' must be a JSON object")
+
+        if "name" not in details:
+            raise ValueError(f"Canteen '{canteenID}' has no name")
+
+        capacity = details.get("capacity")
+
+        try:
+            capacity = int(capacity) if capacity is not None else None
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid capacity '{capacity}' for canteen '{canteenID}'")
+
+        catalogue[canteenID] = Canteen(canteenID, details["name"], parseHours(details.get("hours")), capacity, parseLocation(details.get("location")))
+
+    return catalogue
+
+def readCatalogue(path):
+    with open(path) as catalogueFile:
+        return parseCatalogue(json.load(catalogueFile))
+
+# Make a catalogue current. Handlers running at the same time see either the old catalogue and keyboard or the new ones,
+# since nothing else runs on the event loop while both are replaced.
+def install(catalogue):
+    global canteens, geoIndex
+
+    canteens = catalogue
+    geoIndex = GeoIndex.GeoIndex({canteenID: canteen.location for canteenID, canteen in catalogue.items() if canteen.location is not None})
+    UserInterface.build({canteenID: canteen.name for canteenID, canteen in catalogue.items()})
+
+    logger.info("Canteen catalogue has %s canteens: %s", len(catalogue), ", ".join(catalogue))
+
+####################################### Helper Functions #######################################
+
+def get(canteenID):
+    return canteens.get(canteenID)
+
+# The canteen IDs, in the order they are shown.
+def ids():
+    return list(canteens)
+
+# The current time in the time zone of the opening hours.
+def now():
+    if time_zone is None:
+        return datetime.now()
+
+    from zoneinfo import ZoneInfo
+
+    return datetime.now(ZoneInfo(time_zone))
+
+def isOpen(canteenID):
+    canteen = canteens.get(canteenID)
+
+    return canteen is not None and canteen.isOpen(now())
+
+# The canteens within radius metres of a coordinate, as (distance in metres, Canteen), nearest first.
+def near(latitude, longitude, radius):
+    return [(distance, canteens[canteenID]) for distance, canteenID in geoIndex.near(latitude, longitude, radius)]
+
+# Load the catalogue file, or the default catalogue if there is none. Called once before the bot starts.
+def load():
+    global loadedStat
+
+    try:
+        loadedStat = os.stat(catalogue_path)
+    except FileNotFoundError:
+        logger.info("No canteen catalogue at '%s', using the default canteens", catalogue_path)
+        install(parseCatalogue(DEFAULT_CATALOGUE))
+        return
+
+    install(readCatalogue(catalogue_path))
+
+# Reload the catalogue file if it has changed since it was last loaded. An invalid file is logged and the current catalogue kept.
+async def reload(context):
+    global loadedStat
+
+    try:
+        stat = os.stat(catalogue_path)
+    except FileNotFoundError:
+        return
+
+    if loadedStat is not None and (stat.st_mtime_ns, stat.st_size) == (loadedStat.st_mtime_ns, loadedStat.st_size):
+        return
+
+    try:
+        catalogue = await BlockingIO.runInExecutor(readCatalogue, catalogue_path)
+    except (OSError, ValueError) as error:
+        logger.error("Not reloading the canteen catalogue from '%s': %s", catalogue_path, error)
+        return
+    finally:
+        # Don't retry the same broken file on every check.
+        loadedStat = stat
+
+    install(catalogue)
+
+# Check the catalogue file for changes every reload_interval seconds on the Application's job_queue.
+def startWatcher(application):
+    if reload_interval > 0:
+        application.job_queue.run_repeating(reload, interval = reload_interval, first = reload_interval)
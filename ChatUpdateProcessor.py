@@ -0,0 +1,58 @@
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import asyncio
+import logging
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+####################################### Update Processor #######################################
+
+# Processes updates from different chats concurrently, while updates from the same chat are processed one at a time,
+# in the order they arrived. This keeps the nested ConversationHandler state (e.g. requester_init / fulfiller_init)
+# of each user consistent, while one user's slow DynamoDB call no longer holds up everyone else.
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    # BaseUpdateProcessor.process_update takes one of its slots before calling do_process_update, so those slots bound the updates
+    # waiting for their chat as well as the ones running: max_waiting_updates more of them are allowed. The max_concurrent_updates
+    # slots that bound the updates running are taken in do_process_update, after the chat's lock, so a chat with many updates queued
+    # holds at most one of them, and a single busy chat can't keep the other chats waiting.
+    def __init__(self, max_concurrent_updates, max_waiting_updates = 1000):
+        super().__init__(max_concurrent_updates + max_waiting_updates)
+
+        self.runningSlots = asyncio.BoundedSemaphore(max_concurrent_updates)
+
+        # One lock per chat with updates in flight, and the number of updates holding or waiting for it.
+        self.chatLocks = {}
+        self.pendingUpdates = {}
+
+    async def do_process_update(self, update, coroutine):
+        # Updates that don't belong to a chat have no ordering to preserve.
+        if not isinstance(update, Update) or update.effective_chat is None:
+            async with self.runningSlots:
+                await coroutine
+            return
+
+        chat_id = update.effective_chat.id
+
+        self.pendingUpdates[chat_id] = self.pendingUpdates.get(chat_id, 0) + 1
+        lock = self.chatLocks.setdefault(chat_id, asyncio.Lock())
+
+        try:
+            # asyncio.Lock wakes up its waiters in FIFO order, so the chat's updates run in the order they arrived.
+            async with lock, self.runningSlots:
+                await coroutine
+        finally:
+            self.pendingUpdates[chat_id] -= 1
+
+            # Forget the lock once the chat has no more updates in flight.
+            if self.pendingUpdates[chat_id] == 0:
+                del self.pendingUpdates[chat_id]
+                del self.chatLocks[chat_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
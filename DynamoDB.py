@@ -1,29 +1,214 @@
-import boto3
-import configparser
+import asyncio
+import random
+import Settings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# boto3 takes a while to import and to set up a session, so nothing here touches it until the first DynamoDB call.
+# The session, resource and tables are created on first use (see getResource() and __getattr__ below) and then reused.
 
 ####################################### Parameters #######################################
 
-# Create config parser and read config file
-config = configparser.ConfigParser()
-config.read("config.ini")
+config = Settings.config
+
+# DynamoDB accepts at most 100 keys in a single BatchGetItem call.
+batch_get_limit = 100
+
+# Size of the pool of HTTP connections to DynamoDB, shared by every table.
+max_pool_connections = config.getint("dynamodb", "max_pool_connections", fallback = 50)
+
+# Maximum number of boto3 calls that may run at the same time (one worker thread each).
+# Defaults to the connection pool size, so no call waits on the pool after it has been given a thread.
+max_workers = config.getint("dynamodb", "max_workers", fallback = max_pool_connections)
+
+# Client settings for every DynamoDB call: timeouts in seconds, and the retry mode ("adaptive" also rate-limits
+# the client when DynamoDB throttles it). TCP keepalive keeps idle pooled connections from being dropped silently.
+client_settings = {
+    "max_pool_connections": max_pool_connections,
+    "connect_timeout": config.getfloat("dynamodb", "connect_timeout", fallback = 2),
+    "read_timeout": config.getfloat("dynamodb", "read_timeout", fallback = 5),
+    "retries": {
+        "mode": config.get("dynamodb", "retry_mode", fallback = "adaptive"),
+        "max_attempts": config.getint("dynamodb", "max_attempts", fallback = 5)
+    },
+    "tcp_keepalive": config.getboolean("dynamodb", "tcp_keepalive", fallback = True)
+}
+
+# Optional endpoint to use instead of AWS, e.g. http://localhost:8000 for DynamoDB Local.
+endpoint_url = config.get("dynamodb", "endpoint_url", fallback = None) or None
+
+########## Async Access Layer ##########
+
+# boto3 is blocking, so every call is handed to this bounded pool of worker threads instead of
+# running on the event loop. This way a slow DynamoDB round-trip only delays the update that made it.
+executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "dynamodb")
+
+# Run a blocking function in the executor and wait for its result without blocking the event loop.
+async def runInExecutor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+# Wrapper around a boto3 Table whose operations can be awaited from the handlers.
+# The keyword arguments are passed through to boto3 unchanged.
+class AsyncTable:
+    def __init__(self, syncTable, keyName):
+        # The underlying boto3 Table object, and the name of its partition key.
+        self.syncTable = syncTable
+        self.keyName = keyName
+
+        # Optional callable(oldImage, newImage) told about every write made through this wrapper.
+        # Used by the local stand-in for DynamoDB Streams (see RequestStream.LocalStreamSource).
+        self.changeListener = None
+
+    async def get_item(self, **kwargs):
+        return await runInExecutor(self.syncTable.get_item, **kwargs)
+
+    async def put_item(self, **kwargs):
+        return await self.write(self.syncTable.put_item, {self.keyName: kwargs["Item"][self.keyName]}, **kwargs)
+
+    async def update_item(self, **kwargs):
+        return await self.write(self.syncTable.update_item, kwargs["Key"], **kwargs)
+
+    async def delete_item(self, **kwargs):
+        return await self.write(self.syncTable.delete_item, kwargs["Key"], **kwargs)
+
+    # Run a write. If a change listener is set, the item is read before and after the write so the listener
+    # gets the same old and new images a DynamoDB stream record would carry.
+    async def write(self, func, key, **kwargs):
+        if self.changeListener is None:
+            return await runInExecutor(func, **kwargs)
+
+        oldImage = (await self.get_item(Key = key)).get("Item")
+        response = await runInExecutor(func, **kwargs)
+        newImage = (await self.get_item(Key = key)).get("Item")
+
+        self.changeListener(oldImage, newImage)
+
+        return response
+
+    async def query(self, **kwargs):
+        return await runInExecutor(self.syncTable.query, **kwargs)
+
+    async def scan(self, **kwargs):
+        return await runInExecutor(self.syncTable.scan, **kwargs)
+
+    # Query the table page by page, yielding items lazily and following LastEvaluatedKey until every page has been read,
+    # or until max_items items have been yielded. Pages are only fetched as they are consumed.
+    async def query_items(self, max_items = None, **kwargs):
+        yielded = 0
+
+        while True:
+            response = await self.query(**kwargs)
+
+            for item in response["Items"]:
+                if max_items is not None and yielded >= max_items:
+                    return
 
-# Load bot token
-bot_token = config["bot_keys"]["current_bot_token"]
+                yield item
+                yielded += 1
+
+            # No LastEvaluatedKey means this was the last page.
+            if "LastEvaluatedKey" not in response or (max_items is not None and yielded >= max_items):
+                return
+
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    # Get up to batch_get_limit items with one BatchGetItem call, retrying any keys DynamoDB leaves unprocessed with exponential backoff.
+    async def batch_get_chunk(self, keys, max_retries = 5):
+        items = []
+        pendingKeys = keys
+        attempt = 0
+
+        while pendingKeys:
+            response = await runInExecutor(getResource().batch_get_item, RequestItems = {self.syncTable.name: {"Keys": pendingKeys}})
+
+            items.extend(response["Responses"].get(self.syncTable.name, []))
+            pendingKeys = response.get("UnprocessedKeys", {}).get(self.syncTable.name, {}).get("Keys", [])
+
+            if pendingKeys:
+                attempt += 1
+
+                if attempt > max_retries:
+                    raise RuntimeError(f"BatchGetItem on '{self.syncTable.name}' left {len(pendingKeys)} keys unprocessed after {max_retries} retries")
+
+                # Back off before retrying the keys that were throttled.
+                await asyncio.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+
+        return items
+
+    # Get many items by primary key. Duplicate keys are only fetched once, and the keys are split into
+    # chunks of batch_get_limit that are fetched concurrently.
+    async def batch_get_items(self, keys):
+        # De-duplicate the keys while keeping their order.
+        uniqueKeys = list({tuple(sorted(key.items())): key for key in keys}.values())
+
+        chunks = [uniqueKeys[start:start + batch_get_limit] for start in range(0, len(uniqueKeys), batch_get_limit)]
+        results = await asyncio.gather(*(self.batch_get_chunk(chunk) for chunk in chunks))
+
+        return [item for items in results for item in items]
+
+# Apply several writes atomically with one TransactWriteItems call: either all of them succeed, or none do.
+# Each transact item is written like a resource-level call, e.g. {"Update": {"TableName": ..., "Key": {...}, ...}}, with plain Python values:
+# the resource's client converts the Key and ExpressionAttributeValues to the low-level format itself.
+async def transactWriteItems(transactItems):
+    return await runInExecutor(getResource().meta.client.transact_write_items, TransactItems = transactItems)
 
 ########## Initialising DB and Required Tables ##########
 
 # The name of our table in DynamoDB
 tableName = "Dabao4Me_Requests"
 
-# Create resource object to access DynamoDB
-db = boto3.resource('dynamodb', 
-                    region_name = config["dynamodb"]["region_name"], 
-                    aws_access_key_id = config["dynamodb"]["aws_access_key_id"],
-                    aws_secret_access_key = config["dynamodb"]["aws_secret_access_key"])
+# The shared session, resource and client settings, created by the first call that needs them.
+session = None
+resource = None
+client_config = None
+
+# One session for every DynamoDB resource and client, so they share the credentials and settings above.
+def getSession():
+    global session, client_config
+
+    if session is None:
+        import boto3
+        from botocore.config import Config
+
+        client_config = Config(**client_settings)
+        session = boto3.session.Session(region_name = config["dynamodb"]["region_name"],
+                                        aws_access_key_id = config["dynamodb"]["aws_access_key_id"],
+                                        aws_secret_access_key = config["dynamodb"]["aws_secret_access_key"])
+
+    return session
+
+# Create a client from the shared session, with the shared settings.
+def createClient(serviceName):
+    return getSession().client(serviceName, endpoint_url = endpoint_url, config = client_config)
+
+# The resource object to access DynamoDB. Its client (getResource().meta.client) and connection pool are used by every table.
+def getResource():
+    global resource
+
+    if resource is None:
+        resource = getSession().resource('dynamodb', endpoint_url = endpoint_url, config = client_config)
+
+    return resource
+
+# The table objects, created the first time DynamoDB.table or DynamoDB.userRatingsTable is used.
+tableKeys = {
+    # Create table object with specified table name
+    "table": (tableName, "RequestID"),
+
+    # The table tracking user ratings
+    "userRatingsTable": ("Dabao4Me_User_Ratings", "user_chat_id")
+}
+
+def __getattr__(name):
+    if name == "db":
+        return getResource()
 
+    if name in tableKeys:
+        syncTableName, keyName = tableKeys[name]
+        globals()[name] = AsyncTable(getResource().Table(syncTableName), keyName)
 
-# Create table object with specified table name
-table = db.Table(tableName)
+        return globals()[name]
 
-# The table tracking user ratings
-userRatingsTable = db.Table("Dabao4Me_User_Ratings")
\ No newline at end of file
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
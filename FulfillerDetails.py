@@ -1,115 +1,123 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler
 
+import asyncio
 import logging
+import Settings
 import MainMenu
-import DynamoDB
-import boto3
-from boto3.dynamodb.conditions import Key
-import configparser
-from datetime import datetime
+import UserRatings
+import OpenRequests
+import Storage
+import UserInterface
+import Canteens
 
 ####################################### Parameters #######################################
 
-# Create config parser and read config file
-config = configparser.ConfigParser()
-config.read("config.ini")
-
-# Load bot token
-bot_token = config["bot_keys"]["current_bot_token"]
-
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Create table object
-table = DynamoDB.table
+# Number of requests shown on each page when browsing the requests at a canteen.
+page_size = 5
+
+# Metres around a fulfiller's location within which the requests at open canteens are shown, when they send their location.
+nearby_radius = Settings.config.getfloat("nearby", "radius", fallback = 500)
 
 ####################################### Helper Functions #######################################
 
 # Get and format requests from DynamoDB
-def processRequests(requests):
-    formatted_output = ""
-    requestCounter = 1
-
-    for request in requests:
-        formattedCanteen = MainMenu.canteenDict[request["canteen"]]
-        requestID = request["RequestID"]
-        # The first 16 characters of the requestID is the unix timestamp of the request.
-        # Only use 10 because we only care about accuracy to the second.
-        unixTimestamp = float(requestID[:10])
-        username = request["requester_user_name"]
-        chat_id = request["requester_chat_id"]
-        food = request["food"]
-        tip_amount = request["tip_amount"]
-
-        formattedTimestamp = datetime.fromtimestamp(unixTimestamp).strftime("%d %b %y %I:%M %p")
+async def processRequests(requests):
+    # Get the ratings of all the requesters in one go instead of one get_item per request.
+    ratings = await UserRatings.getUserRatings({request["requester_chat_id"] for request in requests})
+
+    formattedRequests = []
 
+    for requestCounter, request in enumerate(requests, start=1):
         # Get rating of requester
-        response = DynamoDB.userRatingsTable.get_item(
-            Key = {"user_chat_id": chat_id}
-        )
+        ratingPercent, total = ratings[str(request["requester_chat_id"])]
+
+        # The time the request was made is part of its RequestID.
+        formattedRequests.append(UserInterface.LISTING_TEMPLATE.format(
+            number = requestCounter,
+            requested_on = UserInterface.formatTimestamp(Storage.createdAt(request["RequestID"])),
+            username = request["requester_user_name"],
+            ratingPercent = ratingPercent,
+            total = total,
+            canteen = UserInterface.canteenName(request["canteen"]),
+            food = request["food"],
+            tip_amount = request["tip_amount"]
+        ))
+
+    return "".join(formattedRequests)
+
+# Get one page of available requests at the specified canteen, starting after startKey (the first page if None).
+# Returns the requests on the page and the key to start the next page from, or None if this is the last page.
+# The page is served from the in-memory index of open requests, and only read from the request store if the index can't serve it.
+async def getRequestPage(selected_canteen, startKey = None, limit = page_size):
+    page = await OpenRequests.getCanteenPage(selected_canteen, startKey, limit)
+
+    if page is not None:
+        return page
+
+    return await Storage.requestStore.pageByCanteen(selected_canteen, startKey, limit)
+
+# Get one page of the available requests at several canteens together, oldest first, starting after startKey.
+# Every canteen continues from the same point in time, so the key of the last request listed is the key of the next page.
+async def getListingPage(canteens, startKey = None, limit = page_size):
+    if len(canteens) == 1:
+        return await getRequestPage(canteens[0], startKey, limit)
+
+    # The canteens are read concurrently, each from the in-memory index if it can serve them.
+    pages = await asyncio.gather(*(getRequestPage(canteen, dict(startKey, canteen = canteen) if startKey is not None else None, limit) for canteen in canteens))
+    requests = sorted((request for canteenRequests, nextKey in pages for request in canteenRequests), key = Storage.sortKey)
+
+    if len(requests) > limit or any(nextKey is not None for canteenRequests, nextKey in pages):
+        requests = requests[:limit]
+        return requests, Storage.pageKey(requests[-1])
+
+    return requests, None
 
-        logger.info("User Ratings Table get_item response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
+# One button to fulfil each of the listed requests.
+def fulfilButtons(requests):
+    return [InlineKeyboardButton(f"Fulfil {index}", callback_data=f"claim#{request['RequestID']}") for index, request in enumerate(requests, start=1)]
 
-        # print(response["Item"])
-        good_received = 0
-        bad_received = 0
+# Start browsing the requests at the given canteens from the first page.
+# The start key of every page visited is kept so the fulfiller can go back with "Prev".
+def startBrowsing(context, canteens, place):
+    context.user_data[MainMenu.BROWSE_PAGE] = {"canteens": canteens, "place": place, "cursors": [None], "nextKey": None}
 
-        try:
-            good_received = int(response["Item"]["good_received"])
-        except KeyError:
-            pass
+# Fetch and render the page of requests the fulfiller is currently browsing.
+# Returns the text and inline keyboard of the page, or None if there are no requests on it.
+async def renderRequestPage(context):
+    browsePage = context.user_data[MainMenu.BROWSE_PAGE]
 
-        try:
-            bad_received = int(response["Item"]["bad_received"])
-        except KeyError:
-            pass
+    requests, nextKey = await getListingPage(browsePage["canteens"], browsePage["cursors"][-1])
+    browsePage["nextKey"] = nextKey
 
-        total = int(good_received) + int(bad_received)
-        
-        if (total != 0):
-            ratingPercent = float(good_received) / float(total)
-            ratingPercent = int(ratingPercent * 100)
-        else:
-            ratingPercent = 0
+    # Remember the page the fulfiller was shown, so "/fulfil N" refers to the N-th request on it.
+    # Pages are already ordered oldest first, by the index and the request store alike.
+    context.user_data[MainMenu.REQUESTS_LISTED] = requests
 
+    if len(requests) == 0:
+        return None
 
-        formatted_output += f"""{requestCounter}) Requested on: {formattedTimestamp}
-Username / Name: {username} | {ratingPercent}% \U0001F44D out of {total} ratings.
-Canteen: {formattedCanteen}
-Food: {food}
-Tip Amount: ${tip_amount}
+    pageNumber = len(browsePage["cursors"])
 
-"""
-        requestCounter += 1
-    
-    return formatted_output
+    text = f"Available requests {browsePage['place']} (page {pageNumber}): \n\n" + await processRequests(requests)
 
-# Filter requests from dynamoDB by the specified canteen
-def filterRequests(selected_canteen):
-    response = table.query(
-        IndexName = "canteen-request_status-index",
-        KeyConditionExpression = Key("canteen").eq(selected_canteen) & Key("request_status").eq("Available"))
+    # One button to fulfil each request on the page, followed by the page navigation buttons.
+    inlineRequests = [fulfilButtons(requests)]
 
-    logger.info("DynamoDB query response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
+    navigation = []
 
-    requests = response["Items"]
-    sorted_requests = sorted(requests, key=lambda x: x["RequestID"][:16])
+    if pageNumber > 1:
+        navigation.append(UserInterface.prevPageButton)
 
-    return sorted_requests
+    if nextKey is not None:
+        navigation.append(UserInterface.nextPageButton)
 
-# Get item from table (not index)
-def get_item(primaryKey):
-    response = table.get_item(
-        Key = {
-            "RequestID": primaryKey
-        }
-    )
+    if navigation:
+        inlineRequests.append(navigation)
 
-    return response
+    return text, InlineKeyboardMarkup(inlineRequests)
 
 ####################################### Main Functions #######################################
 
@@ -129,20 +137,10 @@ async def promptCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     await update.callback_query.message.reply_text(text=f"You have chosen to be a {roleSelected}.")
 
-    # Define the canteens using a 2D array.
-    inlineCanteen = [
-        [InlineKeyboardButton("The Deck", callback_data="deck")],
-        [InlineKeyboardButton("Frontier", callback_data="frontier")],
-        [InlineKeyboardButton("Fine Foods", callback_data="fine_foods")],
-        [InlineKeyboardButton("Flavours @ Utown", callback_data="flavours")],
-        [InlineKeyboardButton("TechnoEdge", callback_data="technoedge")],
-        [InlineKeyboardButton("PGPR", callback_data="pgpr")],
-    ]
+    await update.callback_query.message.reply_text("Now, please select from the list of canteens.", reply_markup=UserInterface.canteenKeyboard)
 
-    # Transform the 2D array into an actual inline keyboard that can be interpreted by Telegram.
-    inlineCanteenTG = InlineKeyboardMarkup(inlineCanteen)
-
-    await update.callback_query.message.reply_text("Now, please select from the list of canteens.", reply_markup=inlineCanteenTG)
+    if len(Canteens.geoIndex) > 0:
+        await update.callback_query.message.reply_text(f"Or send your location to see the requests within {nearby_radius:.0f} m of you.")
 
     return MainMenu.CANTEEN
 
@@ -151,7 +149,7 @@ async def selectCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     selectedCanteen = update.callback_query.data
 
     # Let user know their selected canteen.
-    await update.callback_query.message.reply_text(text=f"You have chosen {MainMenu.canteenDict[selectedCanteen]} as your canteen.")
+    await update.callback_query.message.reply_text(text=f"You have chosen {UserInterface.canteenName(selectedCanteen)} as your canteen.")
 
     # Store the input of the fulfiller's canteen into user_data
     context.user_data[MainMenu.CANTEEN] = selectedCanteen
@@ -162,18 +160,99 @@ async def selectCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Store information about their canteen
     logger.info("Fulfiller '%s' (chat_id: '%s') selected '%s' as their canteen.", update.effective_user.name, update.effective_user.id, update.callback_query.data)
 
-    # Show list of available requests, filtered by the selected canteen.
-    
-    # 2. Using DyanmoDB
-    sortedRequests = filterRequests(selectedCanteen)
+    # Nobody is ordering from a closed canteen, so there is nothing to look up.
+    canteen = Canteens.get(selectedCanteen)
+
+    if canteen is None:
+        await update.callback_query.message.reply_text(f"{UserInterface.canteenName(selectedCanteen)} is no longer available. Use /start to fulfill an order again.")
+        return ConversationHandler.END
+
+    if not canteen.isOpen(Canteens.now()):
+        await update.callback_query.message.reply_text(f"{canteen.name} is closed now (today: {canteen.hoursOn(Canteens.now())}). Use /start to fulfill an order again.")
+        return ConversationHandler.END
+
+    # Show the first page of available requests, filtered by the selected canteen.
+    startBrowsing(context, [selectedCanteen], f"at {canteen.name}")
 
-    if len(sortedRequests) == 0:
-        await update.callback_query.message.reply_text(f"There are no requests at {MainMenu.canteenDict[selectedCanteen]}. Use /start to fulfill an order again.")
+    page = await renderRequestPage(context)
+
+    if page is None:
+        await update.callback_query.message.reply_text(f"There are no requests at {UserInterface.canteenName(selectedCanteen)}. Use /start to fulfill an order again.")
         return ConversationHandler.END
-    else:
-        await update.callback_query.message.reply_text("Great! Here's the list of available requests for the canteen you're currently at: \n\n" +
-                                                   processRequests(filterRequests(selectedCanteen)))
 
-    await update.callback_query.message.reply_text("To fulfill a request, use the /fulfil command, followed by the request number. e.g. \"/fulfil 1\"")
+    text, inlineRequestsTG = page
+
+    await update.callback_query.message.reply_text(text, reply_markup=inlineRequestsTG)
+
+    await update.callback_query.message.reply_text("To fulfill a request, press its button, or use the /fulfil command followed by the request number. e.g. \"/fulfil 1\"")
+
+    return MainMenu.FULFIL_REQUEST
+
+# When the fulfiller sends their location instead of selecting a canteen (or while browsing, to search again).
+# Lists the requests at the open canteens within nearby_radius of them, oldest first, a page at a time like a single canteen.
+async def nearbyRequests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    location = update.message.location
+    now = Canteens.now()
+
+    nearby = [(distance, canteen) for distance, canteen in Canteens.near(location.latitude, location.longitude, nearby_radius) if canteen.isOpen(now)]
+
+    logger.info("Fulfiller '%s' (chat_id: '%s') searched near them and found %s open canteens.", update.effective_user.name, update.effective_user.id, len(nearby))
+
+    if not nearby:
+        await update.message.reply_text(f"There are no open canteens within {nearby_radius:.0f} m of you. Please select a canteen from the list instead.")
+        return MainMenu.CANTEEN
+
+    canteensNearby = ", ".join(f"{canteen.name} {distance:.0f} m" for distance, canteen in nearby)
+    startBrowsing(context, [canteen.canteenID for distance, canteen in nearby], f"near you ({canteensNearby})")
+
+    page = await renderRequestPage(context)
+
+    if page is None:
+        await update.message.reply_text(f"There are no requests within {nearby_radius:.0f} m of you. Please select a canteen from the list instead.")
+        return MainMenu.CANTEEN
+
+    text, inlineRequestsTG = page
+
+    await update.message.reply_text(text, reply_markup=inlineRequestsTG)
+
+    await update.message.reply_text("To fulfill a request, press its button, or use the /fulfil command followed by the request number. e.g. \"/fulfil 1\"")
+
+    return MainMenu.FULFIL_REQUEST
+
+# When the fulfiller presses "Next" or "Prev" while browsing the requests at a canteen (or near them).
+async def browseRequests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Once the user clicks a button, we need to "answer" the CallbackQuery.
+    await update.callback_query.answer()
+
+    browsePage = context.user_data[MainMenu.BROWSE_PAGE]
+
+    # Pages saved before nearby listings could be browsed are always of the canteen the fulfiller selected.
+    # (Nearby listings have no selected canteen, so it is only read for those.)
+    if "canteens" not in browsePage:
+        browsePage["canteens"] = [context.user_data[MainMenu.CANTEEN]]
+        browsePage["place"] = f"at {UserInterface.canteenName(context.user_data[MainMenu.CANTEEN])}"
+
+    if update.callback_query.data == "page#next" and browsePage["nextKey"] is not None:
+        browsePage["cursors"].append(browsePage["nextKey"])
+    elif update.callback_query.data == "page#prev" and len(browsePage["cursors"]) > 1:
+        browsePage["cursors"].pop()
+
+    logger.info("Fulfiller '%s' (chat_id: '%s') is browsing page %s of requests at '%s'.", update.effective_user.name, update.effective_user.id,
+                len(browsePage["cursors"]), ", ".join(browsePage["canteens"]))
+
+    page = await renderRequestPage(context)
+
+    if page is None:
+        # The requests on this page have all been taken since it was shown, so go back to the first page.
+        browsePage["cursors"] = [None]
+        page = await renderRequestPage(context)
+
+    if page is None:
+        await update.callback_query.edit_message_text(f"There are no more requests {browsePage['place']}. Use /start to fulfill an order again.")
+        return ConversationHandler.END
+
+    text, inlineRequestsTG = page
+
+    await update.callback_query.edit_message_text(text, reply_markup=inlineRequestsTG)
 
     return MainMenu.FULFIL_REQUEST
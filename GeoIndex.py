@@ -0,0 +1,110 @@
+# Geohash-bucketed index of points (e.g. canteens), answering "which points are within X metres of here".
+
+import bisect
+import math
+
+####################################### Parameters #######################################
+
+# The geohash alphabet (base32 without a, i, l and o).
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precision the points are stored at. A cell of 8 characters is about 38 m x 19 m.
+max_precision = 8
+
+EARTH_RADIUS = 6371000
+METRES_PER_DEGREE = 111320
+
+####################################### Geohash #######################################
+
+# Encode a coordinate as a geohash of the given number of characters. Points in the same cell share its prefix.
+def encode(latitude, longitude, precision = max_precision):
+    latRange = [-90.0, 90.0]
+    lonRange = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    value = 0
+    useLongitude = True
+
+    while len(geohash) < precision:
+        coordinate, bounds = (longitude, lonRange) if useLongitude else (latitude, latRange)
+        middle = (bounds[0] + bounds[1]) / 2
+
+        if coordinate >= middle:
+            value = value * 2 + 1
+            bounds[0] = middle
+        else:
+            value = value * 2
+            bounds[1] = middle
+
+        useLongitude = not useLongitude
+        bits += 1
+
+        if bits == 5:
+            geohash.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+
+    return "".join(geohash)
+
+# The height and width, in degrees, of a geohash cell with the given number of characters.
+def cellSize(precision):
+    lonBits = math.ceil(precision * 5 / 2)
+    latBits = precision * 5 // 2
+
+    return 180 / 2 ** latBits, 360 / 2 ** lonBits
+
+# Great-circle distance in metres between two coordinates.
+def distance(latitude1, longitude1, latitude2, longitude2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+####################################### Index #######################################
+
+# Points sorted by their geohash, so the points in a cell are a bisect and a slice.
+# A radius query looks at the cell around the centre at the finest precision whose cells are at least radius wide,
+# plus its 8 neighbours, and only measures the distance to the points in those 9 cells.
+class GeoIndex:
+    def __init__(self, points):
+        # key -> (latitude, longitude)
+        self.points = dict(points)
+
+        # Sorted list of (geohash, key).
+        self.cells = sorted((encode(latitude, longitude), key) for key, (latitude, longitude) in self.points.items())
+
+    def __len__(self):
+        return len(self.points)
+
+    # The finest precision whose cells are at least radius metres high and wide at this latitude.
+    def queryPrecision(self, latitude, radius):
+        for precision in range(max_precision, 0, -1):
+            latSize, lonSize = cellSize(precision)
+
+            if min(latSize * METRES_PER_DEGREE, lonSize * METRES_PER_DEGREE * math.cos(math.radians(latitude))) >= radius:
+                return precision
+
+        return 0
+
+    def inCell(self, prefix):
+        start = bisect.bisect_left(self.cells, (prefix,))
+        end = bisect.bisect_left(self.cells, (prefix + "~",))
+
+        return [key for _, key in self.cells[start:end]]
+
+    # The keys of the points within radius metres of the coordinate, as (distance, key), nearest first.
+    def near(self, latitude, longitude, radius):
+        precision = self.queryPrecision(latitude, radius)
+
+        # The radius is wider than the coarsest cells, so every point is a candidate.
+        if precision == 0:
+            candidates = set(self.points)
+        else:
+            latSize, lonSize = cellSize(precision)
+            prefixes = {encode(max(-90.0, min(90.0, latitude + latStep * latSize)), (longitude + lonStep * lonSize + 180) % 360 - 180, precision)
+                        for latStep in (-1, 0, 1) for lonStep in (-1, 0, 1)}
+            candidates = {key for prefix in prefixes for key in self.inCell(prefix)}
+
+        matches = [(distance(latitude, longitude, *self.points[key]), key) for key in candidates]
+
+        return sorted(match for match in matches if match[0] <= radius)
@@ -4,64 +4,44 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler, ApplicationHandlerStop
 
 import logging
+import Settings
 import RequesterDetails
 import FulfillerDetails
 import MatchingUsers
 import ModifyOrder
-import DynamoDB
-import configparser
 import UserRatings
+import ChatUpdateProcessor
+import Persistence
+import RequestStream
+import SendQueue
+import OpenRequests
+import RequestExpiry
+import UserInterface
+import Canteens
 
 ####################################### Parameters #######################################
 
-# Create config parser and read config file
-config = configparser.ConfigParser()
-config.read("config.ini")
+# How the bot receives updates from Telegram: "polling" (default) or "webhook".
+server_mode = Settings.config.get("server", "mode", fallback = "polling")
 
-# Load bot token
-bot_token = config["bot_keys"]["current_bot_token"]
+# Maximum number of updates processed at the same time. Updates from the same chat are always processed in order.
+concurrent_updates = Settings.config.getint("server", "concurrent_updates", fallback = 32)
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-RESTART, SELECT_ORDER_TO_MODIFY, ROLE, CANTEEN, FOOD, OFFER_PRICE, AWAIT_FULFILLER, REQUEST_MADE, FULFIL_REQUEST, FULFILLER_IN_CONVO, REQUEST_CHOSEN, REQUESTER_IN_CONVO, DELETE_ORDER, EDIT_CANTEEN, EDIT_CANTEEN_PROMPT, EDIT_FOOD, EDIT_TIP, EDIT_ORDER, REQUESTER_CONFIRM, RATE_USER = range(20)
+RESTART, SELECT_ORDER_TO_MODIFY, ROLE, CANTEEN, FOOD, OFFER_PRICE, AWAIT_FULFILLER, REQUEST_MADE, FULFIL_REQUEST, FULFILLER_IN_CONVO, REQUEST_CHOSEN, REQUESTER_IN_CONVO, DELETE_ORDER, EDIT_CANTEEN, EDIT_CANTEEN_PROMPT, EDIT_FOOD, EDIT_TIP, EDIT_ORDER, REQUESTER_CONFIRM, RATE_USER, REQUESTS_LISTED, BROWSE_PAGE = range(22)
 
-available_requests = []
-
-canteenDict = {
-    "deck": "The Deck",
-    "frontier": "Frontier",
-    "fine_foods": "Fine Foods",
-    "flavours": "Flavours @ Utown",
-    "technoedge": "TechnoEdge",
-    "pgpr": "PGPR"
-}
-
-# Create table object
-table = DynamoDB.table
 
 ####################################### Main Functions #######################################
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Define the menu using a 2D array.
-    inlineMenu = [
-        [InlineKeyboardButton("Request an order", callback_data="requester")],
-        [InlineKeyboardButton("Fulfil an order", callback_data="fulfiller")],
-    ]
-
-    # Transform the 2D array into an actual inline keyboard that can be interpreted by Telegram.
-    inlineMenuTG = InlineKeyboardMarkup(inlineMenu)
-
-    await update.message.reply_text("Welcome to Dabao4Me! What would you like to do today?:", reply_markup=inlineMenuTG)
+    await update.message.reply_text("Welcome to Dabao4Me! What would you like to do today?:", reply_markup=UserInterface.roleKeyboard)
 
     return ROLE
 
 
 async def unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="Unknown command. Send /start to begin using the bot.")
+    await SendQueue.sendMessage(context, SendQueue.REPLY, chat_id=update.effective_chat.id, text="Unknown command. Send /start to begin using the bot.")
 
     # Store information about their action.
     user = update.message.from_user
@@ -72,7 +52,7 @@ async def unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 # Method to cancel current transaction
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="Current operation cancelled.")
+    await SendQueue.sendMessage(context, SendQueue.REPLY, chat_id=update.effective_chat.id, text="Current operation cancelled.")
 
     # Store information about their action.
     user = update.message.from_user
@@ -83,7 +63,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 # If user tries to cancel outside of a transaction, send a slightly more helpful response
 async def invalidCancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="There is no ongoing operation to cancel.")
+    await SendQueue.sendMessage(context, SendQueue.REPLY, chat_id=update.effective_chat.id, text="There is no ongoing operation to cancel.")
 
     # Store information about their action.
     user = update.message.from_user
@@ -100,14 +80,53 @@ async def ratings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 ############################## Main Program Entry Point ##############################
 
+# Start the outbound queue and load the open requests before the first update is processed.
+async def postInit(application):
+    await SendQueue.start(application)
+    await OpenRequests.warm(Canteens.ids())
+
+# Write what is still buffered once the Application has stopped.
+async def postStop(application):
+    await UserRatings.stopAggregator(application)
+    await SendQueue.stop(application)
+
 def main() -> None:
+    # Load the canteens and build their keyboard.
+    Canteens.load()
+
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(bot_token).build()
+    # Updates from different users are processed concurrently, but each chat's updates are processed in order.
+    applicationBuilder = Application.builder().token(Settings.bot_token).concurrent_updates(ChatUpdateProcessor.PerChatUpdateProcessor(concurrent_updates))
+
+    # Messages to other users go through a rate-limited outbound queue, which runs while the Application does.
+    applicationBuilder = applicationBuilder.post_init(postInit).post_stop(postStop)
+
+    # Keep user_data and conversation states across restarts, if a persistence backend is configured.
+    persistence = Persistence.createPersistence(Settings.config)
+    persistent = persistence is not None
+
+    if persistent:
+        applicationBuilder = applicationBuilder.persistence(persistence)
+
+    application = applicationBuilder.build()
+
+    # Send request status notifications from the change feed, if one is configured.
+    RequestStream.startConsumer(application)
+
+    # Coalesce rating count writes, if write-behind is configured.
+    UserRatings.startAggregator(application)
+
+    # Expire the open requests nobody claims, and archive the finished ones.
+    RequestExpiry.startSweeper(application)
+
+    # Pick up changes to the canteen catalogue without a restart.
+    Canteens.startWatcher(application)
 
     ############################## Other Handlers ##############################
 
     modifyRequest_handler = ConversationHandler(
         name = "modifyRequest_handler",
+        persistent = persistent,
             entry_points = [
                 CallbackQueryHandler(RequesterDetails.editCanteenPrompt, pattern = "editCanteen"),
                 CallbackQueryHandler(RequesterDetails.editFoodPrompt, pattern = "editFood"),
@@ -130,6 +149,7 @@ def main() -> None:
 
     requester_in_conv = ConversationHandler(
         name = "requester_in_conv",
+        persistent = persistent,
             # CallbackQueryHandler for user ratings is for edge case:
             # When requester initiates the "/complete" command as their first message,
             # and no longer sends any other messages up till the order is marked as confirmed.
@@ -149,20 +169,23 @@ def main() -> None:
 
     requester_init = ConversationHandler(
         name = "requester_init",
+        persistent = persistent,
         entry_points = [CallbackQueryHandler(RequesterDetails.promptCanteen, pattern = "requester")],
         states  = {
             CANTEEN: [CallbackQueryHandler(RequesterDetails.selectCanteen)],
             FOOD: [MessageHandler(filters.TEXT & ~filters.COMMAND, RequesterDetails.requesterFood)],
             OFFER_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, RequesterDetails.requesterPrice)],
+            # Once a fulfiller claims the request, the requester's next update is handled by the second handler given to
+            # whileAwaitingFulfiller, which moves their conversation on (e.g. their next message is relayed to the fulfiller).
             AWAIT_FULFILLER: [
-                CommandHandler("end", MatchingUsers.requesterEndConv),
-                CommandHandler("cancel", MatchingUsers.requesterCancelSearch),
-                CommandHandler("edit", MatchingUsers.promptEditRequest),
+                CommandHandler("end", MatchingUsers.whileAwaitingFulfiller(MatchingUsers.requesterEndConv, MatchingUsers.requesterEndConv)),
+                CommandHandler("cancel", MatchingUsers.whileAwaitingFulfiller(MatchingUsers.requesterCancelSearch, MatchingUsers.requestTaken)),
+                CommandHandler("edit", MatchingUsers.whileAwaitingFulfiller(MatchingUsers.promptEditRequest, MatchingUsers.requestTaken)),
                 # The requester can choose to immediately use the "/complete" command upon matching with the fulfiller.
                 # In this case, it will check if fulfiller already used the command before them. If so, return to RATE_USER below.
                 # Otherwise, return to REQUESTER_IN_CONVO.
-                CommandHandler("complete", MatchingUsers.requesterComplete),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, MatchingUsers.awaitFulfiller)
+                CommandHandler("complete", MatchingUsers.whileAwaitingFulfiller(MatchingUsers.requesterComplete, MatchingUsers.requesterComplete)),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, MatchingUsers.whileAwaitingFulfiller(MatchingUsers.awaitFulfiller, MatchingUsers.forwardRequesterMsg))
             ],
             REQUESTER_IN_CONVO: [requester_in_conv],
             EDIT_ORDER: [modifyRequest_handler],
@@ -179,6 +202,7 @@ def main() -> None:
     ############################## Fulfiller Handlers ##############################
     fulfiller_in_conv = ConversationHandler(
         name = "fulfiller_in_conv",
+        persistent = persistent,
             entry_points = [CommandHandler("complete", MatchingUsers.fulfillerComplete),
                             MessageHandler(filters.TEXT & ~filters.COMMAND, MatchingUsers.forwardFulfillerMsg)],
             states = {
@@ -193,10 +217,17 @@ def main() -> None:
 
     fulfiller_init = ConversationHandler(
         name = "fulfiller_init",
+        persistent = persistent,
             entry_points = [CallbackQueryHandler(FulfillerDetails.promptCanteen , pattern = "fulfiller")],
             states = {
-                CANTEEN: [CallbackQueryHandler(FulfillerDetails.selectCanteen)],
-                FULFIL_REQUEST: [CommandHandler("fulfil", MatchingUsers.fulfilRequest)],
+                # A location can be sent instead of selecting a canteen. Updates to a live location (edited messages) are ignored.
+                CANTEEN: [CallbackQueryHandler(FulfillerDetails.selectCanteen), MessageHandler(filters.LOCATION & filters.UpdateType.MESSAGE, FulfillerDetails.nearbyRequests)],
+                FULFIL_REQUEST: [
+                    MessageHandler(filters.LOCATION & filters.UpdateType.MESSAGE, FulfillerDetails.nearbyRequests),
+                    CommandHandler("fulfil", MatchingUsers.fulfilRequest),
+                    CallbackQueryHandler(FulfillerDetails.browseRequests, pattern = "^page#"),
+                    CallbackQueryHandler(MatchingUsers.fulfilRequestButton, pattern = "^claim#")
+                ],
                 FULFILLER_IN_CONVO: [fulfiller_in_conv],
             },
             fallbacks = [CommandHandler("cancel", cancel)],
@@ -214,6 +245,7 @@ def main() -> None:
 
     conv_handler = ConversationHandler(
         name = "conv_handler",
+        persistent = persistent,
         entry_points=[CommandHandler("start", start)],
         states = {
             RESTART: [CommandHandler("start", start)],
@@ -231,7 +263,18 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.TEXT, unknown))
 
     # Run the bot until the user presses Ctrl-C
-    application.run_polling()
+    if server_mode == "webhook":
+        # Serve updates over HTTP. Telegram sends the secret token in the X-Telegram-Bot-Api-Secret-Token header
+        # of every request, and requests without it are rejected.
+        application.run_webhook(
+            listen = Settings.config.get("server", "listen", fallback = "0.0.0.0"),
+            port = Settings.config.getint("server", "port", fallback = 8443),
+            url_path = Settings.config.get("server", "url_path", fallback = "telegram"),
+            secret_token = Settings.config["server"]["secret_token"],
+            webhook_url = Settings.config["server"]["webhook_url"]
+        )
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
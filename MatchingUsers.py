@@ -3,133 +3,271 @@ from telegram.ext import Application, CallbackQueryHandler, CommandHandler, Cont
 from datetime import datetime
 from decimal import Decimal
 from time import sleep
+from collections import OrderedDict
 
 import logging
 import MainMenu
-import configparser
 import FulfillerDetails
-import DynamoDB
 import re
 import RequesterDetails
 import UserRatings
+import RequestStream
+import OpenRequests
+import Storage
+import SendQueue
+import UserInterface
 
 ####################################### Parameters #######################################
 
-# Create config parser and read config file
-config = configparser.ConfigParser()
-config.read("config.ini")
-
-# Load bot token
-bot_token = config["bot_keys"]["current_bot_token"]
-
 # Define ConversationHandler.END in another variable for clarity.
 ENDConv = ConversationHandler.END
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s | %(name)s | %(levelname)s | %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 ENDRequesterConv = ConversationHandler.END
 ENDFulfillerConv = ConversationHandler.END
 
+# Registry of matched requests (RequestID -> request), so relaying chat messages is a dictionary lookup instead of a DynamoDB read.
+# Kept up to date by the handlers that claim, end, complete or cancel a request. DynamoDB is only read on a miss (e.g. after a restart).
+activePairings = OrderedDict()
+
+# The oldest pairings are dropped once the registry holds this many requests.
+max_active_pairings = 10000
+
 ####################################### Helper Functions #######################################
 
+# Store (or refresh) a matched request in the pairing registry.
+def savePairing(request):
+    activePairings[request["RequestID"]] = dict(request)
+    activePairings.move_to_end(request["RequestID"])
 
-####################################### Main Functions #######################################
-async def awaitFulfiller(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Query the DB for the request made by the requester.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
+    while len(activePairings) > max_active_pairings:
+        activePairings.popitem(last = False)
 
-    # Check the status of the chat (i.e. finding fulfiller, in-convo, or cancelled). If fulfiller not found, return back to awaitFulfiller method.
-    if (response["Item"]["request_status"] == "Available"):
-        
-        await update.message.reply_text("We are still trying to find a fulfiller. Please wait, or use /cancel to quit and remove your current request.")
+# Update the status of a request in the pairing registry, if it is there.
+def setPairingStatus(RequestID, status):
+    if RequestID in activePairings:
+        activePairings[RequestID]["request_status"] = status
 
-        return MainMenu.AWAIT_FULFILLER
-    elif (response["Item"]["request_status"] == "In Progress"):
-        # Get the message the requester is trying to send to the fulfiller
-        requesterMsg = update.message.text
+def dropPairing(RequestID):
+    activePairings.pop(RequestID, None)
 
-        # Get the request the requester has put out and update user_data
-        request = response["Item"]
-        context.user_data[MainMenu.REQUEST_MADE] = request
+# Get a matched request from the pairing registry, falling back to DynamoDB on a miss.
+# Returns None if the request no longer exists.
+async def getPairing(RequestID):
+    if RequestID in activePairings:
+        return activePairings[RequestID]
 
-        # Store information about the event.
-        logger.info("Requester '%s' (chat_id: '%s') sent message to fulfiller '%s' (chat_id: '%s'): %s", request["requester_user_name"], request["requester_chat_id"],
-                    request["fulfiller_user_name"], request["fulfiller_chat_id"], requesterMsg)
+    # Query the DB for the request.
+    request = await Storage.requestStore.get(RequestID)
 
-        in_chat_reminder = f"<b><u>Requester '{update.effective_user.name}' sent the following message:</u></b>\n\n"
+    if request is None:
+        return None
 
-        # Send the message (with in-chat reminder) to the fulfiller via the fullfiler's chat id.
-        await context.bot.send_message(chat_id=request["fulfiller_chat_id"], text=in_chat_reminder + requesterMsg, parse_mode="HTML")
+    # Requests that are still available have no pairing yet, so they are not cached.
+    if request["request_status"] == "Available":
+        return request
+
+    savePairing(request)
+
+    return activePairings[RequestID]
+
+# Atomically claim an available request for a fulfiller. The update only goes through if the request
+# is still "Available", so when several fulfillers claim the same request at once exactly one of them wins.
+# Returns the claimed request, or None if it was already taken (or deleted).
+async def claimRequest(RequestID, fulfiller_chat_id, fulfiller_user_name):
+    request = await Storage.requestStore.claim(RequestID, fulfiller_chat_id, fulfiller_user_name)
+
+    # Either way, the request is no longer open.
+    OpenRequests.index.remove(RequestID)
+
+    if request is None:
+        logger.info("RequestID '%s' was already taken before (chat_id: '%s') could claim it.", RequestID, fulfiller_chat_id)
+
+    return request
+
+# Store the request in the requester's user_data, from a handler (or job) running for someone else.
+# Changes to another user's user_data aren't tracked, so they are marked for the next persistence update.
+# The requester's conversation moves on with their own next update (see whileAwaitingFulfiller).
+def storeRequesterRequest(application, request):
+    requester_chat_id = int(request["requester_chat_id"])
+
+    application.user_data[requester_chat_id][MainMenu.REQUEST_MADE] = dict(request)
+    application.mark_data_for_update_persistence(chat_ids = [requester_chat_id], user_ids = [requester_chat_id])
+
+# Push the match to the requester: store the claimed request in the requester's user_data,
+# so their next message is relayed without re-reading the request status.
+def pushRequesterInConvo(context, request):
+    storeRequesterRequest(context.application, request)
+
+    logger.info("Pushed the match of RequestID '%s' to requester (chat_id: '%s')", request["RequestID"], request["requester_chat_id"])
+
+# The request a requester is waiting on, as this worker last saw it: from the pairing registry once it has been matched.
+# When several bot workers share the "dynamodb" change feed, the request may have been claimed through another worker,
+# and the push only reaches this one once the change comes through the stream. Until then, the status is checked in the DB.
+async def latestRequest(context):
+    request = context.user_data[MainMenu.REQUEST_MADE]
+
+    if request["RequestID"] in activePairings or (RequestStream.mode == "dynamodb" and request["request_status"] == "Available"):
+        request = await getPairing(request["RequestID"]) or request
+        context.user_data[MainMenu.REQUEST_MADE] = dict(request)
+
+    return context.user_data[MainMenu.REQUEST_MADE]
+
+# Wrap a handler of the AWAIT_FULFILLER state. A fulfiller claiming the request, or the request expiring, happens in someone
+# else's update, which only stores the request in the requester's user_data and the pairing registry (see applyStatusChange).
+# The requester's conversation then moves on with their own next update: callback handles it while the request is still available,
+# and matched once it has been claimed. An expired request ends the conversation.
+def whileAwaitingFulfiller(callback, matched):
+    async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        request = await latestRequest(context)
+
+        if request["request_status"] == "Available":
+            return await callback(update, context)
+
+        if request["request_status"] == "Expired":
+            await update.message.reply_text("Sorry, your request has expired as no fulfiller took it in time. Use /start to make a new request.")
+            return ConversationHandler.END
+
+        logger.info("Requester (chat_id: '%s') moved on from AWAIT_FULFILLER, RequestID '%s' is '%s'", request["requester_chat_id"], request["RequestID"], request["request_status"])
+
+        return await matched(update, context)
+
+    return handle
+
+####################################### Notifications #######################################
+
+# Let the requester know a fulfiller has claimed their request (Available -> In Progress).
+async def notifyMatched(context, request):
+    # Get rating of fulfiller
+    ratingPercent, total = await UserRatings.getUserRating(request["fulfiller_chat_id"])
+
+    # Send message to requester to indicate connection to the fulfiller.
+    await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["requester_chat_id"], text=f"""Fulfiller found!. You are now connected with {request["fulfiller_user_name"]} | {ratingPercent}% \U0001F44D out of {total} ratings.
+Use /end to end the conversation at any time, and /complete to mark the transaction as completed.""")
+
+# Let the other user know the conversation has been ended with /end (In Progress -> Closed).
+async def notifyClosed(context, request):
+    if request.get("closed_by") == "requester":
+        # Prompt fulfiller to notify them that the conversation has ended.
+        await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["fulfiller_chat_id"], text=f"'{request['requester_user_name']}' has ended the conversation. Use /start to request or fulfil an order again.")
+    else:
+        # Prompt requester to notify them that the conversation has ended.
+        await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["requester_chat_id"], text=f"'{request['fulfiller_user_name']}' has ended the conversation. Use /start to request or fulfil an order again.")
+
+# Ask the user who used /complete first to rate the other user, once both have confirmed (In Progress -> Complete).
+# The user who confirmed second is prompted by their own /complete handler.
+async def notifyComplete(context, request):
+    if request["fulfiller_complete"] == "true":
+        await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["fulfiller_chat_id"], text=f"The order is now complete. \n\nHow would you rate your interaction with {request['requester_user_name']}?", reply_markup = UserInterface.ratingKeyboard)
+
+    if request["requester_complete"] == "true":
+        await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["requester_chat_id"], text=f"The order is now complete. \n\nHow would you rate your interaction with {request['fulfiller_user_name']}?", reply_markup = UserInterface.ratingKeyboard)
+
+# Let the requester know nobody claimed their request in time (Available -> Expired).
+async def notifyExpired(context, request):
+    await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["requester_chat_id"], text=f"""Sorry, no fulfiller took your request for {request["food"]} at {UserInterface.canteenName(request["canteen"])} in time, so it has expired.
+Use /start to make a new request.""")
+
+# Keep this worker's pairing registry, and the requester's conversation, in step with a change of request_status.
+# With several bot workers, every worker applies every change (see RequestStream), so none of them goes on relaying
+# messages for a pairing that has been closed through another worker.
+def applyStatusChange(context, oldStatus, request):
+    # An expired request was never matched, so it has no pairing. The requester's conversation ends.
+    if request["request_status"] == "Expired":
+        dropPairing(request["RequestID"])
+        storeRequesterRequest(context.application, request)
+        return
+
+    if request["request_status"] != "Available":
+        savePairing(request)
+
+    # Let the requester's conversation move into REQUESTER_IN_CONVO.
+    if oldStatus == "Available" and request["request_status"] == "In Progress":
+        pushRequesterInConvo(context, request)
+
+# Refresh a request in the pairing registry after a change to its other attributes (e.g. requester_complete), if it is there.
+def refreshPairing(request):
+    if request["RequestID"] in activePairings:
+        savePairing(request)
+
+# Send the notifications for a change of request_status. With several bot workers, only one of them sends them.
+async def sendStatusNotifications(context, oldStatus, request):
+    if request["request_status"] == "Expired":
+        await notifyExpired(context, request)
+    elif oldStatus == "Available" and request["request_status"] == "In Progress":
+        await notifyMatched(context, request)
+    elif request["request_status"] == "Closed":
+        await notifyClosed(context, request)
+    elif request["request_status"] == "Complete":
+        await notifyComplete(context, request)
+
+# Apply a change of request_status in this worker and send its notifications.
+async def notifyStatusChange(context, oldStatus, request):
+    applyStatusChange(context, oldStatus, request)
+    await sendStatusNotifications(context, oldStatus, request)
+
+# Called by the handlers after they change request_status. The notifications are sent straight away,
+# unless the change feed consumer (see RequestStream) is running and will send them when the change comes through.
+async def publishStatusChange(context, oldStatus, request):
+    if not RequestStream.enabled():
+        await notifyStatusChange(context, oldStatus, request)
+
+
+####################################### Main Functions #######################################
+# A message from the requester while their request is still available (see whileAwaitingFulfiller). No need to query the DB.
+async def awaitFulfiller(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text("We are still trying to find a fulfiller. Please wait, or use /cancel to quit and remove your current request.")
+
+    return MainMenu.AWAIT_FULFILLER
+
+# /cancel or /edit from a requester whose request was claimed since their last update.
+async def requestTaken(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    request = context.user_data[MainMenu.REQUEST_MADE]
+
+    await update.message.reply_text(f"'{request['fulfiller_user_name']}' has already taken your request, so it can no longer be changed. Send a message to chat with them, or use /end to end the conversation.")
+
+    return MainMenu.REQUESTER_IN_CONVO
 
-        return MainMenu.REQUESTER_IN_CONVO
-    
 async def requesterCancelSearch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Get the request ID of the request to be deleted by the requester.
     RequestID = context.user_data[MainMenu.REQUEST_MADE]["RequestID"]
-    response = DynamoDB.table.delete_item(Key = {"RequestID": RequestID})
+    await Storage.requestStore.delete(RequestID)
+    dropPairing(RequestID)
+    OpenRequests.index.remove(RequestID)
 
     logger.info(f"Requester {update.effective_user.name} (chat_id: {update.effective_user.id}) deleted their request (RequestID: {RequestID}) before a fulfiller was found")
-    logger.info("DynamoDB delete response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
 
     await update.message.reply_text("Request cancelled! Use /start to use Dabao4Me again.")
 
     return ConversationHandler.END
 
 async def promptEditRequest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Define the menu using a 2D array.
-    inlineMenu = [
-        [InlineKeyboardButton("Change Canteen Location", callback_data="editCanteen")],
-        [InlineKeyboardButton("Change Food Option", callback_data="editFood")],
-        [InlineKeyboardButton("Change Tip Amount", callback_data="editTip")]
-    ]
-
-    # Transform the 2D array into an actual inline keyboard that can be interpreted by Telegram.
-    inlineMenuTG = InlineKeyboardMarkup(inlineMenu)
-
     # Log event
     logger.info(f"Requester {update.effective_user.name} (chat_id: {update.effective_user.id}) is modifying their request.")
 
-    await update.message.reply_text("Please select the part of the request you'd like to edit: ", reply_markup=inlineMenuTG)
+    await update.message.reply_text("Please select the part of the request you'd like to edit: ", reply_markup=UserInterface.editRequestKeyboard)
 
     return MainMenu.EDIT_ORDER
 
 # When the fulfiller ends the conversation using the /end command.
 async def fulfillerEndConv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Query the DB for the request selected by the fulfiller.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_CHOSEN]["RequestID"])
-
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_CHOSEN]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
     # Get the request the fulfiller has chosen.
-    request = response["Item"]
+    request = await getPairing(context.user_data[MainMenu.REQUEST_CHOSEN]["RequestID"])
 
     # Update request_status in DynamoDB to "Closed".
-    response = DynamoDB.table.update_item(
-        Key = {
-            "RequestID": request["RequestID"]
-        },
-        UpdateExpression = "SET request_status = :status",
-        ExpressionAttributeValues = {
-            ":status" : "Closed"
-        }
-    )
-
-    # Update status for request variable before updating user_data
-    request['request_status'] = "Closed"
-    context.user_data[MainMenu.REQUEST_CHOSEN] = request
+    await Storage.requestStore.setStatus(request["RequestID"], "Closed", closed_by = "fulfiller")
 
-    logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    # Update status in the pairing registry before updating user_data
+    setPairingStatus(request["RequestID"], "Closed")
+    request = dict(request, request_status = "Closed", closed_by = "fulfiller")
+    context.user_data[MainMenu.REQUEST_CHOSEN] = request
 
     # Prompt fulfiller to confirm that the conversation has ended.
     await update.message.reply_text(f"You have ended the conversation with '{request['requester_user_name']}'. Use /start to request or fulfil an order again.")
 
-    # Prompt requester to notify them that the conversation has ended.
-    await context.bot.send_message(chat_id=request["requester_chat_id"], text=f"'{request['fulfiller_user_name']}' has ended the conversation. Use /start to request or fulfil an order again.")
+    # Notify the requester that the conversation has ended.
+    await publishStatusChange(context, "In Progress", request)
 
     # Store information about their name.
     logger.info("Fulfiller '%s' (chat_id: '%s') ended a conversation with '%s' (chat_id: '%s').", request["fulfiller_user_name"], request["fulfiller_chat_id"],
@@ -139,14 +277,8 @@ async def fulfillerEndConv(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 # When the requester ends the conversation using the /end command.
 async def requesterEndConv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Query the DB for the request selected by the fulfiller.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
-
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_MADE]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
-    # Get the request the fulfiller has chosen.
-    request = response["Item"]
+    # Get the request the requester has put out.
+    request = await getPairing(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
 
     # Additional check needed here as this function might be called before the user is even connected to a user (while requester is in the midst of getting matched)
     if (request["request_status"] == "Available"):
@@ -155,27 +287,18 @@ async def requesterEndConv(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return MainMenu.AWAIT_FULFILLER
 
     # Update request_status in DynamoDB to "Closed".
-    response = DynamoDB.table.update_item(
-        Key = {
-            "RequestID": request["RequestID"]
-        },
-        UpdateExpression = "SET request_status = :status",
-        ExpressionAttributeValues = {
-            ":status" : "Closed"
-        }
-    )
-
-    # Update status for request variable before updating user_data
-    request['request_status'] = "Closed"
-    context.user_data[MainMenu.REQUEST_MADE] = request
+    await Storage.requestStore.setStatus(request["RequestID"], "Closed", closed_by = "requester")
 
-    logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    # Update status in the pairing registry before updating user_data
+    setPairingStatus(request["RequestID"], "Closed")
+    request = dict(request, request_status = "Closed", closed_by = "requester")
+    context.user_data[MainMenu.REQUEST_MADE] = request
 
     # Prompt requester to confirm that the conversation has ended.
     await update.message.reply_text(f"You have ended the conversation with '{request['fulfiller_user_name']}'. Use /start to request or fulfil an order again.")
 
-    # Prompt fulfiller to notify them that the conversation has ended.
-    await context.bot.send_message(chat_id=request["fulfiller_chat_id"], text=f"'{request['requester_user_name']}' has ended the conversation. Use /start to request or fulfil an order again.")
+    # Notify the fulfiller that the conversation has ended.
+    await publishStatusChange(context, "In Progress", request)
 
     # Store information about their name.
     logger.info("Requester '%s' (chat_id: '%s') ended a conversation with '%s' (chat_id: '%s').", request["requester_user_name"], ["requester_chat_id"],
@@ -186,9 +309,6 @@ async def requesterEndConv(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def fulfilRequest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Store user's argument for the /fulfil command
     userInput = context.args[0]
-    
-    # Get the canteen the fulfiller selected.
-    selectedCanteen = context.user_data[MainMenu.CANTEEN]
 
     # Regex pattern for integers only
     intPattern = r"^\d+$"
@@ -201,80 +321,46 @@ async def fulfilRequest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Input has been verified to be an integer
     requestIndex = int(userInput) - 1
     
-    # Check that user input is not out of range
-    try: 
-        selectedRequest = FulfillerDetails.filterRequests(selectedCanteen)[requestIndex]
-    except IndexError:
+    # Check that user input is not out of range of the list the fulfiller was shown
+    listedRequests = context.user_data.get(MainMenu.REQUESTS_LISTED, [])
+
+    if requestIndex < 0 or requestIndex >= len(listedRequests):
         await update.message.reply_text("Invalid request number. Please try again.")
-        return MainMenu.FULFIL_REQUEST  
-
-    # Get the specific request from the list of requests of the selected canteen via the requestIndex.
-    # 1. Via DynamoDB
-    selectedRequest = FulfillerDetails.filterRequests(selectedCanteen)[requestIndex]
-
-    response = DynamoDB.table.update_item(
-        Key = {
-            "RequestID": selectedRequest["RequestID"]
-        },
-        UpdateExpression = "SET fulfiller_chat_id = :chat_id, fulfiller_user_name = :user_name, request_status = :status",
-        ExpressionAttributeValues = {
-            ":chat_id" : str(update.effective_user.id),
-            ":user_name" : update.effective_user.name,
-            ":status" : "In Progress"
-        }
-    )
-
-    # Update attributes for request variable before updating user_data
-    selectedRequest['fulfiller_chat_id'] = str(update.effective_user.id)
-    selectedRequest['fulfiller_user_name'] = update.effective_user.name
-    selectedRequest['request_status'] = "In Progress"
-    context.user_data[MainMenu.REQUEST_MADE] = selectedRequest
+        return MainMenu.FULFIL_REQUEST
 
-    logger.info("DynamoDB update_item response for RequestID '%s': '%s'", selectedRequest["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    return await connectFulfiller(update, context, listedRequests[requestIndex]["RequestID"])
 
-    # Store the selected request the fulfiller has chosen into user_data
-    context.user_data[MainMenu.REQUEST_CHOSEN] = FulfillerDetails.get_item(selectedRequest["RequestID"])["Item"]
+# When the fulfiller presses the "Fulfil" button of a request while browsing.
+async def fulfilRequestButton(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Once the user clicks a button, we need to "answer" the CallbackQuery.
+    await update.callback_query.answer()
 
-    # Send message to fulfiller to indicate connection to the requester.
-    await update.message.reply_text(f"You are now connected with {selectedRequest['requester_user_name']}! Use /end to end the conversation at any time, and /complete to mark the transaction as completed.")
+    # The callback data is "claim#<RequestID>".
+    RequestID = update.callback_query.data.split("#", 1)[1]
 
-    # Get rating of fulfiller
-    response = DynamoDB.userRatingsTable.get_item(
-            Key = {"user_chat_id": str(update.effective_user.id)}
-        )
-    
-    print()
+    return await connectFulfiller(update, context, RequestID)
 
-    logger.info("User Ratings Table get_item response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
+# Claim the request for the fulfiller and connect them with its requester.
+async def connectFulfiller(update: Update, context: ContextTypes.DEFAULT_TYPE, RequestID) -> None:
+    # Claim the request in a single conditional write.
+    selectedRequest = await claimRequest(RequestID, update.effective_user.id, update.effective_user.name)
 
-    # Initialize
-    good_received = 0
-    bad_received = 0
+    if selectedRequest is None:
+        await update.effective_message.reply_text("Sorry, this request has already been taken by another fulfiller or cancelled. Please choose another request, or use /start to see the latest requests.")
+        return MainMenu.FULFIL_REQUEST
 
-    # If user has not received any ratings before, KeyError will occur during retrieval
-    try:
-        good_received = int(response["Item"]["good_received"])
-    except KeyError:
-        pass
+    # Update user_data with the claimed request
+    context.user_data[MainMenu.REQUEST_MADE] = selectedRequest
 
-    try:
-        bad_received = int(response["Item"]["bad_received"])
-    except KeyError:
-        pass
+    # Store the selected request the fulfiller has chosen into user_data and the pairing registry
+    context.user_data[MainMenu.REQUEST_CHOSEN] = dict(selectedRequest)
+    savePairing(selectedRequest)
 
-    total = int(good_received) + int(bad_received)
-    
-    # Make sure total is not 0 to avoid dividing by 0
-    if (total != 0):
-        ratingPercent = float(good_received) / float(total)
-        # We only want the integer portion of the number
-        ratingPercent = int(ratingPercent * 100)
-    else:
-        ratingPercent = 0
+    # Send message to fulfiller to indicate connection to the requester.
+    await update.effective_message.reply_text(f"You are now connected with {selectedRequest['requester_user_name']}! Use /end to end the conversation at any time, and /complete to mark the transaction as completed.")
 
-    # Send message to requester to indicate connection to the fulfiller.
-    await context.bot.send_message(chat_id=selectedRequest["requester_chat_id"], text=f"""Fulfiller found!. You are now connected with {selectedRequest["fulfiller_user_name"]} | {ratingPercent}% \U0001F44D out of {total} ratings.
-Use /end to end the conversation at any time, and /complete to mark the transaction as completed.""")
+    # Let the requester know they have been matched.
+    await publishStatusChange(context, "Available", selectedRequest)
 
     # Store information about the event.
     logger.info("Fulfiller '%s' (chat_id: '%s') started a conversation with '%s' (chat_id: '%s').", selectedRequest["fulfiller_user_name"], selectedRequest["fulfiller_chat_id"],
@@ -284,20 +370,13 @@ Use /end to end the conversation at any time, and /complete to mark the transact
 
 
 async def forwardFulfillerMsg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Query the DB for the request selected by the fulfiller.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_CHOSEN]["RequestID"])
-
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_CHOSEN]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    # Get the request the fulfiller has chosen from the pairing registry.
+    request = await getPairing(context.user_data[MainMenu.REQUEST_CHOSEN]["RequestID"])
 
     # Get the message the fulfiller is trying to send to the requester
     fulfillerMsg = update.message.text
 
-    try:
-        # Get the request the fulfiller has chosen.
-        request = response["Item"]
-        context.user_data[MainMenu.REQUEST_CHOSEN] = request
-    except KeyError:
+    if request is None:
         # This triggers in the event where the requester does /cancel instead of /end to 
         # gracefully end the convo, and the fulfiller tries to send a message to the requester.
         await update.message.reply_text(f"The requester has deleted their request. Use /start to request or fulfill an order again.")
@@ -317,27 +396,23 @@ async def forwardFulfillerMsg(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     in_chat_reminder = f"<b><u>Fulfiller '{request['fulfiller_user_name']}' sent the following message:</u></b>\n\n"
 
-    await context.bot.send_message(chat_id=request['requester_chat_id'], text=in_chat_reminder + fulfillerMsg, parse_mode="HTML")
+    await SendQueue.sendMessage(context, SendQueue.RELAY, chat_id=request['requester_chat_id'], text=in_chat_reminder + fulfillerMsg, parse_mode="HTML")
 
     return MainMenu.FULFILLER_IN_CONVO
 
 
 async def forwardRequesterMsg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Query the DB for the request made by the requester.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
-
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_MADE]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    # Get the request the requester has put out from the pairing registry.
+    request = await getPairing(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
 
     # Get the message the requester is trying to send to the fulfiller
     requesterMsg = update.message.text
 
-    # Get the request the requester has put out.
-    request = response["Item"]
-    context.user_data[MainMenu.REQUEST_MADE] = request
-    
     # Check valid convo status.
-    if (request["request_status"] == "Closed"):
+    if request is None:
+        await update.message.reply_text(f"Your request no longer exists. Use /start to request or fulfill an order again.")
+        return ENDConv
+    elif (request["request_status"] == "Closed"):
         await update.message.reply_text(f"'{request['fulfiller_user_name']}' has ended the conversation. Use /start to request or fulfill an order again.")
         return ENDConv
     elif (request["request_status"] == "Complete"):
@@ -351,20 +426,14 @@ async def forwardRequesterMsg(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     in_chat_reminder = f"<b><u>Requester '{request['requester_user_name']}' sent the following message:</u></b>\n\n"
 
-    await context.bot.send_message(chat_id=request['fulfiller_chat_id'], text=in_chat_reminder + requesterMsg, parse_mode="HTML")
+    await SendQueue.sendMessage(context, SendQueue.RELAY, chat_id=request['fulfiller_chat_id'], text=in_chat_reminder + requesterMsg, parse_mode="HTML")
 
     return MainMenu.REQUESTER_IN_CONVO
 
 
 async def requesterComplete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Query the DB for the request made by the requester.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
-
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_MADE]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
-    # Get the request the requester has put out.
-    request = response["Item"]
+    request = await Storage.requestStore.get(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
     context.user_data[MainMenu.REQUEST_MADE] = request
     
     # Check if the stauts of the request is "In progress" before allowing requester to confirm the order.
@@ -374,28 +443,19 @@ async def requesterComplete(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if (request["fulfiller_complete"] == "true"):
 
             # If fulfiller has already confirmed the fulfillment of the request, send the appropriate message to the requester
-            # Send the appropriate message to the fulfiller
-            await context.bot.send_message(chat_id=request["fulfiller_chat_id"], text=f"The order is now complete. \n\nHow would you rate your interaction with {request['requester_user_name']}?", reply_markup = UserRatings.userRatingOptionsIK)
-
             # Update request_status in DynamoDB to "Complete".
-            response = DynamoDB.table.update_item(
-                Key = {
-                    "RequestID": request["RequestID"]
-                },
-                UpdateExpression = "SET request_status = :status",
-                ExpressionAttributeValues = {
-                    ":status" : "Complete"
-                }
-            )
+            await Storage.requestStore.setStatus(request["RequestID"], "Complete")
 
             # Update status for request variable before updating user_data
             request['request_status'] = "Complete"
+            savePairing(request)
             context.user_data[MainMenu.REQUEST_MADE] = request
 
-            logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+            # Send the appropriate message to the fulfiller
+            await publishStatusChange(context, "In Progress", request)
 
             # Prompt user to select a rating option
-            await update.message.reply_text(f"The order is now complete. \n\nHow would you rate your interaction with {request['fulfiller_user_name']}?", reply_markup = UserRatings.userRatingOptionsIK)
+            await update.message.reply_text(f"The order is now complete. \n\nHow would you rate your interaction with {request['fulfiller_user_name']}?", reply_markup = UserInterface.ratingKeyboard)
 
             return MainMenu.RATE_USER
         
@@ -404,25 +464,16 @@ async def requesterComplete(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text(f"You have initiated to mark the order as complete. Please wait for '{request['fulfiller_user_name']}' to confirm before you can leave a rating for them.")
 
             # Send the appropriate message to the fulfiller
-            await context.bot.send_message(chat_id=request["fulfiller_chat_id"], text=f"'{request['requester_user_name']}' has initiated to make the order as complete. To confirm and leave a review for them, please use the '/complete' command.")
+            await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["fulfiller_chat_id"], text=f"'{request['requester_user_name']}' has initiated to make the order as complete. To confirm and leave a review for them, please use the '/complete' command.")
 
             # Update requester_complete to "true"
-            response = DynamoDB.table.update_item(
-                Key = {
-                    "RequestID": request["RequestID"]
-                },
-                UpdateExpression = "SET requester_complete = :complete",
-                ExpressionAttributeValues = {
-                    ":complete" : "true"
-                }
-            )
+            await Storage.requestStore.updateFields(request["RequestID"], requester_complete = "true")
 
             # Update status for request variable before updating user_data
             request['requester_complete'] = "true"
+            savePairing(request)
             context.user_data[MainMenu.REQUEST_MADE] = request
 
-            logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
             return MainMenu.REQUESTER_IN_CONVO
         
     else:
@@ -433,41 +484,26 @@ async def requesterComplete(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def fulfillerComplete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Query the DB for the request made by the fulfiller.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
-
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_MADE]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
-    # Get the request the fulfiller has put out.
-    request = response["Item"]
+    request = await Storage.requestStore.get(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
     context.user_data[MainMenu.REQUEST_CHOSEN] = request
 
     # Check if requester has already sent the "/complete command"
     if (request["requester_complete"] == "true"):
 
         # If requester has already confirmed the fulfillment of the request, send the appropriate message to the requester
-        # Send the appropriate message to the requester
-        await context.bot.send_message(chat_id=request["requester_chat_id"], 
-                                       text=f"The order is now complete. \n\nHow would you rate your interaction with {request['fulfiller_user_name']}?", reply_markup = UserRatings.userRatingOptionsIK)
-        
         # Update request_status in DynamoDB to "Complete".
-        response = DynamoDB.table.update_item(
-            Key = {
-                "RequestID": request["RequestID"]
-            },
-            UpdateExpression = "SET request_status = :status",
-            ExpressionAttributeValues = {
-                ":status" : "Complete"
-            }
-        )
+        await Storage.requestStore.setStatus(request["RequestID"], "Complete")
         
         # Update status for request variable before updating user_data
         request['request_status'] = "Complete"
+        savePairing(request)
         context.user_data[MainMenu.REQUEST_MADE] = request
-        logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+
+        # Send the appropriate message to the requester
+        await publishStatusChange(context, "In Progress", request)
 
         # Prompt user to select a rating option
-        await update.message.reply_text(f"The order is now complete. \n\nHow would you rate your interaction with {request['requester_user_name']}?", reply_markup = UserRatings.userRatingOptionsIK)
+        await update.message.reply_text(f"The order is now complete. \n\nHow would you rate your interaction with {request['requester_user_name']}?", reply_markup = UserInterface.ratingKeyboard)
 
         return MainMenu.RATE_USER
     
@@ -476,22 +512,14 @@ async def fulfillerComplete(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text(f"You have initiated to mark the order as complete. Please wait for '{request['requester_user_name']}' to confirm before you can leave a rating for them.")
 
         # Send the appropriate message to the requester
-        await context.bot.send_message(chat_id=request["requester_chat_id"], text=f"'{request['fulfiller_user_name']}' has initiated to make the order as complete. To confirm and leave a review for them, please use the '/complete' command.")
+        await SendQueue.sendMessage(context, SendQueue.NOTIFICATION, chat_id=request["requester_chat_id"], text=f"'{request['fulfiller_user_name']}' has initiated to make the order as complete. To confirm and leave a review for them, please use the '/complete' command.")
 
         # Update fulfiller_complete to "true"
-        response = DynamoDB.table.update_item(
-            Key = {
-                "RequestID": request["RequestID"]
-            },
-            UpdateExpression = "SET fulfiller_complete = :complete",
-            ExpressionAttributeValues = {
-                ":complete" : "true"
-            }
-        )
+        await Storage.requestStore.updateFields(request["RequestID"], fulfiller_complete = "true")
 
         # Update status for request variable before updating user_data
         request['fulfiller_complete'] = "true"
+        savePairing(request)
         context.user_data[MainMenu.REQUEST_MADE] = request
-        logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
 
         return MainMenu.FULFILLER_IN_CONVO
@@ -2,46 +2,25 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler
 
 import logging
-import DynamoDB
-import configparser
-from datetime import datetime
-from boto3.dynamodb.conditions import Key
 import MainMenu
 import re
+import OpenRequests
+import Storage
+import UserInterface
 
 ####################################### Parameters #######################################
 
-# Create config parser and read config file
-config = configparser.ConfigParser()
-config.read("config.ini")
-
-# Load bot token
-bot_token = config["bot_keys"]["current_bot_token"]
-
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-table = DynamoDB.table
-
 ####################################### Helper Functions #######################################
 
-# Get all available requests from given chat ID
-def getAvailableRequestsFromChatId(chatId):
-    response = table.query(
-        IndexName = "requester_chat_id-request_status-index",
-        KeyConditionExpression = Key("requester_chat_id").eq(str(chatId)) & Key("request_status").eq("Available"))
-
-    logger.info("DynamoDB query response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
-
-    requests = response["Items"]
+# Get all available requests from given chat ID, oldest first (the order the request store returns them in)
+async def getAvailableRequestsFromChatId(chatId):
+    requests = [request async for request in Storage.requestStore.iterByRequester(chatId)]
 
-    # Sort according to timestamp
-    sorted_requests = sorted(requests, key=lambda x: x["RequestID"][:16])
+    logger.info("Request store returned %s requests for chat_id '%s'", len(requests), chatId)
 
-    return sorted_requests
+    return requests
 
 ####################################### Main Functions #######################################
 
@@ -49,7 +28,7 @@ async def displayUserRequests(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Store user's chat ID
     chatId = update.effective_chat.id
 
-    requests = getAvailableRequestsFromChatId(chatId)
+    requests = await getAvailableRequestsFromChatId(chatId)
 
     if (len(requests) == 0):
         await update.callback_query.message.reply_text("You have no available requests.")
@@ -57,28 +36,15 @@ async def displayUserRequests(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
 
     # Properly format available requests from that user
-    formatted_output = ""
-    requestCounter = 1
-
-    for request in requests:
-        formattedCanteen = request["canteen"]
-        requestID = request["RequestID"]
-        # The first 16 characters of the requestID is the time of the request.
-        unixTimestamp = float(requestID[:16])
-        username = request["requester_user_name"]
-        food = request["food"]
+    # The time the request was made is part of its RequestID.
+    formatted_output = "".join(UserInterface.OWN_LISTING_TEMPLATE.format(
+        number = requestCounter,
+        requested_on = UserInterface.formatTimestamp(Storage.createdAt(request["RequestID"])),
+        username = request["requester_user_name"],
+        canteen = request["canteen"],
+        food = request["food"],
         tip_amount = request["tip_amount"]
-
-        formattedTimestamp = datetime.fromtimestamp(unixTimestamp).strftime("%d %b %y %I:%M %p")
-
-        formatted_output += f"""{requestCounter}) Requested on: {formattedTimestamp}
-Username / Name: {username}
-Canteen: {formattedCanteen}
-Food: {food}
-Tip Amount: ${tip_amount}
-
-"""
-        requestCounter += 1
+    ) for requestCounter, request in enumerate(requests, start=1))
 
     logger.info("'%s' (chat_id: '%s') displayed all available orders.", update.effective_user.name, update.effective_chat.id)
 
@@ -100,14 +66,13 @@ async def deleteSelectedOrder(update: Update, context: ContextTypes.DEFAULT_TYPE
         return MainMenu.DELETE_ORDER
     
     try:
-        selectedRequest = getAvailableRequestsFromChatId(chatId)[int(userInput) - 1]
+        selectedRequest = (await getAvailableRequestsFromChatId(chatId))[int(userInput) - 1]
     except IndexError:
         await update.message.reply_text("Invalid request number. Please try again.")
         return MainMenu.DELETE_ORDER
 
-    response = DynamoDB.table.delete_item(Key = {"RequestID": selectedRequest["RequestID"]})
-
-    logger.info("DynamoDB delete response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
+    await Storage.requestStore.delete(selectedRequest["RequestID"])
+    OpenRequests.index.remove(selectedRequest["RequestID"])
 
     await update.message.reply_text("Request cancelled!")
 
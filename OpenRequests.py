@@ -0,0 +1,186 @@
+from Storage import sortKey, pageKey
+
+import asyncio
+import bisect
+import logging
+import Settings
+import time
+import Storage
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of open requests kept in memory. The oldest are dropped first.
+max_open_requests = Settings.config.getint("open_requests", "max_size", fallback = 10000)
+
+# Seconds a canteen's listing may be served from memory before it is reloaded from the request store.
+# This bounds how long requests made or claimed through another bot worker can go unseen here.
+max_staleness = Settings.config.getfloat("open_requests", "max_staleness", fallback = 30)
+
+####################################### Open Request Index #######################################
+
+# In-memory index of the open ("Available") requests, keyed by RequestID and bucketed by canteen.
+# Each canteen's bucket is kept sorted by Storage.sortKey(), so a page of its listing is a bisect and a slice.
+# The index is bounded: once it holds max_size requests the oldest one (by Storage.sortKey(), i.e. the time it was made) is dropped,
+# and the canteen it was dropped from is no longer served from memory until it is reloaded.
+# Kept in sync by the create, edit, claim, cancel and delete handlers.
+class OpenRequestIndex:
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        # RequestID -> request.
+        self.requests = {}
+
+        # canteen -> sorted list of sortKey() of its requests.
+        self.byCanteen = {}
+
+        # canteen -> time.monotonic() it was last loaded from the request store. Only these canteens hold every open request.
+        self.loadedAt = {}
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __contains__(self, RequestID):
+        return RequestID in self.requests
+
+    def get(self, RequestID):
+        return self.requests.get(RequestID)
+
+    # Add (or replace) an open request.
+    def add(self, request):
+        self.remove(request["RequestID"])
+
+        request = dict(request)
+        self.requests[request["RequestID"]] = request
+        bisect.insort(self.byCanteen.setdefault(request["canteen"], []), sortKey(request))
+
+        while len(self.requests) > self.max_size:
+            # Each bucket is sorted, so the oldest request is the first of one of them.
+            oldestID = min(keys[0] for keys in self.byCanteen.values())[1]
+            logger.info("Open request index is full, dropping RequestID '%s'", oldestID)
+
+            # The canteen's listing is incomplete without it.
+            self.loadedAt.pop(self.remove(oldestID)["canteen"], None)
+
+    # Apply edited attributes to an open request, moving it to another canteen bucket if the canteen changed.
+    def update(self, RequestID, **changes):
+        request = self.requests.get(RequestID)
+
+        if request is None:
+            return
+
+        if "canteen" in changes and changes["canteen"] != request["canteen"]:
+            self.removeFromCanteen(request)
+            request.update(changes)
+            bisect.insort(self.byCanteen.setdefault(request["canteen"], []), sortKey(request))
+        else:
+            request.update(changes)
+
+    # Remove a request that is no longer open (claimed, cancelled or deleted). Does nothing if it isn't in the index.
+    def remove(self, RequestID):
+        request = self.requests.pop(RequestID, None)
+
+        if request is not None:
+            self.removeFromCanteen(request)
+
+        return request
+
+    def removeFromCanteen(self, request):
+        keys = self.byCanteen.get(request["canteen"])
+
+        if keys is None:
+            return
+
+        position = bisect.bisect_left(keys, sortKey(request))
+
+        if position < len(keys) and keys[position] == sortKey(request):
+            del keys[position]
+
+        if not keys:
+            del self.byCanteen[request["canteen"]]
+
+    # Replace a canteen's requests with the ones just read from the request store.
+    def load(self, canteen, requests):
+        for key in list(self.byCanteen.get(canteen, [])):
+            self.remove(key[1])
+
+        self.loadedAt[canteen] = time.monotonic()
+
+        for request in requests:
+            self.add(request)
+
+    # Whether the canteen's listing can be served from memory.
+    def isFresh(self, canteen):
+        loadedAt = self.loadedAt.get(canteen)
+
+        return loadedAt is not None and time.monotonic() - loadedAt <= max_staleness
+
+    # The open requests at a canteen, oldest first.
+    def inCanteen(self, canteen):
+        return [self.requests[RequestID] for _, RequestID in self.byCanteen.get(canteen, [])]
+
+    # Up to limit requests at a canteen, starting after the request startKey refers to (from the oldest if None).
+    # Returns the requests and the key to start the next page from, or None if this is the last page.
+    def page(self, canteen, startKey, limit):
+        keys = self.byCanteen.get(canteen, [])
+        start = 0 if startKey is None else bisect.bisect_right(keys, sortKey(startKey))
+
+        requests = [self.requests[RequestID] for _, RequestID in keys[start:start + limit]]
+        nextKey = None
+
+        # Same shape as the keys of the request store's pages, so a listing can continue from the store.
+        if start + limit < len(keys):
+            nextKey = pageKey(requests[-1])
+
+        return requests, nextKey
+
+index = OpenRequestIndex(max_open_requests)
+
+####################################### Helper Functions #######################################
+
+# Canteens being reloaded from the request store, so fulfillers browsing the same canteen at once share one reload.
+reloads = {}
+
+# Read every open request at a canteen from the request store into the index.
+async def loadCanteen(canteen):
+    start = time.perf_counter()
+
+    requests = [request async for request in Storage.requestStore.iterByCanteen(canteen)]
+
+    index.load(canteen, requests)
+
+    logger.info("Loaded %s open requests at '%s' in %.3fs", len(requests), canteen, time.perf_counter() - start)
+
+async def reloadCanteen(canteen):
+    if canteen not in reloads:
+        reloads[canteen] = asyncio.ensure_future(loadCanteen(canteen))
+        reloads[canteen].add_done_callback(lambda task: reloads.pop(canteen, None))
+
+    await asyncio.shield(reloads[canteen])
+
+# Get a page of the open requests at a canteen from the index, reloading the canteen first if its listing is stale.
+# Returns None if the canteen can't be served from memory, in which case the caller queries the request store itself.
+async def getCanteenPage(canteen, startKey, limit):
+    if not index.isFresh(canteen):
+        try:
+            await reloadCanteen(canteen)
+        except Exception:
+            logger.exception("Failed to load the open requests at '%s'", canteen)
+            return None
+
+    # Still not fresh if the canteen has more open requests than the index can hold.
+    if not index.isFresh(canteen):
+        return None
+
+    return index.page(canteen, startKey, limit)
+
+# Load the open requests of every canteen before the first fulfiller asks for them.
+async def warm(canteens):
+    results = await asyncio.gather(*(reloadCanteen(canteen) for canteen in canteens), return_exceptions = True)
+
+    for canteen, result in zip(canteens, results):
+        if isinstance(result, Exception):
+            logger.error("Failed to warm the open requests at '%s': %s", canteen, result)
+
+    logger.info("Open request index warmed with %s requests", len(index))
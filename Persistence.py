@@ -0,0 +1,268 @@
+from telegram.ext import BasePersistence, PersistenceInput
+
+import asyncio
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+import BlockingIO
+import DynamoDB
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# Only user_data and the ConversationHandler states are used by the bot, so only those are persisted.
+store_data = PersistenceInput(bot_data = False, chat_data = False, user_data = True, callback_data = False)
+
+# Kinds of rows kept by the persistence backends.
+USER_DATA = "user_data"
+CONVERSATION = "conversation"
+
+####################################### Buffered Persistence #######################################
+
+# Base class for the persistence backends below. python-telegram-bot hands over changed user_data and conversation
+# states in bursts (every update_interval seconds). The changes are staged in memory and written in one batch,
+# either once flush_size rows are staged or flush_delay seconds after the first staged change.
+# Subclasses only need to implement loadRows(), writeRows() and deleteRows(), which may block.
+class BufferedPersistence(BasePersistence):
+    def __init__(self, update_interval = 60, flush_size = 500, flush_delay = 1.0):
+        super().__init__(store_data = store_data, update_interval = update_interval)
+
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+
+        # Staged changes: (kind, key) -> value, or None if the row is to be deleted.
+        self.pending = {}
+        self.flushTask = None
+        self.flushLock = asyncio.Lock()
+
+        # Rows loaded on startup, grouped by kind.
+        self.loaded = None
+
+    ########## Storage (implemented by subclasses) ##########
+
+    # Return every stored row as a list of (kind, key, value).
+    def loadRows(self):
+        raise NotImplementedError
+
+    # Insert or replace the given (kind, key, value) rows.
+    def writeRows(self, rows):
+        raise NotImplementedError
+
+    # Delete the given (kind, key) rows.
+    def deleteRows(self, keys):
+        raise NotImplementedError
+
+    # Run one of the methods above without blocking the event loop.
+    async def runInExecutor(self, func, *args):
+        return await BlockingIO.runInExecutor(func, *args)
+
+    ########## Batching ##########
+
+    async def loadAll(self):
+        if self.loaded is None:
+            start = time.perf_counter()
+            rows = await self.runInExecutor(self.loadRows)
+
+            self.loaded = {USER_DATA: {}, CONVERSATION: {}}
+
+            for kind, key, value in rows:
+                self.loaded[kind][key] = pickle.loads(value)
+
+            logger.info("%s loaded %s rows in %.3fs", type(self).__name__, len(rows), time.perf_counter() - start)
+
+        return self.loaded
+
+    async def stage(self, kind, key, value):
+        self.pending[(kind, key)] = value
+
+        if len(self.pending) >= self.flush_size:
+            await self.flushPending()
+        elif self.flushTask is None or self.flushTask.done():
+            self.flushTask = asyncio.create_task(self.flushLater())
+
+    async def flushLater(self):
+        await asyncio.sleep(self.flush_delay)
+
+        try:
+            await self.flushPending()
+        except Exception:
+            logger.exception("%s failed to flush, retrying in %ss", type(self).__name__, self.flush_delay)
+            self.flushTask = asyncio.create_task(self.flushLater())
+
+    async def flushPending(self):
+        async with self.flushLock:
+            if not self.pending:
+                return
+
+            pending, self.pending = self.pending, {}
+
+            rows = [(kind, key, pickle.dumps(value)) for (kind, key), value in pending.items() if value is not None]
+            deletedKeys = [(kind, key) for (kind, key), value in pending.items() if value is None]
+
+            try:
+                if rows:
+                    await self.runInExecutor(self.writeRows, rows)
+
+                if deletedKeys:
+                    await self.runInExecutor(self.deleteRows, deletedKeys)
+            except Exception:
+                # Stage the changes again so the next flush writes them, unless they have been changed again since.
+                for key, value in pending.items():
+                    self.pending.setdefault(key, value)
+                raise
+
+            logger.info("%s flushed %s rows and deleted %s rows", type(self).__name__, len(rows), len(deletedKeys))
+
+    ########## BasePersistence ##########
+
+    async def get_user_data(self):
+        loaded = await self.loadAll()
+
+        return {int(user_id): data for user_id, data in loaded[USER_DATA].items()}
+
+    async def update_user_data(self, user_id, data):
+        await self.stage(USER_DATA, str(user_id), data)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await self.stage(USER_DATA, str(user_id), None)
+
+    async def get_conversations(self, name):
+        loaded = await self.loadAll()
+
+        return {conversationKey: state for handlerName, conversationKey, state in loaded[CONVERSATION].values() if handlerName == name}
+
+    async def update_conversation(self, name, key, new_state):
+        # Each conversation row is keyed by the handler name and the conversation key, e.g. ('requester_init', (123, 123)).
+        await self.stage(CONVERSATION, repr((name, key)), None if new_state is None else (name, key, new_state))
+
+    async def flush(self):
+        if self.flushTask is not None:
+            self.flushTask.cancel()
+
+        await self.flushPending()
+
+    # chat_data, bot_data and callback_data are not used by the bot.
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+####################################### SQLite Persistence #######################################
+
+# Persistence backed by a local SQLite file.
+class SQLitePersistence(BufferedPersistence):
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+
+        # The connection is used from the BlockingIO executor threads, one at a time.
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connectionLock = threading.Lock()
+
+        with self.connectionLock:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS persistence (kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (kind, key))")
+            self.connection.commit()
+
+    def loadRows(self):
+        with self.connectionLock:
+            return self.connection.execute("SELECT kind, key, value FROM persistence").fetchall()
+
+    def writeRows(self, rows):
+        with self.connectionLock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO persistence (kind, key, value) VALUES (?, ?, ?)", rows)
+
+    def deleteRows(self, keys):
+        with self.connectionLock, self.connection:
+            self.connection.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", keys)
+
+####################################### DynamoDB Persistence #######################################
+
+# Persistence backed by a DynamoDB table with partition key "kind" and sort key "persistence_key" (both strings).
+class DynamoDBPersistence(BufferedPersistence):
+    def __init__(self, tableName, **kwargs):
+        super().__init__(**kwargs)
+
+        self.table = DynamoDB.getResource().Table(tableName)
+
+    # boto3 calls run on the DynamoDB executor, like every other DynamoDB call.
+    async def runInExecutor(self, func, *args):
+        return await DynamoDB.runInExecutor(func, *args)
+
+    def loadRows(self):
+        rows = []
+
+        for kind in (USER_DATA, CONVERSATION):
+            queryArgs = {"KeyConditionExpression": "kind = :kind", "ExpressionAttributeValues": {":kind": kind}}
+
+            # Follow LastEvaluatedKey so every page is loaded.
+            while True:
+                response = self.table.query(**queryArgs)
+
+                rows.extend((item["kind"], item["persistence_key"], item["value"].value) for item in response["Items"])
+
+                if "LastEvaluatedKey" not in response:
+                    break
+
+                queryArgs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        return rows
+
+    def writeRows(self, rows):
+        from boto3.dynamodb.types import Binary
+
+        # batch_writer groups the puts into BatchWriteItem calls of up to 25 items and retries unprocessed items.
+        with self.table.batch_writer(overwrite_by_pkeys = ["kind", "persistence_key"]) as batch:
+            for kind, key, value in rows:
+                batch.put_item(Item = {"kind": kind, "persistence_key": key, "value": Binary(value)})
+
+    def deleteRows(self, keys):
+        with self.table.batch_writer(overwrite_by_pkeys = ["kind", "persistence_key"]) as batch:
+            for kind, key in keys:
+                batch.delete_item(Key = {"kind": kind, "persistence_key": key})
+
+####################################### Helper Functions #######################################
+
+# Create the persistence backend selected in the [persistence] section of config.ini, or None if persistence is disabled.
+def createPersistence(config):
+    backend = config.get("persistence", "backend", fallback = "none")
+
+    options = {
+        "update_interval": config.getfloat("persistence", "update_interval", fallback = 10),
+        "flush_size": config.getint("persistence", "flush_size", fallback = 500),
+        "flush_delay": config.getfloat("persistence", "flush_delay", fallback = 1.0)
+    }
+
+    if backend == "sqlite":
+        return SQLitePersistence(config.get("persistence", "path", fallback = "dabao4me_state.sqlite"), **options)
+    elif backend == "dynamodb":
+        return DynamoDBPersistence(config.get("persistence", "table", fallback = "Dabao4Me_Persistence"), **options)
+
+    return None
@@ -0,0 +1,131 @@
+import logging
+import Settings
+import os
+import time
+import BlockingIO
+import Canteens
+import MatchingUsers
+import OpenRequests
+import Storage
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# Whether this worker expires and archives requests. With several bot workers, exactly one should.
+run_sweeper = Settings.config.getboolean("expiry", "run_sweeper", fallback = True)
+
+# Seconds an "Available" request waits for a fulfiller before it expires. 0 keeps open requests forever.
+open_ttl = Settings.config.getfloat("expiry", "open_ttl", fallback = 45 * 60)
+
+# Seconds between sweeps.
+sweep_interval = Settings.config.getfloat("expiry", "sweep_interval", fallback = 60)
+
+# JSONL file finished requests are appended to before they are deleted.
+archive_path = Settings.config.get("expiry", "archive_path", fallback = "dabao4me_archive.jsonl")
+
+# The sweeper running in this worker, if any. Set by startSweeper().
+sweeper = None
+
+####################################### Sweeper #######################################
+
+# Expires the open requests nobody has claimed within open_ttl, and moves the finished requests whose archive_at has passed
+# (see Storage.statusFields) from the request store to the archive. Runs as a repeating job on the Application's job_queue.
+# Only what is due is read: listings are oldest first, so only the stale end of each canteen's open requests,
+# and only the finished requests that are due, from the sparse canteen-archive_at-index.
+# The first sweep also reads which canteens have requests (a scan in the "dynamodb" backend), to find the canteens removed from the catalogue.
+class RequestSweeper:
+    def __init__(self, archivePath):
+        self.archivePath = archivePath
+
+        self.expired = 0
+        self.archived = 0
+
+        # Every canteen that may have requests: those in the request store when the sweeper started, and every canteen in the catalogue since.
+        # New requests are only made at canteens in the catalogue, so requests at a canteen removed from it are still swept.
+        # None until the request store has been read.
+        self.canteens = None
+
+    async def sweep(self, context):
+        now = time.time()
+
+        if self.canteens is None:
+            try:
+                self.canteens = await Storage.requestStore.canteens()
+            except Exception:
+                logger.exception("Failed to read the canteens in the request store, sweeping the canteens in the catalogue")
+
+        catalogue = Canteens.ids()
+
+        if self.canteens is not None:
+            self.canteens.update(catalogue)
+
+        # The canteens in the catalogue first, in its order.
+        for canteen in catalogue + sorted((self.canteens or set()) - set(catalogue)):
+            try:
+                if open_ttl > 0:
+                    await self.expireOpen(context, canteen, now)
+
+                await self.archiveFinished(canteen, now)
+            except Exception:
+                logger.exception("Failed to sweep the requests at '%s'", canteen)
+
+    async def expireOpen(self, context, canteen, now):
+        cutoff = (now - open_ttl) * 1000
+        staleIDs = []
+
+        async for request in Storage.requestStore.iterByCanteen(canteen):
+            if Storage.createdAt(request["RequestID"]) > cutoff:
+                break
+
+            staleIDs.append(request["RequestID"])
+
+        for RequestID in staleIDs:
+            # Only expires the request if it is still available, so a fulfiller claiming it at the same time wins.
+            request = await Storage.requestStore.expire(RequestID)
+            OpenRequests.index.remove(RequestID)
+
+            if request is None:
+                continue
+
+            self.expired += 1
+            logger.info("RequestID '%s' at '%s' expired without a fulfiller", RequestID, canteen)
+
+            await MatchingUsers.publishStatusChange(context, "Available", request)
+
+    async def archiveFinished(self, canteen, now):
+        requests = [request async for request in Storage.requestStore.iterDueForArchive(canteen, now)]
+
+        if not requests:
+            return
+
+        # The requests are only deleted (or given their TTL) once they are safely in the archive.
+        await BlockingIO.runInExecutor(self.writeArchive, requests)
+
+        for request in requests:
+            await Storage.requestStore.markArchived(request["RequestID"])
+
+        self.archived += len(requests)
+        logger.info("Archived %s finished requests at '%s' to '%s'", len(requests), canteen, self.archivePath)
+
+    def writeArchive(self, requests):
+        with open(self.archivePath, "a") as archive:
+            for request in requests:
+                archive.write(Storage.encodeRequest(request) + "\n")
+
+            archive.flush()
+            os.fsync(archive.fileno())
+
+####################################### Helper Functions #######################################
+
+# Start sweeping the requests on the Application's job_queue, unless this worker doesn't run the sweeper.
+def startSweeper(application):
+    global sweeper
+
+    if not run_sweeper:
+        return
+
+    sweeper = RequestSweeper(archive_path)
+    application.job_queue.run_repeating(sweeper.sweep, interval = sweep_interval, first = sweep_interval)
+
+    logger.info("Open requests expire after %ss, finished requests are archived to '%s'", open_ttl, archive_path)
@@ -0,0 +1,188 @@
+from collections import deque
+
+import logging
+import Settings
+import DynamoDB
+import MatchingUsers
+import OpenRequests
+import Storage
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# Where request status notifications come from:
+# "inline" (default) - the handler that changes the status sends them.
+# "local" - an in-process stand-in for DynamoDB Streams, fed by the writes made through Storage.requestStore.
+# "dynamodb" - the DynamoDB stream of the Dabao4Me_Requests table (NEW_AND_OLD_IMAGES), so several bot workers can run
+#              without sharing memory. Needs the "dynamodb" storage backend.
+mode = Settings.config.get("notifications", "mode", fallback = "inline")
+
+# In "dynamodb" mode, whether this worker sends the notifications. Every worker reads the stream, to keep its open request index
+# and pairing registry current, but exactly one should send the notifications, or they are sent twice.
+run_consumer = Settings.config.getboolean("notifications", "run_consumer", fallback = True)
+
+# Seconds between polls of the change feed.
+poll_interval = Settings.config.getfloat("notifications", "poll_interval", fallback = 1.0)
+
+# The consumer running in this worker, if any. Set by startConsumer().
+consumer = None
+
+####################################### Stream Sources #######################################
+
+# In-process stand-in for a DynamoDB stream. Every write made through a request store it is attached to
+# is recorded as an (oldImage, newImage) pair, and handed out in order by getRecords().
+class LocalStreamSource:
+    def __init__(self):
+        self.records = deque()
+
+    def publish(self, oldImage, newImage):
+        self.records.append((oldImage, newImage))
+
+    async def getRecords(self):
+        records = list(self.records)
+        self.records.clear()
+
+        return records
+
+# Reads the (oldImage, newImage) pairs of a DynamoDB stream. Every shard open at startup is read from its latest record,
+# and shards that appear later (e.g. after a shard split) are read from the start, so no change is missed.
+class DynamoDBStreamSource:
+    def __init__(self, tableName):
+        from boto3.dynamodb.types import TypeDeserializer
+
+        self.tableName = tableName
+        self.client = DynamoDB.createClient("dynamodbstreams")
+        self.deserializer = TypeDeserializer()
+
+        self.streamArn = None
+        self.shardIterators = {}
+        self.finishedShards = set()
+
+    def deserialize(self, image):
+        if image is None:
+            return None
+
+        return {name: self.deserializer.deserialize(value) for name, value in image.items()}
+
+    def refreshShards(self):
+        firstRefresh = self.streamArn is None
+
+        if firstRefresh:
+            self.streamArn = DynamoDB.getResource().meta.client.describe_table(TableName = self.tableName)["Table"]["LatestStreamArn"]
+
+        describeArgs = {"StreamArn": self.streamArn}
+
+        while True:
+            description = self.client.describe_stream(**describeArgs)["StreamDescription"]
+
+            for shard in description["Shards"]:
+                shardId = shard["ShardId"]
+
+                if shardId in self.shardIterators or shardId in self.finishedShards:
+                    continue
+
+                self.shardIterators[shardId] = self.client.get_shard_iterator(
+                    StreamArn = self.streamArn,
+                    ShardId = shardId,
+                    ShardIteratorType = "LATEST" if firstRefresh else "TRIM_HORIZON"
+                )["ShardIterator"]
+
+            if "LastEvaluatedShardId" not in description:
+                break
+
+            describeArgs["ExclusiveStartShardId"] = description["LastEvaluatedShardId"]
+
+    def readRecords(self):
+        self.refreshShards()
+
+        records = []
+
+        for shardId, iterator in list(self.shardIterators.items()):
+            response = self.client.get_records(ShardIterator = iterator, Limit = 1000)
+
+            for record in response["Records"]:
+                images = record["dynamodb"]
+                records.append((self.deserialize(images.get("OldImage")), self.deserialize(images.get("NewImage"))))
+
+            # A shard without a next iterator has been closed and fully read.
+            if response.get("NextShardIterator") is None:
+                del self.shardIterators[shardId]
+                self.finishedShards.add(shardId)
+            else:
+                self.shardIterators[shardId] = response["NextShardIterator"]
+
+        return records
+
+    async def getRecords(self):
+        return await DynamoDB.runInExecutor(self.readRecords)
+
+####################################### Consumer #######################################
+
+# Polls a stream source, applies every change to this worker's open request index and pairing registry, and (if sendNotifications)
+# sends the notifications for request_status transitions (Available -> In Progress -> Complete / Closed, or Available -> Expired).
+# Runs as a repeating job on the Application's job_queue.
+class RequestStatusConsumer:
+    def __init__(self, source, sendNotifications = True):
+        self.source = source
+        self.sendNotifications = sendNotifications
+
+    async def poll(self, context):
+        for oldImage, newImage in await self.source.getRecords():
+            try:
+                await self.handleChange(context, oldImage, newImage)
+            except Exception:
+                logger.exception("Failed to handle change to RequestID '%s'", (newImage or oldImage or {}).get("RequestID"))
+
+    async def handleChange(self, context, oldImage, newImage):
+        # The request has been deleted (e.g. cancelled by the requester).
+        if newImage is None:
+            if oldImage is not None:
+                MatchingUsers.dropPairing(oldImage["RequestID"])
+                OpenRequests.index.remove(oldImage["RequestID"])
+            return
+
+        # Keep the open request index current with the changes made through other workers too.
+        if newImage["request_status"] == "Available":
+            OpenRequests.index.add(newImage)
+        else:
+            OpenRequests.index.remove(newImage["RequestID"])
+
+        oldStatus = oldImage.get("request_status") if oldImage is not None else None
+
+        # Only status transitions are notified, not edits to other attributes.
+        if oldStatus == newImage["request_status"]:
+            MatchingUsers.refreshPairing(newImage)
+            return
+
+        logger.info("RequestID '%s' changed from '%s' to '%s'", newImage["RequestID"], oldStatus, newImage["request_status"])
+
+        MatchingUsers.applyStatusChange(context, oldStatus, newImage)
+
+        if self.sendNotifications:
+            await MatchingUsers.sendStatusNotifications(context, oldStatus, newImage)
+
+####################################### Helper Functions #######################################
+
+# Whether request status notifications are sent by a consumer instead of by the handlers.
+def enabled():
+    return mode in ("local", "dynamodb")
+
+# Start the consumer selected in config.ini on the Application's job_queue. Does nothing in "inline" mode.
+# In "dynamodb" mode every worker runs one, and only the worker with run_consumer sends the notifications.
+def startConsumer(application):
+    global consumer
+
+    if mode == "local":
+        source = LocalStreamSource()
+        Storage.requestStore.changeListener = source.publish
+    elif mode == "dynamodb":
+        source = DynamoDBStreamSource(DynamoDB.tableName)
+    else:
+        return
+
+    consumer = RequestStatusConsumer(source, sendNotifications = mode == "local" or run_consumer)
+    application.job_queue.run_repeating(consumer.poll, interval = poll_interval, first = poll_interval)
+
+    logger.info("Request status changes come from the '%s' change feed (this worker %s the notifications)", mode,
+                "sends" if consumer.sendNotifications else "doesn't send")
@@ -1,63 +1,26 @@
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler
-from datetime import datetime
 from decimal import Decimal
 
 import logging
 import re
 import MainMenu
-import DynamoDB
-import configparser
+import OpenRequests
+import Storage
+import UserInterface
+import Canteens
 
 ####################################### Parameters #######################################
 
-# Create config parser and read config file
-config = configparser.ConfigParser()
-config.read("config.ini")
-
-# Load bot token
-bot_token = config["bot_keys"]["current_bot_token"]
-
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s | %(name)s | %(levelname)s | %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Create table object
-table = DynamoDB.table
-
 END_EDITING = ConversationHandler.END
 
 ####################################### Helper Functions #######################################
-# Function to put item in a given table
-def put_item(table, cols, RequestID, requester_chat_id, requester_user_name, canteen,
-             food, tip_amount, fulfiller_chat_id, fulfiller_user_name, request_status, requester_complete, fulfiller_complete):
-    data = {
-        cols[0]: RequestID,
-        cols[1]: requester_chat_id,
-        cols[2]: requester_user_name,
-        cols[3]: canteen,
-        cols[4]: food,
-        cols[5]: tip_amount,
-        cols[6]: fulfiller_chat_id,
-        cols[7]: fulfiller_user_name,
-        cols[8]: request_status,
-        cols[9]: requester_complete,
-        cols[10]: fulfiller_complete
-    }
-    
-    response = table.put_item(Item = data)
-
-    return response
-
-# Get the request from the local python DS.
-def getRequest(available_requests, requestID):
-
-    for request in available_requests:
-        if requestID == request['requestID']:
-            return request
 
+# The summary of the request the requester is making or editing, under the given heading.
+def summaryOf(heading, context):
+    return UserInterface.summary(heading, context.user_data[MainMenu.CANTEEN], context.user_data[MainMenu.FOOD], context.user_data[MainMenu.OFFER_PRICE])
 
 ####################################### Main Functions #######################################
 
@@ -74,36 +37,36 @@ async def promptCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     await update.callback_query.message.reply_text(text=f"You have chosen to be a {context.user_data[MainMenu.ROLE]}.")
 
-    # Define the canteens using a 2D array.
-    inlineCanteen = [
-        [InlineKeyboardButton("The Deck", callback_data="deck")],
-        [InlineKeyboardButton("Frontier", callback_data="frontier")],
-        [InlineKeyboardButton("Fine Foods", callback_data="fine_foods")],
-        [InlineKeyboardButton("Flavours @ Utown", callback_data="flavours")],
-        [InlineKeyboardButton("TechnoEdge", callback_data="technoedge")],
-        [InlineKeyboardButton("PGPR", callback_data="pgpr")],
-    ]
-
-    # Transform the 2D array into an actual inline keyboard that can be interpreted by Telegram.
-    inlineCanteenTG = InlineKeyboardMarkup(inlineCanteen)
-
-    await update.callback_query.message.reply_text("Now, please select from the list of canteens.", reply_markup=inlineCanteenTG)
+    await update.callback_query.message.reply_text("Now, please select from the list of canteens.", reply_markup=UserInterface.canteenKeyboard)
 
     return MainMenu.CANTEEN
 
 async def selectCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Get the canteen selected from the requester and store the input into user_data
-    context.user_data[MainMenu.CANTEEN] = update.callback_query.data
-
     # Once the user clicks a button, we need to "answer" the CallbackQuery.
     await update.callback_query.answer()
 
+    # Nobody can buy food at a closed canteen, so ask for another one.
+    canteen = Canteens.get(update.callback_query.data)
+
+    if canteen is None or not canteen.isOpen(Canteens.now()):
+        hours = f" (today: {canteen.hoursOn(Canteens.now())})" if canteen is not None else ""
+        await update.callback_query.message.reply_text(f"{UserInterface.canteenName(update.callback_query.data)} is not open now{hours}. Please select another canteen.",
+                                                       reply_markup=UserInterface.canteenKeyboard)
+        return MainMenu.CANTEEN
+
+    # Get the canteen selected from the requester and store the input into user_data
+    context.user_data[MainMenu.CANTEEN] = update.callback_query.data
+
     # Let user know their selected canteen.
-    await update.callback_query.message.reply_text(text=f"You have chosen {MainMenu.canteenDict[update.callback_query.data]} as your canteen.")
+    await update.callback_query.message.reply_text(text=f"You have chosen {UserInterface.canteenName(update.callback_query.data)} as your canteen.")
 
     # Store information about their canteen.
     logger.info("Requester '%s' (chat_id: '%s') selected '%s' as their canteen.", update.effective_user.name, update.effective_user.id, context.user_data[MainMenu.CANTEEN])
 
+    # Warn the requester if the canteen already has more open requests than its fulfillers usually take on.
+    if canteen.capacity is not None and OpenRequests.index.isFresh(canteen.canteenID) and len(OpenRequests.index.inCanteen(canteen.canteenID)) >= canteen.capacity:
+        await update.callback_query.message.reply_text(f"{canteen.name} is busy right now, so it may take a while to find a fulfiller.")
+
     await update.callback_query.message.reply_text("Great! Now, please state the food you'd like to order.")
 
     return MainMenu.FOOD
@@ -135,14 +98,12 @@ async def requesterPrice(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user = update.message.from_user
     logger.info("Tip amount set by requester '%s': '%0.2f'", update.effective_user.name, context.user_data[MainMenu.OFFER_PRICE])
 
-    # RequestID which consists of time + telegram username
-    RequestID = "{}#{}".format(datetime.now().timestamp(), update.effective_user.id)
-
-    # Columns in the request table in DynamoDB
-    columns = ["RequestID", "requester_chat_id", "requester_user_name", "canteen", "food", "tip_amount", "fulfiller_chat_id", "fulfiller_user_name", "request_status", "requester_complete", "fulfiller_complete"]
+    # RequestID which sorts by the time the request was made (see Storage.newRequestID)
+    RequestID = Storage.newRequestID()
 
     request = {
         "RequestID" : RequestID,
+        "created_at" : Storage.createdAt(RequestID),
         "requester_chat_id" : update.effective_user.id,
         "requester_user_name" : update.effective_user.name,
         "canteen" : context.user_data[MainMenu.CANTEEN],
@@ -158,31 +119,16 @@ async def requesterPrice(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Store the input of the requester's request into user_data.
     context.user_data[MainMenu.REQUEST_MADE] = request
     
-    # Put details of request into local python DS.
-    MainMenu.available_requests.append(request)
-    
-    # Put item in table
-    response = put_item(table,
-                        columns,
-                        RequestID,
-                        str(update.effective_user.id),
-                        update.effective_user.name,
-                        context.user_data[MainMenu.CANTEEN], 
-                        context.user_data[MainMenu.FOOD], 
-                        context.user_data[MainMenu.OFFER_PRICE],
-                        "",
-                        "",
-                        "Available",
-                        "false",
-                        "false")
-
-    await update.message.reply_text(parse_mode="HTML", 
-                                    text="Request placed! \n<b><u>Summary</u></b>" + 
-                                    "\nCanteen: " + MainMenu.canteenDict[context.user_data[MainMenu.CANTEEN]] + 
-                                    "\nFood: " + context.user_data[MainMenu.FOOD] +
-                                    "\nTip Amount: $" + str(context.user_data[MainMenu.OFFER_PRICE]))
+    # Store the request, as it is stored in the table (chat_id as a string).
+    storedRequest = dict(request, requester_chat_id = str(update.effective_user.id))
+    await Storage.requestStore.create(storedRequest)
+
+    # Add the request to the index of open requests.
+    OpenRequests.index.add(storedRequest)
+
+    await update.message.reply_text(parse_mode="HTML", text=summaryOf("Request placed!", context))
     
-    await update.message.reply_text("We will notify and connect you with a fulfiller when found. \n\nTo cancel and delete your current request, use the /cancel command. \n\nTo edit your current request, the use /edit command.")
+    await update.message.reply_text(UserInterface.AWAITING_FULFILLER_TEXT)
 
     return MainMenu.AWAIT_FULFILLER
 
@@ -194,32 +140,28 @@ async def editCanteenPrompt(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Store information about their role.
     logger.info("Requester '%s' (chat_id: '%s') is modifying their request (canteen)", update.effective_user.name, update.effective_user.id)
 
-    # Define the canteens using a 2D array.
-    inlineCanteen = [
-        [InlineKeyboardButton("The Deck", callback_data="deck")],
-        [InlineKeyboardButton("Frontier", callback_data="frontier")],
-        [InlineKeyboardButton("Fine Foods", callback_data="fine_foods")],
-        [InlineKeyboardButton("Flavours @ Utown", callback_data="flavours")],
-        [InlineKeyboardButton("TechnoEdge", callback_data="technoedge")],
-        [InlineKeyboardButton("PGPR", callback_data="pgpr")],
-    ]
-
-    # Transform the 2D array into an actual inline keyboard that can be interpreted by Telegram.
-    inlineCanteenTG = InlineKeyboardMarkup(inlineCanteen)
-
-    await update.callback_query.message.reply_text("Which canteen would you like to change to?", reply_markup=inlineCanteenTG)
+    await update.callback_query.message.reply_text("Which canteen would you like to change to?", reply_markup=UserInterface.canteenKeyboard)
 
     return MainMenu.EDIT_CANTEEN
 
 async def editCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Get the canteen selected from the requester and update the user_data
-    context.user_data[MainMenu.CANTEEN] = update.callback_query.data
-
     # Once the user clicks a button, we need to "answer" the CallbackQuery.
     await update.callback_query.answer()
 
+    # Nobody can buy food at a closed canteen (or one removed from the catalogue), so ask for another one.
+    canteen = Canteens.get(update.callback_query.data)
+
+    if canteen is None or not canteen.isOpen(Canteens.now()):
+        hours = f" (today: {canteen.hoursOn(Canteens.now())})" if canteen is not None else ""
+        await update.callback_query.message.reply_text(f"{UserInterface.canteenName(update.callback_query.data)} is not open now{hours}. Please select another canteen.",
+                                                       reply_markup=UserInterface.canteenKeyboard)
+        return MainMenu.EDIT_CANTEEN
+
+    # Get the canteen selected from the requester and update the user_data
+    context.user_data[MainMenu.CANTEEN] = update.callback_query.data
+
     # Let user know their selected canteen.
-    await update.callback_query.message.reply_text(text=f"You have changed your canteen to '{MainMenu.canteenDict[update.callback_query.data]}'")
+    await update.callback_query.message.reply_text(text=f"You have changed your canteen to '{UserInterface.canteenName(update.callback_query.data)}'")
 
     # Store information about their canteen.
     logger.info("Requester '%s' (chat_id: '%s') their canteen to '%s'.", update.effective_user.name, update.effective_user.id, context.user_data[MainMenu.CANTEEN])
@@ -227,25 +169,12 @@ async def editCanteen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     # Get the specific request from the list of requests of the selected canteen via the requestIndex.
     request = context.user_data[MainMenu.REQUEST_MADE]
 
-    response = DynamoDB.table.update_item(
-        Key = {
-            "RequestID": request["RequestID"]
-        },
-        UpdateExpression = "SET canteen = :new_canteen",
-        ExpressionAttributeValues = {
-            ":new_canteen" : str(context.user_data[MainMenu.CANTEEN])
-        }
-    )
+    await Storage.requestStore.updateFields(request["RequestID"], canteen = str(context.user_data[MainMenu.CANTEEN]))
+    OpenRequests.index.update(request["RequestID"], canteen = str(context.user_data[MainMenu.CANTEEN]))
 
-    logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    await update.callback_query.message.reply_text(parse_mode="HTML", text=summaryOf("Canteen changed! Here is your updated request:", context))
 
-    await update.callback_query.message.reply_text(parse_mode="HTML", 
-                                    text="Canteen changed! Here is your updated request: \n<b><u>Summary</u></b>" + 
-                                    "\nCanteen: " + MainMenu.canteenDict[context.user_data[MainMenu.CANTEEN]] + 
-                                    "\nFood: " + context.user_data[MainMenu.FOOD] +
-                                    "\nTip Amount: $" + str(context.user_data[MainMenu.OFFER_PRICE]))
-
-    await update.callback_query.message.reply_text("We will notify and connect you with a fulfiller when found. \n\nTo cancel and delete your current request, use the /cancel command. \n\nTo edit your current request, the use /edit command.")
+    await update.callback_query.message.reply_text(UserInterface.AWAITING_FULFILLER_TEXT)
 
     return END_EDITING
 
@@ -274,25 +203,12 @@ async def editFood(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Get the request of the requester stored in user_data
     request = context.user_data[MainMenu.REQUEST_MADE]
 
-    response = DynamoDB.table.update_item(
-        Key = {
-            "RequestID": request["RequestID"]
-        },
-        UpdateExpression = "SET food = :new_food",
-        ExpressionAttributeValues = {
-            ":new_food" : str(context.user_data[MainMenu.FOOD])
-        }
-    )
-
-    logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+    await Storage.requestStore.updateFields(request["RequestID"], food = str(context.user_data[MainMenu.FOOD]))
+    OpenRequests.index.update(request["RequestID"], food = str(context.user_data[MainMenu.FOOD]))
 
-    await update.message.reply_text(parse_mode="HTML", 
-                                    text="Requested food changed! Here is your updated request: \n<b><u>Summary</u></b>" + 
-                                    "\nCanteen: " + MainMenu.canteenDict[context.user_data[MainMenu.CANTEEN]] + 
-                                    "\nFood: " + context.user_data[MainMenu.FOOD] +
-                                    "\nTip Amount: $" + str(context.user_data[MainMenu.OFFER_PRICE]))
+    await update.message.reply_text(parse_mode="HTML", text=summaryOf("Requested food changed! Here is your updated request:", context))
 
-    await update.message.reply_text("We will notify and connect you with a fulfiller when found. \n\n To cancel and delete your current request, use the /cancel command. \n\n To edit your current request, the use /edit command.")
+    await update.message.reply_text(UserInterface.AWAITING_FULFILLER_TEXT)
 
     return END_EDITING
 
@@ -326,24 +242,11 @@ async def editTip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Get the request of the requester stored in user_data
     request = context.user_data[MainMenu.REQUEST_MADE]
 
-    response = DynamoDB.table.update_item(
-        Key = {
-            "RequestID": request["RequestID"]
-        },
-        UpdateExpression = "SET tip_amount = :new_tip",
-        ExpressionAttributeValues = {
-            ":new_tip" : str(context.user_data[MainMenu.OFFER_PRICE])
-        }
-    )
-
-    logger.info("DynamoDB update_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
-    await update.message.reply_text(parse_mode="HTML", 
-                                    text="Tip amount changed! Here is your updated request: \n<b><u>Summary</u></b>" + 
-                                    "\nCanteen: " + MainMenu.canteenDict[context.user_data[MainMenu.CANTEEN]] + 
-                                    "\nFood: " + context.user_data[MainMenu.FOOD] +
-                                    "\nTip Amount: $" + str(context.user_data[MainMenu.OFFER_PRICE]))
-
-    await update.message.reply_text("We will notify and connect you with a fulfiller when found. \n\n To cancel and delete your current request, use the /cancel command. \n\n To edit your current request, the use /edit command.")
+    await Storage.requestStore.updateFields(request["RequestID"], tip_amount = str(context.user_data[MainMenu.OFFER_PRICE]))
+    OpenRequests.index.update(request["RequestID"], tip_amount = str(context.user_data[MainMenu.OFFER_PRICE]))
+
+    await update.message.reply_text(parse_mode="HTML", text=summaryOf("Tip amount changed! Here is your updated request:", context))
+
+    await update.message.reply_text(UserInterface.AWAITING_FULFILLER_TEXT)
 
     return END_EDITING
\ No newline at end of file
@@ -0,0 +1,277 @@
+from telegram.error import NetworkError, RetryAfter, TelegramError, TimedOut
+from collections import deque
+from datetime import timedelta
+
+import asyncio
+import itertools
+import logging
+import Settings
+import time
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# Whether messages to other users are sent through the outbound queue. If disabled, they are sent straight away.
+enabled = Settings.config.getboolean("send_queue", "enabled", fallback = True)
+
+# Telegram allows a bot about 30 messages per second overall, and about 1 message per second in the same chat.
+global_rate = Settings.config.getfloat("send_queue", "global_rate", fallback = 30)
+chat_rate = Settings.config.getfloat("send_queue", "chat_rate", fallback = 1)
+
+# Number of messages a chat may receive in a short burst before chat_rate applies.
+chat_burst = Settings.config.getint("send_queue", "chat_burst", fallback = 3)
+
+# Maximum number of Bot API calls waiting for a response at the same time.
+max_in_flight = Settings.config.getint("send_queue", "max_in_flight", fallback = 8)
+
+# Number of times a message is retried after a flood limit (RetryAfter) or network error before it is dropped.
+max_retries = Settings.config.getint("send_queue", "max_retries", fallback = 5)
+
+# Priority lanes. Lower values are sent first; messages in the same lane are sent in the order they were queued.
+NOTIFICATION = 0    # Match, end of conversation and order complete notifications.
+REPLY = 1           # Replies to the user's own command.
+RELAY = 2           # Chat messages relayed between the requester and the fulfiller.
+
+# The running queue, or None if it is disabled or not started yet. Set by start().
+outbox = None
+
+####################################### Token Bucket #######################################
+
+# Allows rate events per second on average, with bursts of up to capacity events.
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until a token is available, or 0 if one is available now.
+    def waitTime(self, now):
+        self.refill(now)
+
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+    def isFull(self, now):
+        self.refill(now)
+
+        return self.tokens >= self.capacity
+
+####################################### Outbound Queue #######################################
+
+# A Bot API call waiting in the queue.
+class OutboundMessage:
+    def __init__(self, method, chat_id, kwargs):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.attempts = 0
+
+        # Resolves to the sent Message, or None if the message could not be sent.
+        self.future = asyncio.get_running_loop().create_future()
+
+# Sends messages in priority order while staying under Telegram's global and per-chat flood limits.
+# Messages to the same chat are sent one at a time, so they arrive in the order they were queued within each lane.
+# A RetryAfter from Telegram pauses the whole queue for the time it asks for, and the message is sent again.
+class OutboundQueue:
+    def __init__(self, bot):
+        self.bot = bot
+
+        # Entries are (priority, sequence, message). The sequence keeps the lanes first in, first out.
+        self.queue = asyncio.PriorityQueue()
+        self.sequence = itertools.count()
+
+        self.globalBucket = TokenBucket(global_rate, global_rate)
+        self.chatBuckets = {}
+
+        # Chats with a message being sent or waiting for their bucket, and the entries queued behind it.
+        self.busyChats = set()
+        self.parked = {}
+
+        # No message is sent before this time (time.monotonic()) after Telegram answers with RetryAfter.
+        self.pausedUntil = 0
+
+        self.inFlight = asyncio.Semaphore(max_in_flight)
+        self.worker = None
+
+        # The running deliver() tasks. The event loop only keeps weak references to tasks, so they are kept here until they finish.
+        self.deliveries = set()
+
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def put(self, priority, method, chat_id, kwargs):
+        message = OutboundMessage(method, chat_id, kwargs)
+        self.queue.put_nowait((priority, next(self.sequence), message))
+
+        return message.future
+
+    def start(self):
+        self.worker = asyncio.create_task(self.run())
+
+    # Wait up to timeout seconds for the queued messages to be sent, then stop the worker.
+    async def stop(self, timeout = 5):
+        deadline = time.monotonic() + timeout
+
+        while (not self.queue.empty() or self.busyChats) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        if self.worker is not None:
+            self.worker.cancel()
+
+        logger.info("Outbound queue stopped: %s sent, %s retried, %s dropped, %s still queued", self.sent, self.retried, self.dropped, self.queue.qsize())
+
+    def chatBucket(self, chat_id):
+        bucket = self.chatBuckets.get(chat_id)
+
+        if bucket is None:
+            # Forget the chats that have been quiet long enough for their bucket to refill.
+            if len(self.chatBuckets) >= 10000:
+                now = time.monotonic()
+                self.chatBuckets = {chat: bucket for chat, bucket in self.chatBuckets.items() if not bucket.isFull(now)}
+
+            bucket = self.chatBuckets[chat_id] = TokenBucket(chat_rate, chat_burst)
+
+        return bucket
+
+    # Let the chat's next message through, queueing again the entry to retry (if any) and the entries parked behind it.
+    def release(self, chat_id, retryEntry = None):
+        self.busyChats.discard(chat_id)
+
+        if retryEntry is not None:
+            self.queue.put_nowait(retryEntry)
+
+        for entry in self.parked.pop(chat_id, ()):
+            self.queue.put_nowait(entry)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            entry = await self.queue.get()
+            priority, sequence, message = entry
+
+            # Keep the chat's messages in order: wait until the one before it has been sent.
+            if message.chat_id in self.busyChats:
+                self.parked.setdefault(message.chat_id, deque()).append(entry)
+                continue
+
+            now = time.monotonic()
+            globalWait = max(self.pausedUntil - now, self.globalBucket.waitTime(now))
+
+            # Every chat is held up, so put the entry back and wait. A more urgent message may be sent first afterwards.
+            if globalWait > 0:
+                self.queue.put_nowait(entry)
+                await asyncio.sleep(globalWait)
+                continue
+
+            chatBucket = self.chatBucket(message.chat_id)
+            chatWait = chatBucket.waitTime(now)
+
+            # Only this chat is held up, so the other chats carry on in the meantime.
+            if chatWait > 0:
+                self.busyChats.add(message.chat_id)
+                loop.call_later(chatWait, self.release, message.chat_id, entry)
+                continue
+
+            self.globalBucket.take(now)
+            chatBucket.take(now)
+            self.busyChats.add(message.chat_id)
+
+            await self.inFlight.acquire()
+
+            delivery = asyncio.create_task(self.deliver(entry))
+            self.deliveries.add(delivery)
+            delivery.add_done_callback(self.deliveries.discard)
+
+    async def deliver(self, entry):
+        priority, sequence, message = entry
+        message.attempts += 1
+        retryDelay = None
+
+        try:
+            result = await getattr(self.bot, message.method)(chat_id = message.chat_id, **message.kwargs)
+            message.future.set_result(result)
+            self.sent += 1
+        except RetryAfter as error:
+            seconds = error.retry_after.total_seconds() if isinstance(error.retry_after, timedelta) else error.retry_after
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+            logger.warning("Telegram asked to retry after %ss (chat_id: '%s')", seconds, message.chat_id)
+            retryDelay = 0
+        except TimedOut:
+            # The message may have been delivered already, so it is not sent again.
+            logger.warning("Timed out sending %s to chat_id '%s'", message.method, message.chat_id)
+            self.drop(message)
+        except NetworkError as error:
+            logger.warning("Network error sending %s to chat_id '%s': %s", message.method, message.chat_id, error)
+            retryDelay = min(30, 0.5 * (2 ** message.attempts))
+        except TelegramError as error:
+            # e.g. the user has blocked the bot. Retrying will not help.
+            logger.error("Failed to send %s to chat_id '%s': %s", message.method, message.chat_id, error)
+            self.drop(message)
+        except Exception:
+            logger.exception("Failed to send %s to chat_id '%s'", message.method, message.chat_id)
+            self.drop(message)
+        finally:
+            self.inFlight.release()
+
+            # Whatever happened, the chat is let through again, or the messages parked behind this one would never be sent.
+            self.settle(entry, retryDelay)
+
+    # Let the chat's next message through once a message has been sent or dropped, or retry the message after retryDelay seconds.
+    def settle(self, entry, retryDelay):
+        priority, sequence, message = entry
+
+        if retryDelay is None:
+            self.release(message.chat_id)
+        elif message.attempts > max_retries:
+            logger.error("Giving up sending %s to chat_id '%s' after %s attempts", message.method, message.chat_id, message.attempts)
+            self.drop(message)
+            self.release(message.chat_id)
+        else:
+            self.retried += 1
+            asyncio.get_running_loop().call_later(retryDelay, self.release, message.chat_id, entry)
+
+    def drop(self, message):
+        self.dropped += 1
+
+        if not message.future.done():
+            message.future.set_result(None)
+
+####################################### Helper Functions #######################################
+
+# Send a message through the outbound queue with the given priority. Returns as soon as the message is queued,
+# with a future for the sent Message. If the queue is disabled, the message is sent straight away instead.
+async def sendMessage(context, priority, **kwargs):
+    if outbox is None:
+        return await context.bot.send_message(**kwargs)
+
+    chat_id = kwargs.pop("chat_id")
+
+    return outbox.put(priority, "send_message", chat_id, kwargs)
+
+# Start the outbound queue. Used as the Application's post_init.
+async def start(application):
+    global outbox
+
+    if not enabled:
+        return
+
+    outbox = OutboundQueue(application.bot)
+    outbox.start()
+
+    logger.info("Outbound queue started: %s messages/s overall, %s messages/s per chat", global_rate, chat_rate)
+
+# Send what is left in the queue and stop it. Used as the Application's post_stop.
+async def stop(application):
+    if outbox is not None:
+        await outbox.stop()
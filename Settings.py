@@ -0,0 +1,18 @@
+# Settings shared by every module. config.ini is read, and logging is configured, once when this module is first imported.
+
+import configparser
+import logging
+
+####################################### Parameters #######################################
+
+# Create config parser and read config file
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# Load bot token
+bot_token = config["bot_keys"]["current_bot_token"]
+
+# Enable logging
+logging.basicConfig(
+    format="%(asctime)s | %(name)s | %(levelname)s | %(message)s", level=logging.INFO
+)
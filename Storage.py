@@ -0,0 +1,856 @@
+import abc
+import asyncio
+import json
+import logging
+import Settings
+import random
+import secrets
+import sqlite3
+import threading
+import time
+import BlockingIO
+import DynamoDB
+
+####################################### Parameters #######################################
+
+logger = logging.getLogger(__name__)
+
+# Where requests and ratings are stored: "dynamodb" (default), "memory" (lost on restart) or "sqlite".
+# "memory" and "sqlite" let the bot run without AWS.
+storage_backend = Settings.config.get("storage", "backend", fallback = "dynamodb")
+
+# SQLite file used by the "sqlite" backend.
+storage_path = Settings.config.get("storage", "path", fallback = "dabao4me.sqlite")
+
+# Seconds a finished request is kept after it finishes, so both users can still rate each other.
+# It is then archived by RequestExpiry, and only then deleted (by DynamoDB TTL, on the expires_at attribute, in the "dynamodb" backend).
+finished_ttl = Settings.config.getfloat("expiry", "finished_ttl", fallback = 86400)
+
+# The statuses a request ends in. A request that expired before a fulfiller claimed it is "Expired".
+FINISHED_STATUSES = ("Complete", "Closed", "Expired")
+
+# The rating counters kept for every user.
+RATING_ATTRIBUTES = ("good_given", "bad_given", "good_received", "bad_received")
+
+# Times a rating transaction cancelled by a conflicting write or throttling is retried before the error is raised.
+transaction_retries = 5
+
+# The cancellation reasons of a transaction that are worth retrying. "None" is given for the items that didn't cause the cancellation.
+RETRYABLE_CANCELLATIONS = {"None", "TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded", "RequestLimitExceeded"}
+
+####################################### Request IDs #######################################
+
+# Crockford's base32 alphabet. Its characters are in ascending order, so encoded IDs sort like the numbers they encode.
+ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# The time and random part of the last RequestID made by this process.
+lastIDTime = 0
+lastIDRandom = 0
+
+# Make a new RequestID: a ULID, i.e. the creation time in milliseconds (48 bits) followed by 80 random bits, as 26 base32 characters.
+# RequestIDs sort by creation time as plain strings. Two made in the same millisecond by this process still sort in the order
+# they were made, since the random part is incremented instead of drawn again; the random bits keep workers from colliding.
+def newRequestID():
+    global lastIDTime, lastIDRandom
+
+    now = time.time_ns() // 1000000
+
+    if now > lastIDTime:
+        lastIDTime = now
+        lastIDRandom = secrets.randbits(80)
+    else:
+        lastIDRandom += 1
+
+        # The random part ran out within one millisecond, so borrow the next one.
+        if lastIDRandom >> 80:
+            lastIDTime += 1
+            lastIDRandom = secrets.randbits(80)
+
+    value = (lastIDTime << 80) | lastIDRandom
+
+    return "".join(ID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+# The time a request was made, in milliseconds since the epoch, read from its RequestID.
+# RequestIDs made before ULIDs were "<unix timestamp>#<user id>".
+def createdAt(RequestID):
+    if "#" in RequestID:
+        return int(float(RequestID.split("#", 1)[0]) * 1000)
+
+    value = 0
+
+    for character in RequestID[:10]:
+        value = value * 32 + ID_ALPHABET.index(character)
+
+    return value
+
+# The RequestID as it is written in status_created_at, so the index sorts requests by the time they were made.
+# A ULID already does. A legacy RequestID doesn't (it starts with a digit of its unix timestamp), so its creation time is written first
+# like a ULID's, then zeros in place of the random part, then the legacy RequestID itself.
+def orderedID(RequestID):
+    if "#" not in RequestID:
+        return RequestID
+
+    created = createdAt(RequestID)
+
+    return "".join(ID_ALPHABET[(created >> shift) & 31] for shift in range(45, -1, -5)) + "0" * 16 + "#" + RequestID
+
+# The order requests are listed in: oldest first.
+def sortKey(request):
+    return (createdAt(request["RequestID"]), request["RequestID"])
+
+# The key a page of a canteen's listing continues from, in the shape of an ExclusiveStartKey of the canteen-status_created_at-index.
+def pageKey(request):
+    return {
+        "RequestID": request["RequestID"],
+        "canteen": request["canteen"],
+        "status_created_at": statusCreatedAt(request["request_status"], request["RequestID"])
+    }
+
+# The attributes to set when a request's status changes. Finished requests get an archive_at (unix time in seconds),
+# the time RequestExpiry archives them. Only requests with an archive_at are in the canteen-archive_at-index.
+def statusFields(status):
+    fields = {"request_status": status}
+
+    if status in FINISHED_STATUSES:
+        fields["archive_at"] = int(time.time() + finished_ttl)
+
+    return fields
+
+####################################### Interfaces #######################################
+
+# Every backend implements both interfaces. A backend that leaves out one of their abstract methods fails when it is created,
+# instead of in the middle of a request.
+
+# Stores the requests. Requests are dicts with the attributes written by RequesterDetails.requesterPrice.
+# changeListener, if set, is called with the (oldImage, newImage) of every write (see RequestStream.LocalStreamSource).
+class RequestStore(abc.ABC):
+    changeListener = None
+
+    # Store a new request.
+    @abc.abstractmethod
+    async def create(self, request):
+        raise NotImplementedError
+
+    # Get a request, or None if it doesn't exist.
+    @abc.abstractmethod
+    async def get(self, RequestID):
+        raise NotImplementedError
+
+    # Assign a fulfiller to a request and set it "In Progress", only if it is still "Available".
+    # Returns the claimed request, or None if it was already taken (or deleted).
+    @abc.abstractmethod
+    async def claim(self, RequestID, fulfiller_chat_id, fulfiller_user_name):
+        raise NotImplementedError
+
+    # Set the given attributes of a request.
+    @abc.abstractmethod
+    async def updateFields(self, RequestID, **fields):
+        raise NotImplementedError
+
+    async def setStatus(self, RequestID, status, **fields):
+        await self.updateFields(RequestID, **statusFields(status), **fields)
+
+    # Set a request "Expired", only if it is still "Available". Returns the expired request, or None if it was claimed (or deleted) first.
+    @abc.abstractmethod
+    async def expire(self, RequestID):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, RequestID):
+        raise NotImplementedError
+
+    # Add giver_chat_id to the request's rated_by set. Returns False if it was already there.
+    @abc.abstractmethod
+    async def markRated(self, RequestID, giver_chat_id):
+        raise NotImplementedError
+
+    # Yield the requests at a canteen with the given status, oldest first.
+    @abc.abstractmethod
+    def iterByCanteen(self, canteen, status = "Available"):
+        raise NotImplementedError
+
+    # Yield the finished requests at a canteen whose archive_at is at or before now (unix time in seconds).
+    @abc.abstractmethod
+    def iterDueForArchive(self, canteen, now):
+        raise NotImplementedError
+
+    # Called once a request is in the archive. It is deleted, or left to expire if the backend deletes requests itself.
+    @abc.abstractmethod
+    async def markArchived(self, RequestID):
+        raise NotImplementedError
+
+    # The set of canteens with requests of any status, including canteens no longer in the catalogue. May read every request.
+    @abc.abstractmethod
+    async def canteens(self):
+        raise NotImplementedError
+
+    # Get up to limit available requests at a canteen, starting after startKey (from the start if None).
+    # Returns the requests and the key to start the next page from, or None if this is the last page.
+    @abc.abstractmethod
+    async def pageByCanteen(self, canteen, startKey, limit):
+        raise NotImplementedError
+
+    # Yield the available requests made by a requester.
+    @abc.abstractmethod
+    def iterByRequester(self, requester_chat_id):
+        raise NotImplementedError
+
+# Stores the rating counters of every user, keyed by user_chat_id.
+class RatingStore(abc.ABC):
+    # Get the rating items of many users at once, as a dict of user_chat_id -> item. Users without ratings are left out.
+    @abc.abstractmethod
+    async def getMany(self, chat_ids):
+        raise NotImplementedError
+
+    # Add counts (attribute -> increment) to a user's counters.
+    @abc.abstractmethod
+    async def increment(self, chat_id, counts):
+        raise NotImplementedError
+
+    # Atomically mark a request as rated by the giver and count the rating ("good" or "bad") for both users.
+    # Returns False, and counts nothing, if the giver had already rated the request.
+    @abc.abstractmethod
+    async def recordRating(self, RequestID, giver_chat_id, receiver_chat_id, ratingName):
+        raise NotImplementedError
+
+# The increments of one rating, per user. A user who rates their own request gets both counts in one entry.
+def ratingIncrements(giver_chat_id, receiver_chat_id, ratingName):
+    increments = {}
+    increments.setdefault(str(giver_chat_id), {})[f"{ratingName}_given"] = 1
+    increments.setdefault(str(receiver_chat_id), {})[f"{ratingName}_received"] = 1
+
+    return increments
+
+####################################### DynamoDB Backend #######################################
+
+# The sort key of the canteen-status_created_at-index and requester_chat_id-status_created_at-index: the request's status, then its
+# RequestID (see orderedID()), which sorts by creation time. Querying with begins_with "Available#" returns the open requests already oldest first.
+# It only depends on the status and the RequestID, so it can be set by any update that changes the status without reading the request first.
+def statusCreatedAt(status, RequestID):
+    return f"{status}#{orderedID(RequestID)}"
+
+class DynamoDBRequestStore(RequestStore):
+    def __init__(self, table):
+        self.table = table
+
+    # The change listener is attached to the AsyncTable, which sees every write.
+    @property
+    def changeListener(self):
+        return self.table.changeListener
+
+    @changeListener.setter
+    def changeListener(self, listener):
+        self.table.changeListener = listener
+
+    async def create(self, request):
+        response = await self.table.put_item(Item = dict(request, status_created_at = statusCreatedAt(request["request_status"], request["RequestID"])))
+
+        logger.info("DynamoDB put_item response for RequestID '%s': '%s'", request["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
+
+    async def get(self, RequestID):
+        response = await self.table.get_item(Key = {"RequestID": RequestID})
+
+        logger.info("DynamoDB get_item response for RequestID '%s': '%s'", RequestID, response["ResponseMetadata"]["HTTPStatusCode"])
+
+        return response.get("Item")
+
+    async def claim(self, RequestID, fulfiller_chat_id, fulfiller_user_name):
+        # The update only goes through if the request is still "Available", so exactly one of several fulfillers wins.
+        from botocore.exceptions import ClientError
+
+        try:
+            response = await self.table.update_item(
+                Key = {
+                    "RequestID": RequestID
+                },
+                UpdateExpression = "SET fulfiller_chat_id = :chat_id, fulfiller_user_name = :user_name, request_status = :status, status_created_at = :status_created_at",
+                ConditionExpression = "request_status = :available",
+                ExpressionAttributeValues = {
+                    ":chat_id" : str(fulfiller_chat_id),
+                    ":user_name" : fulfiller_user_name,
+                    ":status" : "In Progress",
+                    ":status_created_at" : statusCreatedAt("In Progress", RequestID),
+                    ":available" : "Available"
+                },
+                ReturnValues = "ALL_NEW"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+
+        logger.info("DynamoDB update_item response for RequestID '%s': '%s'", RequestID, response["ResponseMetadata"]["HTTPStatusCode"])
+
+        return response["Attributes"]
+
+    async def updateFields(self, RequestID, **fields):
+        response = await self.table.update_item(
+            Key = {
+                "RequestID": RequestID
+            },
+            UpdateExpression = "SET " + ", ".join(f"#{name} = :{name}" for name in fields),
+            ExpressionAttributeNames = {f"#{name}": name for name in fields},
+            ExpressionAttributeValues = {f":{name}": value for name, value in fields.items()}
+        )
+
+        logger.info("DynamoDB update_item response for RequestID '%s': '%s'", RequestID, response["ResponseMetadata"]["HTTPStatusCode"])
+
+    # The index sort key moves with the status, so the request leaves (or joins) the "Available" listings.
+    async def setStatus(self, RequestID, status, **fields):
+        await self.updateFields(RequestID, status_created_at = statusCreatedAt(status, RequestID), **statusFields(status), **fields)
+
+    async def expire(self, RequestID):
+        from botocore.exceptions import ClientError
+
+        fields = dict(statusFields("Expired"), status_created_at = statusCreatedAt("Expired", RequestID))
+
+        values = {f":{name}": value for name, value in fields.items()}
+        values[":available"] = "Available"
+
+        try:
+            response = await self.table.update_item(
+                Key = {"RequestID": RequestID},
+                UpdateExpression = "SET " + ", ".join(f"#{name} = :{name}" for name in fields),
+                ConditionExpression = "request_status = :available",
+                ExpressionAttributeNames = {f"#{name}": name for name in fields},
+                ExpressionAttributeValues = values,
+                ReturnValues = "ALL_NEW"
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+
+        return response["Attributes"]
+
+    async def delete(self, RequestID):
+        response = await self.table.delete_item(Key = {"RequestID": RequestID})
+
+        logger.info("DynamoDB delete_item response for RequestID '%s': '%s'", RequestID, response["ResponseMetadata"]["HTTPStatusCode"])
+
+    async def markRated(self, RequestID, giver_chat_id):
+        from botocore.exceptions import ClientError
+
+        try:
+            await self.table.update_item(
+                Key = {"RequestID": RequestID},
+                UpdateExpression = "ADD rated_by :giverSet",
+                ConditionExpression = "attribute_exists(RequestID) AND NOT contains(rated_by, :giver)",
+                ExpressionAttributeValues = {":giverSet": {str(giver_chat_id)}, ":giver": str(giver_chat_id)}
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+            return False
+
+        return True
+
+    def canteenQuery(self, canteen, status = "Available"):
+        return {
+            "IndexName": "canteen-status_created_at-index",
+            "KeyConditionExpression": "canteen = :canteen AND begins_with(status_created_at, :status)",
+            "ExpressionAttributeValues": {":canteen": canteen, ":status": f"{status}#"}
+        }
+
+    def iterByCanteen(self, canteen, status = "Available"):
+        return self.table.query_items(**self.canteenQuery(canteen, status))
+
+    # Only finished requests have an archive_at, so this sparse index holds nothing else and the query only reads what is due.
+    def iterDueForArchive(self, canteen, now):
+        return self.table.query_items(
+            IndexName = "canteen-archive_at-index",
+            KeyConditionExpression = "canteen = :canteen AND archive_at <= :now",
+            ExpressionAttributeValues = {":canteen": canteen, ":now": int(now)})
+
+    # The TTL attribute is only set now that the request is archived, so DynamoDB never deletes a request before it is.
+    # Removing archive_at takes the request out of the archive index.
+    async def markArchived(self, RequestID):
+        await self.table.update_item(
+            Key = {"RequestID": RequestID},
+            UpdateExpression = "SET expires_at = :now REMOVE archive_at",
+            ExpressionAttributeValues = {":now": int(time.time())}
+        )
+
+    # A scan of the whole table, reading only the canteen of each request.
+    async def canteens(self):
+        scanArgs = {"ProjectionExpression": "canteen"}
+        canteens = set()
+
+        while True:
+            response = await self.table.scan(**scanArgs)
+            canteens.update(item["canteen"] for item in response["Items"])
+
+            if "LastEvaluatedKey" not in response:
+                return canteens
+
+            scanArgs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    async def pageByCanteen(self, canteen, startKey, limit):
+        # Read one extra request to find out whether there is a next page.
+        queryArgs = dict(self.canteenQuery(canteen), Limit = limit + 1)
+
+        if startKey is not None:
+            queryArgs["ExclusiveStartKey"] = startKey
+
+        requests = [request async for request in self.table.query_items(max_items = limit + 1, **queryArgs)]
+
+        if len(requests) > limit:
+            requests = requests[:limit]
+            return requests, pageKey(requests[-1])
+
+        return requests, None
+
+    def iterByRequester(self, requester_chat_id):
+        return self.table.query_items(
+            IndexName = "requester_chat_id-status_created_at-index",
+            KeyConditionExpression = "requester_chat_id = :chat_id AND begins_with(status_created_at, :status)",
+            ExpressionAttributeValues = {":chat_id": str(requester_chat_id), ":status": "Available#"})
+
+class DynamoDBRatingStore(RatingStore):
+    def __init__(self, table, requestTableName):
+        self.table = table
+        self.requestTableName = requestTableName
+
+    async def getMany(self, chat_ids):
+        items = await self.table.batch_get_items([{"user_chat_id": str(chat_id)} for chat_id in chat_ids])
+
+        logger.info("User Ratings Table batch_get_items returned %s items", len(items))
+
+        return {item["user_chat_id"]: item for item in items}
+
+    async def increment(self, chat_id, counts):
+        attributes = sorted(counts)
+
+        await self.table.update_item(
+            Key = {"user_chat_id": str(chat_id)},
+            UpdateExpression = "ADD " + ", ".join(f"{attribute} :{attribute}" for attribute in attributes),
+            ExpressionAttributeValues = {f":{attribute}": counts[attribute] for attribute in attributes}
+        )
+
+    # One TransactWriteItems call: the request's rated_by set and both users' counters are updated together,
+    # so a crash can't leave them inconsistent. A transaction may only touch each item once, which
+    # ratingIncrements() takes care of when the giver is also the receiver.
+    async def recordRating(self, RequestID, giver_chat_id, receiver_chat_id, ratingName):
+        markRated = {"Update": {
+            "TableName": self.requestTableName,
+            "Key": {"RequestID": RequestID},
+            "UpdateExpression": "ADD rated_by :giverSet",
+            "ConditionExpression": "attribute_exists(RequestID) AND NOT contains(rated_by, :giver)",
+            "ExpressionAttributeValues": {":giverSet": {str(giver_chat_id)}, ":giver": str(giver_chat_id)}
+        }}
+
+        ratingUpdates = [{"Update": {
+            "TableName": self.table.syncTable.name,
+            "Key": {"user_chat_id": chat_id},
+            "UpdateExpression": "ADD " + ", ".join(f"{attribute} :inc" for attribute in counts),
+            "ExpressionAttributeValues": {":inc": 1}
+        }} for chat_id, counts in ratingIncrements(giver_chat_id, receiver_chat_id, ratingName).items()]
+
+        from botocore.exceptions import ClientError
+
+        attempt = 0
+
+        while True:
+            try:
+                response = await DynamoDB.transactWriteItems([markRated] + ratingUpdates)
+                break
+            except ClientError as error:
+                if error.response["Error"]["Code"] != "TransactionCanceledException":
+                    raise
+
+                # One reason per transact item, in order. Item 0 is the request: its condition failing means the giver has already rated it.
+                reasons = [reason.get("Code") for reason in error.response.get("CancellationReasons", [])]
+
+                if reasons and reasons[0] == "ConditionalCheckFailed":
+                    return False
+
+                # e.g. the requester and the fulfiller rating the same request at the same time (TransactionConflict), or throttling.
+                # Retrying is safe: the condition on the request keeps the rating from being counted twice.
+                attempt += 1
+
+                if attempt > transaction_retries or not reasons or not set(reasons) <= RETRYABLE_CANCELLATIONS:
+                    raise
+
+                logger.warning("Rating transaction for RequestID '%s' was cancelled (%s), retrying", RequestID, ", ".join(reasons))
+
+                await asyncio.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+
+        logger.info("DynamoDB transact_write_items response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
+
+        return True
+
+####################################### In-Memory Backend #######################################
+
+# Keeps everything in dicts on the event loop, so every operation is atomic. Lost on restart.
+class MemoryRequestStore(RequestStore):
+    def __init__(self):
+        self.items = {}
+
+    def write(self, RequestID, newImage):
+        oldImage = self.items.get(RequestID)
+
+        if newImage is None:
+            self.items.pop(RequestID, None)
+        else:
+            self.items[RequestID] = newImage
+
+        if self.changeListener is not None:
+            self.changeListener(dict(oldImage) if oldImage else None, dict(newImage) if newImage else None)
+
+    async def create(self, request):
+        self.write(request["RequestID"], dict(request))
+
+    async def get(self, RequestID):
+        item = self.items.get(RequestID)
+
+        return dict(item) if item is not None else None
+
+    async def claim(self, RequestID, fulfiller_chat_id, fulfiller_user_name):
+        item = self.items.get(RequestID)
+
+        if item is None or item["request_status"] != "Available":
+            return None
+
+        item = dict(item, fulfiller_chat_id = str(fulfiller_chat_id), fulfiller_user_name = fulfiller_user_name, request_status = "In Progress")
+        self.write(RequestID, item)
+
+        return dict(item)
+
+    async def updateFields(self, RequestID, **fields):
+        if RequestID in self.items:
+            self.write(RequestID, dict(self.items[RequestID], **fields))
+
+    async def delete(self, RequestID):
+        if RequestID in self.items:
+            self.write(RequestID, None)
+
+    async def markRated(self, RequestID, giver_chat_id):
+        item = self.items.get(RequestID)
+
+        if item is None or str(giver_chat_id) in item.get("rated_by", set()):
+            return False
+
+        self.write(RequestID, dict(item, rated_by = item.get("rated_by", set()) | {str(giver_chat_id)}))
+
+        return True
+
+    async def expire(self, RequestID):
+        item = self.items.get(RequestID)
+
+        if item is None or item["request_status"] != "Available":
+            return None
+
+        item = dict(item, **statusFields("Expired"))
+        self.write(RequestID, item)
+
+        return dict(item)
+
+    def withStatus(self, status, attribute, value):
+        return sorted((dict(item) for item in self.items.values() if item["request_status"] == status and item[attribute] == value), key = sortKey)
+
+    def available(self, attribute, value):
+        return self.withStatus("Available", attribute, value)
+
+    async def iterByCanteen(self, canteen, status = "Available"):
+        for request in self.withStatus(status, "canteen", canteen):
+            yield request
+
+    async def iterDueForArchive(self, canteen, now):
+        due = [dict(item) for item in self.items.values() if item["canteen"] == canteen and "archive_at" in item and item["archive_at"] <= now]
+
+        for request in sorted(due, key = lambda request: request["archive_at"]):
+            yield request
+
+    async def markArchived(self, RequestID):
+        await self.delete(RequestID)
+
+    async def canteens(self):
+        return {item["canteen"] for item in self.items.values()}
+
+    async def pageByCanteen(self, canteen, startKey, limit):
+        requests = self.available("canteen", canteen)
+
+        if startKey is not None:
+            requests = [request for request in requests if sortKey(request) > sortKey(startKey)]
+
+        if len(requests) > limit:
+            return requests[:limit], pageKey(requests[limit - 1])
+
+        return requests, None
+
+    async def iterByRequester(self, requester_chat_id):
+        for request in self.available("requester_chat_id", str(requester_chat_id)):
+            yield request
+
+class MemoryRatingStore(RatingStore):
+    def __init__(self, requestStore):
+        self.requestStore = requestStore
+        self.items = {}
+
+    async def getMany(self, chat_ids):
+        return {str(chat_id): dict(self.items[str(chat_id)]) for chat_id in chat_ids if str(chat_id) in self.items}
+
+    async def increment(self, chat_id, counts):
+        item = self.items.setdefault(str(chat_id), {"user_chat_id": str(chat_id)})
+
+        for attribute, count in counts.items():
+            item[attribute] = item.get(attribute, 0) + count
+
+    async def recordRating(self, RequestID, giver_chat_id, receiver_chat_id, ratingName):
+        # Nothing else runs on the event loop in between, so this is atomic.
+        if not await self.requestStore.markRated(RequestID, giver_chat_id):
+            return False
+
+        for chat_id, counts in ratingIncrements(giver_chat_id, receiver_chat_id, ratingName).items():
+            await self.increment(chat_id, counts)
+
+        return True
+
+####################################### SQLite Backend #######################################
+
+# A SQLite file (in WAL mode) holding both the requests and the ratings, so a rating can be recorded in one transaction.
+# The connection is used from the BlockingIO executor threads, one at a time.
+class SQLiteDatabase:
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS requests (
+                RequestID TEXT PRIMARY KEY, canteen TEXT NOT NULL, request_status TEXT NOT NULL,
+                requester_chat_id TEXT NOT NULL, sort_key TEXT NOT NULL, item TEXT NOT NULL, archive_at INTEGER)""")
+
+            # Files made before archive_at had a column: the finished requests were given an expires_at instead.
+            if "archive_at" not in {row["name"] for row in self.connection.execute("PRAGMA table_info(requests)")}:
+                self.connection.execute("ALTER TABLE requests ADD COLUMN archive_at INTEGER")
+                self.connection.execute("UPDATE requests SET archive_at = json_extract(item, '$.expires_at') WHERE request_status IN (?, ?, ?)", FINISHED_STATUSES)
+
+            self.connection.execute("CREATE INDEX IF NOT EXISTS requests_archive ON requests (canteen, archive_at) WHERE archive_at IS NOT NULL")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS requests_canteen ON requests (canteen, request_status, sort_key, RequestID)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS requests_requester ON requests (requester_chat_id, request_status, sort_key, RequestID)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS user_ratings (user_chat_id TEXT PRIMARY KEY, "
+                                    + ", ".join(f"{attribute} INTEGER NOT NULL DEFAULT 0" for attribute in RATING_ATTRIBUTES) + ")")
+
+    # Run func(connection) in one transaction on an executor thread.
+    async def run(self, func, *args):
+        def transaction():
+            with self.lock, self.connection:
+                return func(self.connection, *args)
+
+        return await BlockingIO.runInExecutor(transaction)
+
+# The sort_key column: the creation time in milliseconds, zero-padded so it sorts as text.
+def sortColumns(request):
+    created, RequestID = sortKey(request)
+
+    return f"{created:013d}", RequestID
+
+# Requests are stored as JSON, with the attributes they are looked up by copied into indexed columns.
+# rated_by is stored as a list, and numbers (e.g. tip_amount) as strings.
+def encodeRequest(item):
+    return json.dumps(dict(item, rated_by = sorted(item.get("rated_by", ()))), default = str)
+
+def decodeRequest(row):
+    item = json.loads(row["item"])
+    item["rated_by"] = set(item["rated_by"])
+
+    if not item["rated_by"]:
+        del item["rated_by"]
+
+    return item
+
+class SQLiteRequestStore(RequestStore):
+    def __init__(self, database):
+        self.database = database
+
+    @staticmethod
+    def read(connection, RequestID):
+        row = connection.execute("SELECT item FROM requests WHERE RequestID = ?", (RequestID,)).fetchone()
+
+        return decodeRequest(row) if row is not None else None
+
+    @staticmethod
+    def write(connection, RequestID, newImage):
+        oldImage = SQLiteRequestStore.read(connection, RequestID)
+
+        if newImage is None:
+            connection.execute("DELETE FROM requests WHERE RequestID = ?", (RequestID,))
+        else:
+            connection.execute("INSERT OR REPLACE INTO requests (RequestID, canteen, request_status, requester_chat_id, sort_key, item, archive_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (RequestID, newImage["canteen"], newImage["request_status"], str(newImage["requester_chat_id"]), sortColumns(newImage)[0], encodeRequest(newImage),
+                                newImage.get("archive_at")))
+
+        return oldImage, newImage
+
+    def notify(self, change):
+        if self.changeListener is not None and change is not None:
+            self.changeListener(*change)
+
+    async def create(self, request):
+        self.notify(await self.database.run(self.write, request["RequestID"], dict(request)))
+
+    async def get(self, RequestID):
+        return await self.database.run(self.read, RequestID)
+
+    async def claim(self, RequestID, fulfiller_chat_id, fulfiller_user_name):
+        def claimItem(connection):
+            item = self.read(connection, RequestID)
+
+            if item is None or item["request_status"] != "Available":
+                return None
+
+            return self.write(connection, RequestID, dict(item, fulfiller_chat_id = str(fulfiller_chat_id), fulfiller_user_name = fulfiller_user_name, request_status = "In Progress"))
+
+        change = await self.database.run(claimItem)
+        self.notify(change)
+
+        return change[1] if change is not None else None
+
+    async def expire(self, RequestID):
+        def expireItem(connection):
+            item = self.read(connection, RequestID)
+
+            if item is None or item["request_status"] != "Available":
+                return None
+
+            return self.write(connection, RequestID, dict(item, **statusFields("Expired")))
+
+        change = await self.database.run(expireItem)
+        self.notify(change)
+
+        return change[1] if change is not None else None
+
+    async def updateFields(self, RequestID, **fields):
+        def updateItem(connection):
+            item = self.read(connection, RequestID)
+
+            if item is None:
+                return None
+
+            return self.write(connection, RequestID, dict(item, **fields))
+
+        self.notify(await self.database.run(updateItem))
+
+    async def delete(self, RequestID):
+        self.notify(await self.database.run(self.write, RequestID, None))
+
+    async def markRated(self, RequestID, giver_chat_id):
+        return await self.database.run(self.markRatedIn, RequestID, giver_chat_id)
+
+    @staticmethod
+    def markRatedIn(connection, RequestID, giver_chat_id):
+        item = SQLiteRequestStore.read(connection, RequestID)
+
+        if item is None or str(giver_chat_id) in item.get("rated_by", set()):
+            return False
+
+        SQLiteRequestStore.write(connection, RequestID, dict(item, rated_by = item.get("rated_by", set()) | {str(giver_chat_id)}))
+
+        return True
+
+    async def select(self, query, *args):
+        rows = await self.database.run(lambda connection: connection.execute(query, args).fetchall())
+
+        return [decodeRequest(row) for row in rows]
+
+    async def iterByCanteen(self, canteen, status = "Available"):
+        for request in await self.select("SELECT item FROM requests WHERE canteen = ? AND request_status = ? ORDER BY sort_key, RequestID", canteen, status):
+            yield request
+
+    async def iterDueForArchive(self, canteen, now):
+        for request in await self.select("SELECT item FROM requests WHERE canteen = ? AND archive_at <= ? ORDER BY archive_at", canteen, int(now)):
+            yield request
+
+    async def markArchived(self, RequestID):
+        await self.delete(RequestID)
+
+    async def canteens(self):
+        rows = await self.database.run(lambda connection: connection.execute("SELECT DISTINCT canteen FROM requests").fetchall())
+
+        return {row["canteen"] for row in rows}
+
+    async def pageByCanteen(self, canteen, startKey, limit):
+        if startKey is None:
+            requests = await self.select("SELECT item FROM requests WHERE canteen = ? AND request_status = 'Available' "
+                                         "ORDER BY sort_key, RequestID LIMIT ?", canteen, limit + 1)
+        else:
+            requests = await self.select("SELECT item FROM requests WHERE canteen = ? AND request_status = 'Available' AND (sort_key, RequestID) > (?, ?) "
+                                         "ORDER BY sort_key, RequestID LIMIT ?", canteen, *sortColumns(startKey), limit + 1)
+
+        if len(requests) > limit:
+            requests = requests[:limit]
+            return requests, pageKey(requests[-1])
+
+        return requests, None
+
+    async def iterByRequester(self, requester_chat_id):
+        for request in await self.select("SELECT item FROM requests WHERE requester_chat_id = ? AND request_status = 'Available' ORDER BY sort_key, RequestID", str(requester_chat_id)):
+            yield request
+
+class SQLiteRatingStore(RatingStore):
+    def __init__(self, database):
+        self.database = database
+
+    async def getMany(self, chat_ids):
+        chat_ids = [str(chat_id) for chat_id in chat_ids]
+
+        if not chat_ids:
+            return {}
+
+        rows = await self.database.run(lambda connection: connection.execute(
+            f"SELECT * FROM user_ratings WHERE user_chat_id IN ({', '.join('?' for _ in chat_ids)})", chat_ids).fetchall())
+
+        return {row["user_chat_id"]: dict(row) for row in rows}
+
+    @staticmethod
+    def incrementIn(connection, chat_id, counts):
+        attributes = [attribute for attribute in counts if attribute in RATING_ATTRIBUTES]
+
+        connection.execute(f"INSERT INTO user_ratings (user_chat_id, {', '.join(attributes)}) VALUES (?{', ?' * len(attributes)}) "
+                           f"ON CONFLICT (user_chat_id) DO UPDATE SET " + ", ".join(f"{attribute} = {attribute} + excluded.{attribute}" for attribute in attributes),
+                           [str(chat_id)] + [counts[attribute] for attribute in attributes])
+
+    async def increment(self, chat_id, counts):
+        await self.database.run(self.incrementIn, chat_id, counts)
+
+    async def recordRating(self, RequestID, giver_chat_id, receiver_chat_id, ratingName):
+        def record(connection):
+            if not SQLiteRequestStore.markRatedIn(connection, RequestID, giver_chat_id):
+                return False
+
+            for chat_id, counts in ratingIncrements(giver_chat_id, receiver_chat_id, ratingName).items():
+                self.incrementIn(connection, chat_id, counts)
+
+            return True
+
+        return await self.database.run(record)
+
+####################################### Helper Functions #######################################
+
+# Create the request and rating stores of the backend selected in the [storage] section of config.ini.
+def createStores(backend):
+    if backend == "memory":
+        requestStore = MemoryRequestStore()
+        return requestStore, MemoryRatingStore(requestStore)
+    elif backend == "sqlite":
+        database = SQLiteDatabase(storage_path)
+        return SQLiteRequestStore(database), SQLiteRatingStore(database)
+
+    return DynamoDBRequestStore(DynamoDB.table), DynamoDBRatingStore(DynamoDB.userRatingsTable, DynamoDB.tableName)
+
+# Storage.requestStore and Storage.ratingStore are created the first time either is used, so importing this module
+# doesn't open the database (or import boto3) before the bot needs it.
+def __getattr__(name):
+    global requestStore, ratingStore
+
+    if name not in ("requestStore", "ratingStore"):
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+    requestStore, ratingStore = createStores(storage_backend)
+
+    logger.info("Requests and ratings are stored in the '%s' backend", storage_backend)
+
+    return globals()[name]
@@ -0,0 +1,83 @@
+# The inline keyboards and message templates the handlers reply with. They are built once, instead of on every update.
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from datetime import datetime
+
+####################################### Keyboards #######################################
+
+# Callback data of the rating buttons.
+GOOD = 1
+BAD = 0
+
+# The choice of role shown by /start.
+roleKeyboard = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Request an order", callback_data="requester")],
+    [InlineKeyboardButton("Fulfil an order", callback_data="fulfiller")],
+])
+
+# The parts of a request the requester can change with /edit.
+editRequestKeyboard = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Change Canteen Location", callback_data="editCanteen")],
+    [InlineKeyboardButton("Change Food Option", callback_data="editFood")],
+    [InlineKeyboardButton("Change Tip Amount", callback_data="editTip")]
+])
+
+# The rating options shown once an order is complete.
+ratingKeyboard = InlineKeyboardMarkup([
+    [InlineKeyboardButton("\U0001F44D", callback_data = GOOD)],
+    [InlineKeyboardButton("\U0001F44E", callback_data = BAD)]
+])
+
+# The page navigation buttons shown when browsing the requests at a canteen.
+prevPageButton = InlineKeyboardButton("« Prev", callback_data="page#prev")
+nextPageButton = InlineKeyboardButton("Next »", callback_data="page#next")
+
+# One button per canteen, in catalogue order. Set by build().
+canteenKeyboard = None
+
+# The display names of the canteens, by callback data. Set by build().
+canteenNames = {}
+
+# Build the keyboards that depend on the canteens (callback data -> display name). Called by Canteens.install() whenever the catalogue is (re)loaded.
+def build(canteens):
+    global canteenKeyboard, canteenNames
+
+    canteenNames = dict(canteens)
+    canteenKeyboard = InlineKeyboardMarkup([[InlineKeyboardButton(name, callback_data=canteen)] for canteen, name in canteens.items()])
+
+####################################### Templates #######################################
+
+# The summary of a request shown to the requester after placing or editing it.
+SUMMARY_TEMPLATE = "{heading} \n<b><u>Summary</u></b>\nCanteen: {canteen}\nFood: {food}\nTip Amount: ${tip_amount}"
+
+AWAITING_FULFILLER_TEXT = "We will notify and connect you with a fulfiller when found. \n\nTo cancel and delete your current request, use the /cancel command. \n\nTo edit your current request, the use /edit command."
+
+# One request in a fulfiller's listing, with the requester's rating.
+LISTING_TEMPLATE = """{number}) Requested on: {requested_on}
+Username / Name: {username} | {ratingPercent}% \U0001F44D out of {total} ratings.
+Canteen: {canteen}
+Food: {food}
+Tip Amount: ${tip_amount}
+
+"""
+
+# One request in a requester's own listing.
+OWN_LISTING_TEMPLATE = """{number}) Requested on: {requested_on}
+Username / Name: {username}
+Canteen: {canteen}
+Food: {food}
+Tip Amount: ${tip_amount}
+
+"""
+
+TIMESTAMP_FORMAT = "%d %b %y %I:%M %p"
+
+def canteenName(canteen):
+    return canteenNames.get(canteen, canteen)
+
+def summary(heading, canteen, food, tip_amount):
+    return SUMMARY_TEMPLATE.format(heading = heading, canteen = canteenName(canteen), food = food, tip_amount = tip_amount)
+
+# Format a time in milliseconds since the epoch (see Storage.createdAt) for a listing.
+def formatTimestamp(milliseconds):
+    return datetime.fromtimestamp(milliseconds / 1000).strftime(TIMESTAMP_FORMAT)
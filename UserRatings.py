@@ -1,87 +1,342 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler
 
-import DynamoDB
 import MainMenu
+import asyncio
+import json
 import logging
+import Settings
+import os
+import time
+import BlockingIO
 import FulfillerDetails
+import SendQueue
+import Storage
+import UserInterface
+from collections import OrderedDict, Counter
+from UserInterface import GOOD, BAD
 
 ####################################### Parameters ###########################################
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s | %(name)s | %(levelname)s | %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Define GOOD and BAD for easier readability
-GOOD = 1
-BAD = 0
 
-# Define the options using a 2D array.
-userRatingOptions = [
-    [InlineKeyboardButton("\U0001F44D", callback_data = GOOD)],
-    [InlineKeyboardButton("\U0001F44E", callback_data = BAD)]
-]
+# Size and lifetime of the in-process cache of rating summaries.
+rating_cache_size = Settings.config.getint("ratings_cache", "max_size", fallback = 10000)
+rating_cache_ttl = Settings.config.getint("ratings_cache", "ttl_seconds", fallback = 600)
+
+# How rating counts are written: "direct" (default) - in the same transaction as the rating,
+# or "write_behind" - coalesced per user in memory and flushed every flush_interval seconds or once flush_size users are pending.
+rating_write_mode = Settings.config.get("rating_writes", "mode", fallback = "direct")
+rating_flush_interval = Settings.config.getfloat("rating_writes", "flush_interval", fallback = 10)
+rating_flush_size = Settings.config.getint("rating_writes", "flush_size", fallback = 200)
+
+# Local file the pending counts of the write-behind mode are journaled to, so a crash doesn't lose them.
+rating_journal_path = Settings.config.get("rating_writes", "journal", fallback = "dabao4me_ratings.journal")
 
-# Transform the 2D array into an actual inline keyboard (IK) that can be interpreted by Telegram.
-userRatingOptionsIK = InlineKeyboardMarkup(userRatingOptions)
+# The write-behind aggregator, or None in "direct" mode. Set by startAggregator().
+aggregator = None
+
+####################################### Rating Cache #########################################
+# Bounded cache of (ratingPercent, total) summaries keyed by chat_id. Entries expire after ttl_seconds,
+# and the least recently used entry is evicted once max_size is reached.
+# All access happens on the event loop, so no locking is needed.
+class RatingCache:
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Get the cached summary of a user, or None if it is missing or has expired.
+    def get(self, chat_id):
+        entry = self.entries.get(str(chat_id))
+
+        if entry is None or entry[1] <= time.monotonic():
+            self.entries.pop(str(chat_id), None)
+            self.misses += 1
+            return None
+
+        # Mark the entry as the most recently used.
+        self.entries.move_to_end(str(chat_id))
+        self.hits += 1
+
+        return entry[0]
+
+    def put(self, chat_id, summary):
+        self.entries[str(chat_id)] = (summary, time.monotonic() + self.ttl_seconds)
+        self.entries.move_to_end(str(chat_id))
+
+        # Evict the least recently used entries once the cache is full.
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last = False)
+
+    def invalidate(self, chat_id):
+        self.entries.pop(str(chat_id), None)
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+ratingCache = RatingCache(rating_cache_size, rating_cache_ttl)
+
+####################################### Write-Behind Aggregator ##############################
+# Coalesces rating count increments per user_chat_id in memory, and writes them with one update_item per user
+# on each flush, instead of one update_item per rating.
+# Every increment is appended to a local journal before it is acknowledged, and every increment written to the rating store
+# is journaled again with the opposite sign, so replaying the journal after a crash gives back exactly the counts
+# still pending. (A crash between an update_item and its journal line can count that one user's batch twice.)
+# The journal is written on the BlockingIO executor, one batch at a time: the lines added while a batch is being written and synced
+# are written together with the next one, so there is one fsync per batch rather than per rating.
+class RatingAggregator:
+    def __init__(self, journalPath, flush_size):
+        self.journalPath = journalPath
+        self.flush_size = flush_size
+
+        # user_chat_id -> Counter of attribute -> increment not yet written to the rating store.
+        self.pending = {}
+        self.flushLock = asyncio.Lock()
+
+        # The flush started by add() once flush_size users are pending, kept so it isn't garbage-collected while it runs.
+        self.flushTask = None
+
+        # Journal lines not written yet. Only the holder of journalLock writes to (or compacts) the journal.
+        self.journalBuffer = []
+        self.journalLock = asyncio.Lock()
+
+        self.replayJournal()
+        self.journal = open(self.journalPath, "a", encoding = "utf-8")
+
+    def replayJournal(self):
+        if not os.path.exists(self.journalPath):
+            return
+
+        # The end of the last complete line.
+        end = 0
+
+        with open(self.journalPath, "rb") as journal:
+            for line in journal:
+                # A line cut short by a crash was never acknowledged, so it is skipped.
+                if not line.endswith(b"\n"):
+                    break
+
+                end += len(line)
+
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                self.addPending(entry["chat_id"], entry["counts"])
+
+        # Cut off the partial line, or the next line appended would be joined to it and lost too.
+        if end < os.path.getsize(self.journalPath):
+            os.truncate(self.journalPath, end)
+
+        logger.info("Replayed rating journal '%s': %s users pending", self.journalPath, len(self.pending))
+
+    def addPending(self, chat_id, counts):
+        pendingCounts = self.pending.setdefault(chat_id, Counter())
+        pendingCounts.update(counts)
+
+        # Drop the attributes (and users) with nothing left to write.
+        for attribute in [attribute for attribute, count in pendingCounts.items() if count == 0]:
+            del pendingCounts[attribute]
+
+        if not pendingCounts:
+            del self.pending[chat_id]
+
+    def appendLines(self, lines):
+        self.journal.write("".join(lines))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    # Append an entry to the journal, returning once it is synced to disk. The counts must already be in the pending counts,
+    # so a compaction running in the meantime writes them to the compacted journal instead.
+    async def writeJournal(self, chat_id, counts):
+        self.journalBuffer.append(json.dumps({"chat_id": chat_id, "counts": counts}) + "\n")
+
+        async with self.journalLock:
+            # Empty if the line was written with an earlier batch, or by a compaction, while this was waiting for the lock.
+            if not self.journalBuffer:
+                return
+
+            lines, self.journalBuffer = self.journalBuffer, []
+
+            try:
+                await BlockingIO.runInExecutor(self.appendLines, lines)
+            except Exception:
+                # Put the lines back so the next writer tries them again, and none of them is acknowledged.
+                self.journalBuffer[:0] = lines
+                raise
+
+    async def add(self, chat_id, counts):
+        self.addPending(str(chat_id), counts)
+        await self.writeJournal(str(chat_id), counts)
+
+        if len(self.pending) >= self.flush_size and not self.flushLock.locked() and (self.flushTask is None or self.flushTask.done()):
+            self.flushTask = asyncio.create_task(self.flush())
+
+    async def flushUser(self, chat_id, counts):
+        await Storage.ratingStore.increment(chat_id, counts)
+
+        # The counts are in the rating store now, so take them off the pending counts and the journal.
+        written = {attribute: -count for attribute, count in counts.items()}
+        self.addPending(chat_id, written)
+        await self.writeJournal(chat_id, written)
+
+        ratingCache.invalidate(chat_id)
+
+    async def flush(self, context = None):
+        async with self.flushLock:
+            if not self.pending:
+                return
+
+            batch = {chat_id: dict(counts) for chat_id, counts in self.pending.items()}
+            results = await asyncio.gather(*(self.flushUser(chat_id, counts) for chat_id, counts in batch.items()), return_exceptions = True)
+
+            failed = sum(isinstance(result, Exception) for result in results)
+
+            # Counts that failed to be written stay pending and are retried on the next flush.
+            logger.info("Flushed rating counts of %s users (%s failed)", len(batch) - failed, failed)
+
+            try:
+                await self.compactJournal()
+            except Exception:
+                logger.exception("Failed to compact the rating journal '%s'", self.journalPath)
+
+    # Rewrite the journal with only the counts still pending, so it doesn't grow without bound.
+    # The pending counts include those of the lines not written yet, so those lines are covered by the compacted journal.
+    async def compactJournal(self):
+        async with self.journalLock:
+            lines = [json.dumps({"chat_id": chat_id, "counts": dict(counts)}) + "\n" for chat_id, counts in self.pending.items()]
+            buffered, self.journalBuffer = self.journalBuffer, []
+
+            try:
+                await BlockingIO.runInExecutor(self.replaceJournal, lines)
+            except Exception:
+                # The old journal is still in place, so its missing lines are written to it next time.
+                self.journalBuffer[:0] = buffered
+                raise
+
+    def replaceJournal(self, lines):
+        compactPath = self.journalPath + ".compact"
+
+        with open(compactPath, "w", encoding = "utf-8") as compact:
+            compact.write("".join(lines))
+            compact.flush()
+            os.fsync(compact.fileno())
+
+        self.journal.close()
+
+        try:
+            os.replace(compactPath, self.journalPath)
+        finally:
+            self.journal = open(self.journalPath, "a", encoding = "utf-8")
 
 ####################################### Helper Functions #####################################
-def updateRatingTable(giver_chat_id, receiver_chat_id, rating):
-    # If GOOD rating given
-    if (int(rating) == GOOD):
-        # Increment giver's good_given
-        response = DynamoDB.userRatingsTable.update_item(
-            Key = {"user_chat_id": str(giver_chat_id)},
-            ExpressionAttributeValues = {":inc": 1},
-            UpdateExpression = "ADD good_given :inc"
-        )
-
-        logger.info("DynamoDB update_item response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
-
-        # Increment receiver's good_received
-        response = DynamoDB.userRatingsTable.update_item(
-            Key = {"user_chat_id": str(receiver_chat_id)},
-            ExpressionAttributeValues = {":inc": 1},
-            UpdateExpression = "ADD good_received :inc"
-        )
-
-        logger.info("DynamoDB update_item response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
-
-    if (int(rating) == BAD):
-        # Increment giver's bad_given
-        response = DynamoDB.userRatingsTable.update_item(
-            Key = {"user_chat_id": str(giver_chat_id)},
-            ExpressionAttributeValues = {":inc": 1},
-            UpdateExpression = "ADD bad_given :inc"
-        )
-
-        logger.info("DynamoDB update_item response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
-
-        # Increment receiver's bad_received
-        response = DynamoDB.userRatingsTable.update_item(
-            Key = {"user_chat_id": str(receiver_chat_id)},
-            ExpressionAttributeValues = {":inc": 1},
-            UpdateExpression = "ADD bad_received :inc"
-        )
-
-        logger.info("DynamoDB update_item response: %s", response["ResponseMetadata"]["HTTPStatusCode"])
+# Work out the rating percentage and total number of ratings received from a user's item in the ratings table.
+def getRatingSummary(item):
+    # If user has not received any ratings before, the attributes will not exist.
+    good_received = int(item.get("good_received", 0))
+    bad_received = int(item.get("bad_received", 0))
+
+    total = good_received + bad_received
+
+    # Make sure total is not 0 to avoid dividing by 0
+    if (total != 0):
+        # We only want the integer portion of the number
+        ratingPercent = int(float(good_received) / float(total) * 100)
+    else:
+        ratingPercent = 0
 
-####################################### Main Functions #######################################
+    return ratingPercent, total
 
-async def inputUserRating(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Define the options using a 2D array.
-    userRatingOptions = [
-        [InlineKeyboardButton("\U0001F44D", callback_data = GOOD)],
-        [InlineKeyboardButton("\U0001F44E", callback_data = BAD)]
-    ]
+# Get the rating summaries of many users at once, keyed by chat_id.
+# Summaries are served from ratingCache where possible, and only the misses are fetched from the rating store.
+async def getUserRatings(chat_ids):
+    ratings = {}
+    missing = []
+
+    for chat_id in {str(chat_id) for chat_id in chat_ids}:
+        summary = ratingCache.get(chat_id)
+
+        if summary is None:
+            missing.append(chat_id)
+        else:
+            ratings[chat_id] = summary
+
+    if missing:
+        items = await Storage.ratingStore.getMany(missing)
+
+        fetched = {chat_id: getRatingSummary(item) for chat_id, item in items.items()}
+
+        for chat_id in missing:
+            # Users without an item in the table have not been rated yet.
+            ratings[chat_id] = fetched.get(chat_id, (0, 0))
+            ratingCache.put(chat_id, ratings[chat_id])
+
+    logger.debug("Rating cache stats: %s", ratingCache.stats())
+
+    return ratings
+
+# Get the rating summary of a single user.
+async def getUserRating(chat_id):
+    return (await getUserRatings([chat_id]))[str(chat_id)]
 
-    # Transform the 2D array into an actual inline keyboard (IK) that can be interpreted by Telegram.
-    userRatingOptionsIK = InlineKeyboardMarkup(userRatingOptions)
+# Record a rating given for a request. In "direct" mode the rating store does this atomically: the request's rated_by set
+# and both users' counts are updated together, so a crash can't leave them inconsistent.
+# The request's rated_by set makes the rating idempotent per (RequestID, giver): a second rating from the same giver
+# (e.g. a double-tap on the button) changes nothing and nothing is counted twice.
+# In "write_behind" mode only the rated_by set is written here, and the counts are handed to the aggregator.
+# Returns False if the giver had already rated this request.
+async def updateRatingTable(RequestID, giver_chat_id, receiver_chat_id, rating):
+    # If GOOD rating given, increment good_given and good_received. Otherwise bad_given and bad_received.
+    ratingName = "good" if int(rating) == GOOD else "bad"
 
+    if aggregator is not None:
+        if not await Storage.requestStore.markRated(RequestID, giver_chat_id):
+            logger.info("'%s' has already rated RequestID '%s'", giver_chat_id, RequestID)
+            return False
+
+        await aggregator.add(giver_chat_id, {f"{ratingName}_given": 1})
+        await aggregator.add(receiver_chat_id, {f"{ratingName}_received": 1})
+
+        return True
+
+    if not await Storage.ratingStore.recordRating(RequestID, giver_chat_id, receiver_chat_id, ratingName):
+        logger.info("'%s' has already rated RequestID '%s'", giver_chat_id, RequestID)
+        return False
+
+    # The rating store doesn't return the new counts, so the receiver's summary is read again on next use.
+    ratingCache.invalidate(receiver_chat_id)
+
+    return True
+
+# Start the write-behind aggregator if it is enabled in config.ini, and flush it every rating_flush_interval seconds.
+# Counts left in the journal by a previous run are flushed straight away.
+def startAggregator(application):
+    global aggregator
+
+    if rating_write_mode != "write_behind":
+        return
+
+    aggregator = RatingAggregator(rating_journal_path, rating_flush_size)
+    application.job_queue.run_repeating(aggregator.flush, interval = rating_flush_interval, first = 0)
+
+# Write the pending counts before the bot stops.
+async def stopAggregator(application):
+    if aggregator is not None:
+        if aggregator.flushTask is not None:
+            await aggregator.flushTask
+
+        await aggregator.flush()
+
+####################################### Main Functions #######################################
+
+async def inputUserRating(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Prompt user to select a rating option
-    await update.callback_query.message.reply_text("How would you rate your interaction with this user?", reply_markup = userRatingOptionsIK)
+    await update.callback_query.message.reply_text("How would you rate your interaction with this user?", reply_markup = UserInterface.ratingKeyboard)
 
     return MainMenu.UPDATE_RATINGS
 
@@ -92,12 +347,7 @@ async def updateUserRatings(update: Update, context: ContextTypes.DEFAULT_TYPE)
     ratingInput = update.callback_query.data
 
     # Query the DB for the request made.
-    response = FulfillerDetails.get_item(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
-    # Log DynamoDB response
-    logger.info("DynamoDB get_item response for RequestID '%s': '%s'", context.user_data[MainMenu.REQUEST_MADE]["RequestID"], response["ResponseMetadata"]["HTTPStatusCode"])
-
-    # Get the request the requester has put out.
-    request = response["Item"]
+    request = await Storage.requestStore.get(context.user_data[MainMenu.REQUEST_MADE]["RequestID"])
 
     # Save the chat_id of the user talking to the bot
     user_chat_id = update.effective_chat.id
@@ -119,7 +369,9 @@ async def updateUserRatings(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
     # Updates the table that stores user ratings
-    updateRatingTable(giver_chat_id, receiver_chat_id, ratingInput)
+    if not await updateRatingTable(request["RequestID"], giver_chat_id, receiver_chat_id, ratingInput):
+        await SendQueue.sendMessage(context, SendQueue.REPLY, chat_id = user_chat_id, text = "You have already rated this order. Use /start to use Dabao4Me again.")
+        return ConversationHandler.END
 
     if (int(ratingInput) == GOOD):
         logger.info(f"{giver_chat_id} gave {receiver_chat_id} a GOOD review.")
@@ -129,6 +381,6 @@ async def updateUserRatings(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
     # Sends rating confirmation message to the user
-    await context.bot.send_message(chat_id = user_chat_id, text = "Rating submitted! Use /start to use Dabao4Me again.")
+    await SendQueue.sendMessage(context, SendQueue.REPLY, chat_id = user_chat_id, text = "Rating submitted! Use /start to use Dabao4Me again.")
 
     return ConversationHandler.END
\ No newline at end of file
@@ -0,0 +1,24 @@
+# Helpers for the benchmarks. They print what they measure (run pytest with -s to see it) and only assert loose bounds,
+# so they pass on a slow machine but still fail if a change undoes the optimisation they measure.
+
+import asyncio
+import time
+
+# Run a coroutine function to completion and return its result and the seconds it took.
+def timeAsync(func, *args):
+    start = time.perf_counter()
+    result = asyncio.run(func(*args))
+
+    return result, time.perf_counter() - start
+
+# The value at the given percentile (0-100) of a list of samples.
+def percentile(samples, percent):
+    ordered = sorted(samples)
+
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+def report(title, rows):
+    print(f"\n{title}")
+
+    for label, value in rows:
+        print(f"  {label:<48} {value}")
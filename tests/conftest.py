@@ -0,0 +1,61 @@
+# The tests use the in-memory and SQLite storage backends, so they need neither AWS nor a real bot token.
+# Settings reads config.ini from the working directory when it is first imported, so it is imported here,
+# from a temporary directory holding the config.ini below, before any test module imports the bot's modules.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+[bot_keys]
+current_bot_token = 123456:TEST
+
+[storage]
+backend = memory
+
+[notifications]
+mode = inline
+
+[send_queue]
+enabled = false
+
+[expiry]
+run_sweeper = false
+"""
+
+sys.path.insert(0, ROOT)
+
+configDir = tempfile.mkdtemp(prefix = "dabao4me_tests_")
+
+with open(os.path.join(configDir, "config.ini"), "w") as configFile:
+    configFile.write(CONFIG)
+
+workingDir = os.getcwd()
+os.chdir(configDir)
+
+try:
+    import Settings
+finally:
+    os.chdir(workingDir)
+
+import OpenRequests
+import MatchingUsers
+import Storage
+
+# Fresh request and rating stores of the given backend, a fresh open request index and an empty pairing registry for every test.
+@pytest.fixture(params = ["memory", "sqlite"])
+def stores(request, monkeypatch, tmp_path):
+    monkeypatch.setattr(Storage, "storage_path", str(tmp_path / "dabao4me.sqlite"))
+
+    requestStore, ratingStore = Storage.createStores(request.param)
+
+    monkeypatch.setattr(Storage, "requestStore", requestStore, raising = False)
+    monkeypatch.setattr(Storage, "ratingStore", ratingStore, raising = False)
+    monkeypatch.setattr(OpenRequests, "index", OpenRequests.OpenRequestIndex(OpenRequests.max_open_requests))
+    monkeypatch.setattr(MatchingUsers, "activePairings", type(MatchingUsers.activePairings)())
+
+    return requestStore, ratingStore
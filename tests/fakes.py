@@ -0,0 +1,111 @@
+# Stand-ins for the python-telegram-bot objects the handlers use, recording what the handlers send.
+
+import configparser
+import json
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from telegram.request import BaseRequest
+
+import DynamoDB
+import Storage
+
+class FakeMessage:
+    def __init__(self, text = None, location = None):
+        self.text = text
+        self.location = location
+        self.replies = []
+
+    async def reply_text(self, text = None, **kwargs):
+        self.replies.append(text)
+
+class FakeUpdate:
+    def __init__(self, chat_id, text = None, location = None):
+        self.effective_user = SimpleNamespace(id = chat_id, name = f"@user{chat_id}")
+        self.effective_chat = SimpleNamespace(id = chat_id)
+        self.message = self.effective_message = FakeMessage(text, location)
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+
+# Stand-in for the Telegram Bot API, given to a real Bot (or Application) as its request object, so nothing goes over the network.
+# Answers getMe, sendMessage and the webhook calls, and records the messages sent. Override respond() to make calls fail.
+class FakeBotAPI(BaseRequest):
+    def __init__(self):
+        self.sent = []
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data = None, read_timeout = None, write_timeout = None, connect_timeout = None, pool_timeout = None):
+        return await self.respond(url.rsplit("/", 1)[-1], request_data.parameters if request_data is not None else {})
+
+    # Returns the HTTP status code and the JSON body of the answer to a Bot API call.
+    async def respond(self, apiMethod, parameters):
+        if apiMethod == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Dabao4Me", "username": "dabao4me_bot"}
+        elif apiMethod == "sendMessage":
+            self.sent.append(parameters)
+            result = {"message_id": len(self.sent), "date": int(time.time()), "chat": {"id": int(parameters["chat_id"]), "type": "private"}, "text": parameters["text"]}
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.user_data = defaultdict(dict)
+        self.markedUsers = set()
+
+    def mark_data_for_update_persistence(self, chat_ids = None, user_ids = None):
+        self.markedUsers.update(user_ids or ())
+
+class FakeContext:
+    def __init__(self, application, user_id, args = ()):
+        self.application = application
+        self.bot = application.bot
+        self.user_data = application.user_data[user_id]
+        self.args = list(args)
+
+# An open request, as RequesterDetails.requesterPrice stores it.
+def makeRequest(requester_chat_id, canteen = "deck", food = "chicken rice"):
+    RequestID = Storage.newRequestID()
+
+    return {
+        "RequestID": RequestID,
+        "created_at": Storage.createdAt(RequestID),
+        "requester_chat_id": str(requester_chat_id),
+        "requester_user_name": f"@user{requester_chat_id}",
+        "canteen": canteen,
+        "food": food,
+        "tip_amount": "1.50",
+        "fulfiller_chat_id": "",
+        "fulfiller_user_name": "",
+        "request_status": "Available",
+        "requester_complete": "false",
+        "fulfiller_complete": "false"
+    }
+
+# Point the DynamoDB module at a local endpoint (DynamoDB Local, or a stand-in server) with a fresh shared session and resource.
+def useLocalDynamoDB(monkeypatch, endpoint):
+    config = configparser.ConfigParser()
+    config.read_dict({"dynamodb": {"region_name": "local", "aws_access_key_id": "local", "aws_secret_access_key": "local"}})
+
+    monkeypatch.setattr(DynamoDB, "config", config)
+    monkeypatch.setattr(DynamoDB, "endpoint_url", endpoint)
+
+    for name in ("session", "resource", "client_config"):
+        monkeypatch.setattr(DynamoDB, name, None)
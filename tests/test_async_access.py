@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import DynamoDB
+import Storage
+from benchmark import report, timeAsync
+
+UPDATES = 100
+
+# Seconds each DynamoDB round-trip blocks for.
+LATENCY = 0.005
+
+# Stand-in for a boto3 Table whose calls block the calling thread for a round-trip, like boto3 does.
+class BlockingTable:
+    name = DynamoDB.tableName
+
+    def get_item(self, Key):
+        time.sleep(LATENCY)
+        return {"Item": {"RequestID": Key["RequestID"], "request_status": "Available"}, "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def update_item(self, **kwargs):
+        time.sleep(LATENCY)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+# Updates per second when every update reads a request and updates it: first with the boto3 calls made straight
+# from the handlers (as before the async access layer), then through DynamoDBRequestStore and the executor.
+def test_updates_per_second_benchmark():
+    syncTable = BlockingTable()
+    store = Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(syncTable, "RequestID"))
+
+    async def blockingUpdate(number):
+        syncTable.get_item(Key = {"RequestID": str(number)})
+        syncTable.update_item(Key = {"RequestID": str(number)}, UpdateExpression = "SET food = :food", ExpressionAttributeValues = {":food": "noodles"})
+
+    async def asyncUpdate(number):
+        await store.get(str(number))
+        await store.updateFields(str(number), food = "noodles")
+
+    async def handleUpdates(handler):
+        await asyncio.gather(*(handler(number) for number in range(UPDATES)))
+
+    _, blockingTime = timeAsync(handleUpdates, blockingUpdate)
+    _, asyncTime = timeAsync(handleUpdates, asyncUpdate)
+
+    report(f"{UPDATES} concurrent updates, 2 DynamoDB calls of {LATENCY * 1000:.0f} ms each, {DynamoDB.max_workers} workers", [
+        ("blocking calls on the event loop (updates/s)", f"{UPDATES / blockingTime:.0f}"),
+        ("DynamoDB executor (updates/s)", f"{UPDATES / asyncTime:.0f}")
+    ])
+
+    assert asyncTime * 5 < blockingTime
@@ -0,0 +1,75 @@
+import asyncio
+
+from telegram.ext import ConversationHandler
+
+import MainMenu
+import MatchingUsers
+import Storage
+from fakes import FakeApplication, FakeContext, FakeUpdate, makeRequest
+
+# A requester waiting for a fulfiller, and the handlers of their AWAIT_FULFILLER state.
+def waitingRequester():
+    request = makeRequest(requester_chat_id = 1)
+    application = FakeApplication()
+    application.user_data[1][MainMenu.REQUEST_MADE] = dict(request)
+
+    message = MatchingUsers.whileAwaitingFulfiller(MatchingUsers.awaitFulfiller, MatchingUsers.forwardRequesterMsg)
+    cancel = MatchingUsers.whileAwaitingFulfiller(MatchingUsers.requesterCancelSearch, MatchingUsers.requestTaken)
+
+    return request, application, message, cancel
+
+# The claim, handled in the fulfiller's update, only stores the request for the requester.
+# The requester's next message moves their conversation into REQUESTER_IN_CONVO and is relayed to the fulfiller.
+def test_next_message_after_a_claim_is_relayed(stores):
+    request, application, message, cancel = waitingRequester()
+
+    async def scenario():
+        await Storage.requestStore.create(request)
+
+        waiting = FakeUpdate(1, text = "anyone?")
+        before = await message(waiting, FakeContext(application, 1))
+
+        claimed = await MatchingUsers.claimRequest(request["RequestID"], 2, "@user2")
+        MatchingUsers.applyStatusChange(FakeContext(application, 2), "Available", claimed)
+
+        relayed = FakeUpdate(1, text = "hello")
+        after = await message(relayed, FakeContext(application, 1))
+
+        return before, waiting, after
+
+    before, waiting, after = asyncio.run(scenario())
+
+    assert before == MainMenu.AWAIT_FULFILLER and waiting.message.replies[0].startswith("We are still trying")
+    assert after == MainMenu.REQUESTER_IN_CONVO
+    assert [(sent["chat_id"], sent["text"].endswith("hello")) for sent in application.bot.sent] == [("2", True)]
+
+# /cancel after a claim doesn't delete the claimed request.
+def test_cancel_after_a_claim_keeps_the_request(stores):
+    request, application, message, cancel = waitingRequester()
+
+    async def scenario():
+        await Storage.requestStore.create(request)
+
+        claimed = await MatchingUsers.claimRequest(request["RequestID"], 2, "@user2")
+        MatchingUsers.applyStatusChange(FakeContext(application, 2), "Available", claimed)
+
+        state = await cancel(FakeUpdate(1, text = "/cancel"), FakeContext(application, 1))
+
+        return state, await Storage.requestStore.get(request["RequestID"])
+
+    state, stored = asyncio.run(scenario())
+
+    assert state == MainMenu.REQUESTER_IN_CONVO
+    assert stored["request_status"] == "In Progress"
+
+# An expired request ends the requester's conversation on their next update.
+def test_next_update_after_expiry_ends_the_conversation(stores):
+    request, application, message, cancel = waitingRequester()
+
+    MatchingUsers.applyStatusChange(FakeContext(application, 0), "Available", dict(request, request_status = "Expired"))
+
+    update = FakeUpdate(1, text = "still there?")
+
+    assert asyncio.run(message(update, FakeContext(application, 1))) == ConversationHandler.END
+    assert "expired" in update.message.replies[0]
+    assert 1 in application.markedUsers
@@ -0,0 +1,158 @@
+import logging
+import os
+import time
+import uuid
+
+import DynamoDB
+import Storage
+from benchmark import percentile, report, timeAsync
+from fakes import makeRequest, useLocalDynamoDB
+
+REQUESTS = 200
+REQUESTERS = 50
+CANTEENS = ["deck", "frontier", "fine_foods", "pgpr"]
+PAGE_SIZE = 10
+
+# What the suite must return on every backend.
+EXPECTED = {"listed": REQUESTS, "byRequester": REQUESTS, "claimed": REQUESTS // 2, "reclaimed": 0, "rated": REQUESTS // 2, "rerated": 0, "good_received": REQUESTS // 2}
+
+async def timed(samples, operation, awaitable):
+    start = time.perf_counter()
+    result = await awaitable
+    samples.setdefault(operation, []).append(time.perf_counter() - start)
+
+    return result
+
+async def collect(asyncIterator):
+    return [item async for item in asyncIterator]
+
+# Every RequestStore and RatingStore operation the bot uses, one call at a time, so each sample is the latency of one call.
+# Returns the samples by operation, and what the operations returned.
+async def runSuite(requestStore, ratingStore):
+    samples = {}
+    requests = [makeRequest(requester_chat_id = number % REQUESTERS, canteen = CANTEENS[number % len(CANTEENS)]) for number in range(REQUESTS)]
+    results = dict.fromkeys(EXPECTED, 0)
+
+    for request in requests:
+        await timed(samples, "create", requestStore.create(request))
+
+    for request in requests:
+        await timed(samples, "get", requestStore.get(request["RequestID"]))
+
+    for request in requests:
+        await timed(samples, "updateFields", requestStore.updateFields(request["RequestID"], food = "noodles"))
+
+    for canteen in CANTEENS:
+        startKey = None
+
+        while True:
+            page, startKey = await timed(samples, "pageByCanteen", requestStore.pageByCanteen(canteen, startKey, PAGE_SIZE))
+            results["listed"] += len(page)
+
+            if startKey is None:
+                break
+
+    for requester in range(REQUESTERS):
+        results["byRequester"] += len(await timed(samples, "iterByRequester", collect(requestStore.iterByRequester(requester))))
+
+    claimed = requests[:REQUESTS // 2]
+
+    for request in claimed:
+        results["claimed"] += await timed(samples, "claim", requestStore.claim(request["RequestID"], "900", "@fulfiller")) is not None
+        results["reclaimed"] += await timed(samples, "claim", requestStore.claim(request["RequestID"], "901", "@other")) is not None
+
+    for request in claimed:
+        await timed(samples, "setStatus", requestStore.setStatus(request["RequestID"], "Complete"))
+
+    for request in claimed:
+        results["rated"] += await timed(samples, "recordRating", ratingStore.recordRating(request["RequestID"], "900", request["requester_chat_id"], "good"))
+        results["rerated"] += await timed(samples, "recordRating", ratingStore.recordRating(request["RequestID"], "900", request["requester_chat_id"], "good"))
+
+    for start in range(0, REQUESTERS, PAGE_SIZE):
+        items = await timed(samples, "getMany", ratingStore.getMany([str(requester) for requester in range(start, start + PAGE_SIZE)]))
+        results["good_received"] += sum(int(item.get("good_received", 0)) for item in items.values())
+
+    return samples, results
+
+# Fresh DynamoDB tables on the DynamoDB Local (or other stand-in) endpoint in DYNAMODB_ENDPOINT, and stores on them.
+# Returns the stores and a function that deletes the tables again, or None if DYNAMODB_ENDPOINT isn't set.
+def dynamodbStores(monkeypatch):
+    endpoint = os.environ.get("DYNAMODB_ENDPOINT")
+
+    if not endpoint:
+        return None
+
+    useLocalDynamoDB(monkeypatch, endpoint)
+
+    client = DynamoDB.createClient("dynamodb")
+    suffix = uuid.uuid4().hex[:8]
+    requestTableName, ratingTableName = f"{DynamoDB.tableName}_{suffix}", f"Dabao4Me_User_Ratings_{suffix}"
+
+    def index(name, partitionKey, sortKey):
+        return {"IndexName": name, "KeySchema": [{"AttributeName": partitionKey, "KeyType": "HASH"}, {"AttributeName": sortKey, "KeyType": "RANGE"}],
+                "Projection": {"ProjectionType": "ALL"}}
+
+    client.create_table(
+        TableName = requestTableName,
+        KeySchema = [{"AttributeName": "RequestID", "KeyType": "HASH"}],
+        AttributeDefinitions = [{"AttributeName": name, "AttributeType": "S"} for name in ("RequestID", "canteen", "requester_chat_id", "status_created_at")]
+                               + [{"AttributeName": "archive_at", "AttributeType": "N"}],
+        GlobalSecondaryIndexes = [
+            index("canteen-status_created_at-index", "canteen", "status_created_at"),
+            index("requester_chat_id-status_created_at-index", "requester_chat_id", "status_created_at"),
+            index("canteen-archive_at-index", "canteen", "archive_at")
+        ],
+        BillingMode = "PAY_PER_REQUEST"
+    )
+    client.create_table(
+        TableName = ratingTableName,
+        KeySchema = [{"AttributeName": "user_chat_id", "KeyType": "HASH"}],
+        AttributeDefinitions = [{"AttributeName": "user_chat_id", "AttributeType": "S"}],
+        BillingMode = "PAY_PER_REQUEST"
+    )
+
+    for tableName in (requestTableName, ratingTableName):
+        client.get_waiter("table_exists").wait(TableName = tableName)
+
+    def deleteTables():
+        for tableName in (requestTableName, ratingTableName):
+            client.delete_table(TableName = tableName)
+
+    requestTable = DynamoDB.AsyncTable(DynamoDB.getResource().Table(requestTableName), "RequestID")
+    ratingTable = DynamoDB.AsyncTable(DynamoDB.getResource().Table(ratingTableName), "user_chat_id")
+
+    return (Storage.DynamoDBRequestStore(requestTable), Storage.DynamoDBRatingStore(ratingTable, requestTableName)), deleteTables
+
+# The same suite against every backend: they must all give the same results, and the latency of each operation is reported side by side.
+# The DynamoDB backend is only run when DYNAMODB_ENDPOINT points at DynamoDB Local, e.g. DYNAMODB_ENDPOINT=http://localhost:8000.
+def test_backend_latency_benchmark(tmp_path, monkeypatch, caplog):
+    caplog.set_level(logging.WARNING)
+    monkeypatch.setattr(Storage, "storage_path", str(tmp_path / "dabao4me.sqlite"))
+
+    backends = {"memory": Storage.createStores("memory"), "sqlite": Storage.createStores("sqlite")}
+    dynamodb = dynamodbStores(monkeypatch)
+
+    if dynamodb is not None:
+        backends["dynamodb"], deleteTables = dynamodb
+
+    medians = {}
+    rows = []
+
+    try:
+        for backend, stores in backends.items():
+            (samples, results), _ = timeAsync(runSuite, *stores)
+
+            assert results == EXPECTED, backend
+
+            medians[backend] = {operation: percentile(latencies, 50) for operation, latencies in samples.items()}
+            rows += [(f"{backend:<8} {operation}", f"p50 {percentile(latencies, 50) * 1000:.3f} ms   p99 {percentile(latencies, 99) * 1000:.3f} ms")
+                     for operation, latencies in samples.items()]
+    finally:
+        if dynamodb is not None:
+            deleteTables()
+
+    report(f"Store operations, {REQUESTS} requests from {REQUESTERS} requesters at {len(CANTEENS)} canteens, one call at a time"
+           + ("" if dynamodb is not None else " (set DYNAMODB_ENDPOINT to include DynamoDB)"), rows)
+
+    # The in-memory backend doesn't leave the event loop, while every SQLite call is a round-trip to the BlockingIO executor.
+    assert medians["memory"]["get"] < medians["sqlite"]["get"]
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import DynamoDB
+import FulfillerDetails
+import Storage
+import UserRatings
+from benchmark import report
+from fakes import makeRequest
+
+RATINGS_TABLE = "Dabao4Me_User_Ratings"
+
+# Seconds each DynamoDB round-trip blocks for, whether it reads one key or a batch of them.
+LATENCY = 0.0005
+
+# Stand-in for the ratings table and the resource's batch_get_item, counting the round-trips made.
+class RatingsTable:
+    name = RATINGS_TABLE
+
+    def __init__(self):
+        self.calls = 0
+
+    def item(self, chat_id):
+        return {"user_chat_id": chat_id, "good_received": int(chat_id) % 5, "bad_received": 1}
+
+    def get_item(self, Key):
+        self.calls += 1
+        time.sleep(LATENCY)
+        return {"Item": self.item(Key["user_chat_id"]), "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[RATINGS_TABLE]["Keys"]
+        assert len(keys) <= DynamoDB.batch_get_limit
+
+        self.calls += 1
+        time.sleep(LATENCY)
+        return {"Responses": {RATINGS_TABLE: [self.item(key["user_chat_id"]) for key in keys]}}
+
+def ratingsStore(monkeypatch):
+    syncTable = RatingsTable()
+
+    monkeypatch.setattr(DynamoDB, "getResource", lambda: syncTable)
+    monkeypatch.setattr(Storage, "ratingStore", Storage.DynamoDBRatingStore(DynamoDB.AsyncTable(syncTable, "user_chat_id"), DynamoDB.tableName), raising = False)
+
+    return syncTable
+
+# Every requester's rating is read with one BatchGetItem call per 100 requesters, each requester once.
+def test_ratings_are_fetched_in_batches(monkeypatch):
+    syncTable = ratingsStore(monkeypatch)
+    monkeypatch.setattr(UserRatings, "ratingCache", UserRatings.RatingCache(10000, 600))
+
+    requests = [makeRequest(requester_chat_id = number % 250) for number in range(1000)]
+    text = asyncio.run(FulfillerDetails.processRequests(requests))
+
+    assert syncTable.calls == 3
+    assert text.count("@user") == 1000
+
+# Time to get the requesters' ratings for a listing of 10, 100 and 1000 requests (two requests per requester):
+# one get_item per request (as processRequests did before), and the batched, de-duplicated lookup.
+def test_listing_latency_benchmark(monkeypatch):
+    syncTable = ratingsStore(monkeypatch)
+
+    async def oneByOne(requests):
+        for request in requests:
+            await Storage.ratingStore.table.get_item(Key = {"user_chat_id": request["requester_chat_id"]})
+
+    async def batched(requests):
+        await UserRatings.getUserRatings([request["requester_chat_id"] for request in requests])
+
+    async def timeLookup(lookup, requests):
+        start = time.perf_counter()
+        await lookup(requests)
+        return time.perf_counter() - start
+
+    rows = []
+
+    for size in [10, 100, 1000]:
+        requests = [makeRequest(requester_chat_id = number % (size // 2)) for number in range(size)]
+
+        # Every run starts with an empty rating cache, so the batched lookup reads every requester.
+        monkeypatch.setattr(UserRatings, "ratingCache", UserRatings.RatingCache(10000, 600))
+
+        sequentialTime = asyncio.run(timeLookup(oneByOne, requests))
+        batchedTime = asyncio.run(timeLookup(batched, requests))
+
+        rows.append((f"{size} requests: get_item per request / batched", f"{sequentialTime * 1000:.1f} ms / {batchedTime * 1000:.1f} ms"))
+
+    report(f"Requester ratings of a listing, {LATENCY * 1000:.1f} ms per DynamoDB call", rows)
+
+    assert batchedTime * 10 < sequentialTime
@@ -0,0 +1,22 @@
+import pytest
+
+import Canteens
+
+# A malformed catalogue must raise ValueError, which the reload path catches to keep the current catalogue.
+@pytest.mark.parametrize("details", [
+    "Deck",
+    ["Deck"],
+    {"name": "Deck", "hours": ["mon", "08:00-20:00"]},
+    {"name": "Deck", "hours": {"mon": 8}},
+    {"name": "Deck", "hours": {"mon": [800]}},
+    {"name": "Deck", "capacity": "many"},
+    {"name": "Deck", "capacity": [10]},
+])
+def test_malformed_canteen_is_a_value_error(details):
+    with pytest.raises(ValueError):
+        Canteens.parseCatalogue({"deck": details})
+
+def test_valid_canteen_is_parsed():
+    catalogue = Canteens.parseCatalogue({"deck": {"name": "The Deck", "hours": {"mon": ["08:00-14:00", "17:00-20:00"]}, "capacity": "5"}})
+
+    assert catalogue["deck"].name == "The Deck" and catalogue["deck"].capacity == 5
@@ -0,0 +1,90 @@
+import asyncio
+import random
+from datetime import datetime
+
+from telegram import Chat, Message, Update
+
+from ChatUpdateProcessor import PerChatUpdateProcessor
+
+def makeUpdate(update_id, chat_id):
+    chat = Chat(id = chat_id, type = Chat.PRIVATE)
+
+    return Update(update_id = update_id, message = Message(message_id = update_id, date = datetime.now(), chat = chat))
+
+# Hand the updates to the processor one task each, in arrival order, the way the Application does.
+async def replay(processor, updates, handle):
+    await asyncio.gather(*(asyncio.create_task(processor.process_update(update, handle(update))) for update in updates))
+
+# Several users' update streams, interleaved. Each handler reads the user's state, waits (as on a DynamoDB call) and writes it back,
+# so two of a user's updates running at once would lose one of the writes.
+def test_interleaved_streams_keep_each_users_state():
+    random.seed(3)
+
+    streams = {chat_id: list(range(30)) for chat_id in (101, 102, 103, 104)}
+    arrivals = [(chat_id, step) for chat_id, steps in streams.items() for step in steps]
+    random.shuffle(arrivals)
+
+    # Keep each user's own updates in order, as Telegram delivers them.
+    nextStep = {chat_id: iter(steps) for chat_id, steps in streams.items()}
+    updates = [makeUpdate(update_id, chat_id) for update_id, (chat_id, _) in enumerate(arrivals)]
+    steps = {update.update_id: next(nextStep[update.effective_chat.id]) for update in updates}
+
+    state = {chat_id: [] for chat_id in streams}
+    running = set()
+    overlaps = []
+
+    async def handle(update):
+        chat_id = update.effective_chat.id
+
+        assert chat_id not in running
+        running.add(chat_id)
+        overlaps.append(len(running))
+
+        seen = list(state[chat_id])
+        await asyncio.sleep(random.uniform(0, 0.002))
+        state[chat_id] = seen + [steps[update.update_id]]
+
+        running.discard(chat_id)
+
+    processor = PerChatUpdateProcessor(8)
+    asyncio.run(replay(processor, updates, handle))
+
+    assert state == streams
+    assert max(overlaps) > 1
+    assert processor.chatLocks == {} and processor.pendingUpdates == {}
+
+# A chat with many updates queued holds one slot, so another chat's update goes ahead instead of waiting behind all of them.
+def test_busy_chat_does_not_starve_other_chats():
+    finished = []
+
+    async def handle(update):
+        await asyncio.sleep(0.01)
+        finished.append(update.effective_chat.id)
+
+    updates = [makeUpdate(update_id, 201) for update_id in range(10)] + [makeUpdate(10, 202)]
+
+    asyncio.run(replay(PerChatUpdateProcessor(2), updates, handle))
+
+    assert finished.index(202) <= 1
+
+# No more than max_concurrent_updates updates run at once, however many chats they come from.
+def test_running_updates_are_bounded():
+    running = []
+    peak = []
+
+    async def handle(update):
+        running.append(update.update_id)
+        peak.append(len(running))
+        await asyncio.sleep(0.002)
+        running.remove(update.update_id)
+
+    updates = [makeUpdate(update_id, 300 + update_id % 20) for update_id in range(60)]
+
+    asyncio.run(replay(PerChatUpdateProcessor(3), updates, handle))
+
+    assert max(peak) == 3
+
+# The ordering is done in do_process_update, the method python-telegram-bot lets update processors override,
+# so the @final process_update (and its semaphore) is still BaseUpdateProcessor's own.
+def test_process_update_is_not_overridden():
+    assert "process_update" not in PerChatUpdateProcessor.__dict__
@@ -0,0 +1,66 @@
+import asyncio
+import random
+
+import MainMenu
+import MatchingUsers
+import OpenRequests
+import Storage
+from fakes import FakeApplication, FakeContext, FakeUpdate, makeRequest
+
+REQUESTS = 10
+FULFILLERS = 200
+
+# Hundreds of fulfillers press "Fulfil" on the same requests at once: exactly one of them gets each request.
+def test_exactly_one_fulfiller_claims_each_request(stores):
+    async def claimAll():
+        application = FakeApplication()
+        requests = [makeRequest(requester_chat_id = 1000 + number) for number in range(REQUESTS)]
+
+        for request in requests:
+            await Storage.requestStore.create(request)
+            OpenRequests.index.add(request)
+
+        attempts = [(request["RequestID"], fulfiller_chat_id) for request in requests for fulfiller_chat_id in range(1, FULFILLERS + 1)]
+        random.shuffle(attempts)
+
+        updates = [FakeUpdate(fulfiller_chat_id) for _, fulfiller_chat_id in attempts]
+        results = await asyncio.gather(*(MatchingUsers.connectFulfiller(update, FakeContext(application, update.effective_user.id), RequestID)
+                                         for update, (RequestID, _) in zip(updates, attempts)))
+
+        return application, requests, attempts, results
+
+    application, requests, attempts, results = asyncio.run(claimAll())
+
+    winners = {}
+
+    for (RequestID, fulfiller_chat_id), result in zip(attempts, results):
+        if result == MainMenu.FULFILLER_IN_CONVO:
+            assert RequestID not in winners
+            winners[RequestID] = fulfiller_chat_id
+        else:
+            assert result == MainMenu.FULFIL_REQUEST
+
+    assert len(winners) == REQUESTS
+    assert len(OpenRequests.index) == 0
+
+    for request in requests:
+        stored = asyncio.run(Storage.requestStore.get(request["RequestID"]))
+
+        assert stored["request_status"] == "In Progress"
+        assert stored["fulfiller_chat_id"] == str(winners[request["RequestID"]])
+
+        # Only the winner's claim reached the requester.
+        requester_chat_id = int(request["requester_chat_id"])
+        assert application.user_data[requester_chat_id][MainMenu.REQUEST_MADE]["fulfiller_chat_id"] == str(winners[request["RequestID"]])
+        assert [message["chat_id"] for message in application.bot.sent].count(request["requester_chat_id"]) == 1
+
+# A request that has been cancelled can't be claimed.
+def test_cancelled_request_cannot_be_claimed(stores):
+    async def claimCancelled():
+        request = makeRequest(requester_chat_id = 1)
+        await Storage.requestStore.create(request)
+        await Storage.requestStore.delete(request["RequestID"])
+
+        return await MatchingUsers.claimRequest(request["RequestID"], 2, "@user2")
+
+    assert asyncio.run(claimCancelled()) is None
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import DynamoDB
+import Storage
+from benchmark import report, timeAsync
+from fakes import useLocalDynamoDB
+
+# Calls made per pooled connection.
+CALLS_PER_CONNECTION = 8
+
+# Seconds DynamoDB takes to answer each call.
+LATENCY = 0.05
+
+POOL_SIZES = [1, 10, 50]
+
+# Stand-in for the DynamoDB endpoint, answering every GetItem after LATENCY over HTTP/1.1 keep-alive connections,
+# so the calls go through botocore's real connection pool. Counts the connections opened to it.
+class DynamoDBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Send each response in one write, so it isn't held back by Nagle's algorithm.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(LATENCY)
+
+        assert self.headers["X-Amz-Target"] == "DynamoDB_20120810.GetItem"
+        body = json.dumps({"Item": {"RequestID": request["Key"]["RequestID"], "request_status": {"S": "Available"}}}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class DynamoDBServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Room for every pooled connection to be opened at once.
+    request_queue_size = max(POOL_SIZES)
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), DynamoDBHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+
+# A fresh shared session, resource and executor for the endpoint, with the given pool size and as many workers.
+def poolStore(monkeypatch, endpoint, poolSize):
+    useLocalDynamoDB(monkeypatch, endpoint)
+    monkeypatch.setitem(DynamoDB.client_settings, "max_pool_connections", poolSize)
+    monkeypatch.setattr(DynamoDB, "executor", ThreadPoolExecutor(max_workers = poolSize, thread_name_prefix = "dynamodb"))
+
+    return Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(DynamoDB.getResource().Table(DynamoDB.tableName), "RequestID"))
+
+# Gets per second with many concurrent get_item calls, at each pool size (max_pool_connections, with max_workers defaulting to it).
+# Once the connections are open they are reused, so the pool size is the number of calls in flight.
+def test_throughput_by_pool_size_benchmark(monkeypatch, caplog):
+    caplog.set_level(logging.WARNING)
+
+    server = DynamoDBServer()
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    throughput = {}
+    rows = []
+
+    async def getAll(store, calls):
+        return await asyncio.gather(*(store.get(str(number)) for number in range(calls)))
+
+    try:
+        for poolSize in POOL_SIZES:
+            with monkeypatch.context() as patch:
+                store = poolStore(patch, endpoint, poolSize)
+
+                calls = max(40, CALLS_PER_CONNECTION * poolSize)
+
+                # Open the connections first, so only the calls themselves are timed.
+                asyncio.run(getAll(store, poolSize * 2))
+                server.connections = 0
+
+                items, seconds = timeAsync(getAll, store, calls)
+                DynamoDB.executor.shutdown()
+
+            assert [item["RequestID"] for item in items] == [str(number) for number in range(calls)]
+
+            throughput[poolSize] = calls / seconds
+            rows.append((f"max_pool_connections = {poolSize} (gets/s)", f"{throughput[poolSize]:.0f}   ({server.connections} new connections)"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    report(f"Concurrent get_item calls, {CALLS_PER_CONNECTION} per pooled connection, {LATENCY * 1000:.0f} ms each", rows)
+
+    assert throughput[10] > throughput[1] * 3
+    assert throughput[50] > throughput[10] * 1.5
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import Canteens
+import FulfillerDetails
+import GeoIndex
+import MainMenu
+import Storage
+import UserInterface
+from benchmark import percentile, report
+from fakes import FakeApplication, FakeContext, FakeMessage, FakeUpdate, makeRequest
+
+RADII = [20, 100, 500, 2000]
+
+# Where the fulfiller is in the nearby listing tests, near The Deck.
+FULFILLER = (1.2944, 103.7725)
+
+# Degrees of latitude in a metre.
+DEGREES_PER_METRE = 1 / GeoIndex.METRES_PER_DEGREE
+
+# The points within radius of a coordinate as (distance, key), nearest first, by measuring the distance to every point.
+def bruteForce(points, latitude, longitude, radius):
+    return sorted(match for match in ((GeoIndex.distance(latitude, longitude, *point), key) for key, point in points.items()) if match[0] <= radius)
+
+# A coordinate the given metres north and east of another.
+def offset(latitude, longitude, north, east):
+    return latitude + north * DEGREES_PER_METRE, longitude + east * DEGREES_PER_METRE / math.cos(math.radians(latitude))
+
+# Random points and queries around a few places, including far from the equator and across the antimeridian.
+@pytest.mark.parametrize("centre", [(1.2966, 103.7764), (60.0, 10.0), (-33.9, 151.2), (0.0, 179.999)])
+def test_near_matches_brute_force(centre):
+    generator = random.Random(3)
+
+    def around():
+        latitude, longitude = offset(*centre, generator.uniform(-3000, 3000), generator.uniform(-3000, 3000))
+        return latitude, (longitude + 180) % 360 - 180
+
+    points = {number: around() for number in range(2000)}
+    index = GeoIndex.GeoIndex(points)
+
+    for _ in range(50):
+        latitude, longitude = around()
+
+        for radius in RADII:
+            assert index.near(latitude, longitude, radius) == bruteForce(points, latitude, longitude, radius)
+
+# Points just across the edges and corner of the geohash cell a query is in, where a query only looking in its own cell would miss them.
+@pytest.mark.parametrize("precision", [5, 6, 7, 8])
+def test_near_finds_points_across_cell_edges(precision):
+    latSize, lonSize = GeoIndex.cellSize(precision)
+
+    # The south-west corner of the cell FULFILLER is in.
+    cornerLatitude = math.floor((FULFILLER[0] + 90) / latSize) * latSize - 90
+    cornerLongitude = math.floor((FULFILLER[1] + 180) / lonSize) * lonSize - 180
+
+    points = {}
+
+    for metres in [1, 5, 15, 40, 90, 200, 450, 900, 1900]:
+        for north, east in [(1, 1), (1, -1), (-1, 1), (-1, -1), (1, 0), (0, 1), (-1, 0), (0, -1)]:
+            points[(metres, north, east)] = offset(cornerLatitude, cornerLongitude, north * metres, east * metres)
+
+    index = GeoIndex.GeoIndex(points)
+
+    # Queries just inside each of the four cells around the corner.
+    queries = [offset(cornerLatitude, cornerLongitude, north * 0.01, east * 0.01) for north, east in [(1, 1), (1, -1), (-1, 1), (-1, -1)]]
+
+    assert len({GeoIndex.encode(latitude, longitude, precision) for latitude, longitude in queries}) == 4
+
+    for latitude, longitude in queries:
+        for radius in RADII:
+            assert index.near(latitude, longitude, radius) == bruteForce(points, latitude, longitude, radius)
+
+# A catalogue of canteens around FULFILLER, installed for the test and put back afterwards.
+@pytest.fixture
+def nearbyCatalogue(monkeypatch):
+    for module, name in [(Canteens, "canteens"), (Canteens, "geoIndex"), (UserInterface, "canteenKeyboard"), (UserInterface, "canteenNames")]:
+        monkeypatch.setattr(module, name, getattr(module, name))
+
+    def at(north, east):
+        return list(offset(*FULFILLER, north, east))
+
+    catalogue = {
+        "deck": {"name": "The Deck", "location": at(150, 100)},
+        "frontier": {"name": "Frontier", "location": at(-300, 250)},
+        "technoedge": {"name": "TechnoEdge", "location": at(0, -450)},
+        "closed": {"name": "Closed", "location": at(100, 0), "hours": {}},
+        "pgpr": {"name": "PGPR", "location": at(-700, 0)},
+        "fine_foods": {"name": "Fine Foods"}
+    }
+
+    Canteens.install(Canteens.parseCatalogue(catalogue))
+
+    return {canteenID: details["location"] for canteenID, details in catalogue.items() if "location" in details}
+
+async def answer():
+    pass
+
+# Sending their location lists the requests at the open canteens within nearby_radius of the fulfiller, oldest first across all of them,
+# and Next pages through the rest in the same order until the last page.
+def test_nearby_listing_pages_oldest_first(stores, nearbyCatalogue, caplog):
+    caplog.set_level(logging.WARNING)
+
+    canteens = list(nearbyCatalogue) + ["fine_foods"]
+    seeded = [makeRequest(requester_chat_id = number, canteen = canteens[number * 7 % len(canteens)]) for number in range(30)]
+
+    nearby = [canteenID for _, canteenID in bruteForce(nearbyCatalogue, *FULFILLER, FulfillerDetails.nearby_radius) if Canteens.get(canteenID).isOpen(Canteens.now())]
+    expected = [request["RequestID"] for request in sorted(seeded, key = Storage.sortKey) if request["canteen"] in nearby]
+
+    context = FakeContext(FakeApplication(), 1)
+
+    async def browse():
+        for request in seeded:
+            await Storage.requestStore.create(request)
+
+        update = FakeUpdate(1, location = SimpleNamespace(latitude = FULFILLER[0], longitude = FULFILLER[1]))
+        state = await FulfillerDetails.nearbyRequests(update, context)
+        pages = [[request["RequestID"] for request in context.user_data[MainMenu.REQUESTS_LISTED]]]
+
+        while context.user_data[MainMenu.BROWSE_PAGE]["nextKey"] is not None:
+            nextPage = FakeUpdate(1)
+            nextPage.callback_query = SimpleNamespace(data = "page#next", message = FakeMessage(), answer = answer, edit_message_text = FakeMessage().reply_text)
+
+            await FulfillerDetails.browseRequests(nextPage, context)
+            pages.append([request["RequestID"] for request in context.user_data[MainMenu.REQUESTS_LISTED]])
+
+        return state, pages
+
+    state, pages = asyncio.run(browse())
+
+    assert nearby == ["deck", "frontier", "technoedge"]
+    assert state == MainMenu.FULFIL_REQUEST
+    assert context.user_data[MainMenu.BROWSE_PAGE]["canteens"] == nearby
+    assert all(len(page) == FulfillerDetails.page_size for page in pages[:-1])
+    assert [RequestID for page in pages for RequestID in page] == expected
+
+# Query latency against the number of points indexed, for the geohash index and for measuring the distance to every point.
+# The points are spread over an area the size of Singapore, and queried with the default nearby radius.
+def test_near_latency_by_index_size_benchmark():
+    generator = random.Random(5)
+    radius = FulfillerDetails.nearby_radius
+    rows = []
+    speedups = {}
+
+    def anywhere():
+        return generator.uniform(1.24, 1.47), generator.uniform(103.6, 104.0)
+
+    for size in [100, 1000, 10000, 50000]:
+        points = {number: anywhere() for number in range(size)}
+        index = GeoIndex.GeoIndex(points)
+        queries = [anywhere() for _ in range(200)]
+
+        indexed = []
+
+        for latitude, longitude in queries:
+            start = time.perf_counter()
+            index.near(latitude, longitude, radius)
+            indexed.append(time.perf_counter() - start)
+
+        scanned = []
+
+        for latitude, longitude in queries[:20]:
+            start = time.perf_counter()
+            bruteForce(points, latitude, longitude, radius)
+            scanned.append(time.perf_counter() - start)
+
+        speedups[size] = percentile(scanned, 50) / percentile(indexed, 50)
+        rows.append((f"{size} points", f"geohash p50 {percentile(indexed, 50) * 1e6:.0f} µs  p99 {percentile(indexed, 99) * 1e6:.0f} µs"
+                                       f"   scan p50 {percentile(scanned, 50) * 1e6:.0f} µs"))
+
+    report(f"Points within {radius:.0f} m", rows)
+
+    assert speedups[10000] > 10
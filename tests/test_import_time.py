@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+import conftest
+
+# Cold start budgets, in microseconds, for importing MainMenu in a fresh interpreter: the bot's own modules
+# (reading config.ini, building the keyboards, ...), and everything including python-telegram-bot.
+OWN_MODULES_BUDGET = 50000
+TOTAL_BUDGET = 1500000
+
+# Imported on first use instead, so they must not be imported by MainMenu.
+LAZY_IMPORTS = ("boto3", "botocore")
+
+# Import MainMenu in a fresh interpreter started with the given options.
+# Bytecode is cached in the test's own directory, even if PYTHONDONTWRITEBYTECODE is set.
+def importMainMenu(*options):
+    env = dict(os.environ, PYTHONPATH = conftest.ROOT, PYTHONPYCACHEPREFIX = os.path.join(conftest.configDir, "pycache"))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    return subprocess.run([sys.executable, *options, "-c", "import MainMenu"], cwd = conftest.configDir, env = env, capture_output = True, text = True, check = True)
+
+# Import MainMenu with python -X importtime and return {module: (self, cumulative)} in microseconds.
+# It is imported once beforehand, so the bytecode is cached and compiling the modules isn't counted.
+def importTimes():
+    importMainMenu()
+    result = importMainMenu("-X", "importtime")
+
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        selfTime, cumulative, module = (field.strip() for field in line.split(":", 1)[1].split("|"))
+        times[module] = (int(selfTime), int(cumulative))
+
+    return times
+
+def test_main_menu_import_time():
+    times = importTimes()
+    ownModules = {name[:-3] for name in os.listdir(conftest.ROOT) if name.endswith(".py")}
+
+    assert not [module for module in times if module.split(".")[0] in LAZY_IMPORTS]
+    assert sum(selfTime for module, (selfTime, _) in times.items() if module in ownModules) < OWN_MODULES_BUDGET
+    assert times["MainMenu"][1] < TOTAL_BUDGET
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import tracemalloc
+
+import FulfillerDetails
+import OpenRequests
+import Storage
+from fakes import makeRequest
+
+ORDERS = 100000
+MAX_SIZE = 10000
+
+# 100k orders go through a bounded index: it keeps the newest max_size, and its memory stops growing once it is full.
+def test_index_stays_bounded_over_100k_orders(caplog):
+    caplog.set_level(logging.WARNING)
+
+    index = OpenRequests.OpenRequestIndex(MAX_SIZE)
+    canteens = ["deck", "frontier", "fine_foods", "flavours", "technoedge", "pgpr"]
+    newest = []
+
+    tracemalloc.start()
+
+    try:
+        for number in range(ORDERS):
+            request = makeRequest(requester_chat_id = number, canteen = canteens[number % len(canteens)])
+            index.add(request)
+
+            if number == MAX_SIZE - 1:
+                full, _ = tracemalloc.get_traced_memory()
+
+            if number >= ORDERS - MAX_SIZE:
+                newest.append(request["RequestID"])
+
+        newest = set(newest)
+        afterAll, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(index) == MAX_SIZE
+    assert set(index.requests) == newest
+    assert sum(len(keys) for keys in index.byCanteen.values()) == MAX_SIZE
+
+    # Allow for the set of newest IDs kept by the test itself.
+    assert afterAll < full * 1.5
+
+# Requests are dropped oldest first by the time they were made, so an old request reloaded into a full index goes first.
+def test_reloaded_old_request_is_dropped_first():
+    index = OpenRequests.OpenRequestIndex(3)
+    old = makeRequest(requester_chat_id = 1, canteen = "frontier")
+    newer = [makeRequest(requester_chat_id = number, canteen = "deck") for number in range(2, 5)]
+
+    for request in newer:
+        index.add(request)
+
+    index.load("frontier", [old])
+
+    assert old["RequestID"] not in index
+    assert all(request["RequestID"] in index for request in newer)
+
+# When the index is full the oldest request of any canteen is dropped, and only that canteen stops being served from memory.
+def test_full_index_drops_oldest_request_and_its_canteen():
+    index = OpenRequests.OpenRequestIndex(3)
+    deckOld, frontier, deck = [makeRequest(requester_chat_id = number, canteen = canteen) for number, canteen in enumerate(["deck", "frontier", "deck"])]
+
+    index.load("deck", [deckOld, deck])
+    index.load("frontier", [frontier])
+    index.add(makeRequest(requester_chat_id = 3, canteen = "frontier"))
+
+    assert deckOld["RequestID"] not in index
+    assert all(request["RequestID"] in index for request in [frontier, deck])
+    assert not index.isFresh("deck")
+    assert index.isFresh("frontier")
+
+# A canteen's listing is served from memory for max_staleness seconds after it was loaded, and no longer.
+def test_listing_goes_stale_after_max_staleness(monkeypatch):
+    monkeypatch.setattr(OpenRequests, "max_staleness", 30)
+
+    index = OpenRequests.OpenRequestIndex(10)
+    index.load("deck", [])
+
+    index.loadedAt["deck"] -= 29
+    assert index.isFresh("deck")
+
+    index.loadedAt["deck"] -= 2
+    assert not index.isFresh("deck")
+    assert not index.isFresh("frontier")
+
+# Requests made through another bot worker are listed once the canteen's listing goes stale and is reloaded from the store.
+def test_stale_listing_is_reloaded_from_store(stores):
+    first, second = makeRequest(requester_chat_id = 1), makeRequest(requester_chat_id = 2)
+
+    async def scenario():
+        await Storage.requestStore.create(first)
+        fresh, _ = await OpenRequests.getCanteenPage("deck", None, 10)
+
+        # Made elsewhere, so not added to this index.
+        await Storage.requestStore.create(second)
+        cached, _ = await OpenRequests.getCanteenPage("deck", None, 10)
+
+        OpenRequests.index.loadedAt["deck"] -= OpenRequests.max_staleness + 1
+        reloaded, _ = await OpenRequests.getCanteenPage("deck", None, 10)
+
+        return fresh, cached, reloaded
+
+    fresh, cached, reloaded = asyncio.run(scenario())
+
+    assert [request["RequestID"] for request in fresh] == [first["RequestID"]]
+    assert [request["RequestID"] for request in cached] == [first["RequestID"]]
+    assert [request["RequestID"] for request in reloaded] == [first["RequestID"], second["RequestID"]]
+
+# A canteen with more open requests than the index holds, or one that fails to load, is listed from the request store instead.
+def test_listing_falls_back_to_store(stores, monkeypatch):
+    monkeypatch.setattr(OpenRequests, "index", OpenRequests.OpenRequestIndex(2))
+
+    deck = [makeRequest(requester_chat_id = number) for number in range(3)]
+    frontier = makeRequest(requester_chat_id = 3, canteen = "frontier")
+
+    async def failingLoad(canteen):
+        raise RuntimeError("request store unavailable")
+
+    async def scenario():
+        for request in deck + [frontier]:
+            await Storage.requestStore.create(request)
+
+        tooMany = await OpenRequests.getCanteenPage("deck", None, 10)
+        deckPage, _ = await FulfillerDetails.getRequestPage("deck", None, 10)
+
+        monkeypatch.setattr(OpenRequests, "loadCanteen", failingLoad)
+        failed = await OpenRequests.getCanteenPage("frontier", None, 10)
+        frontierPage, _ = await FulfillerDetails.getRequestPage("frontier", None, 10)
+
+        return tooMany, deckPage, failed, frontierPage
+
+    tooMany, deckPage, failed, frontierPage = asyncio.run(scenario())
+
+    assert tooMany is None and failed is None
+    assert [request["RequestID"] for request in deckPage] == [request["RequestID"] for request in deck]
+    assert [request["RequestID"] for request in frontierPage] == [frontier["RequestID"]]
+
+# warm() loads every canteen it is given, and a canteen that fails to load doesn't stop the others.
+def test_warm_loads_every_canteen(stores, monkeypatch, caplog):
+    requests = [makeRequest(requester_chat_id = number, canteen = canteen) for number, canteen in enumerate(["deck", "frontier", "deck"])]
+
+    loadCanteen = OpenRequests.loadCanteen
+
+    async def failingLoad(canteen):
+        if canteen == "pgpr":
+            raise RuntimeError("request store unavailable")
+
+        await loadCanteen(canteen)
+
+    monkeypatch.setattr(OpenRequests, "loadCanteen", failingLoad)
+
+    async def scenario():
+        for request in requests:
+            await Storage.requestStore.create(request)
+
+        await OpenRequests.warm(["deck", "frontier", "pgpr"])
+
+    asyncio.run(scenario())
+
+    index = OpenRequests.index
+
+    assert index.isFresh("deck") and index.isFresh("frontier") and not index.isFresh("pgpr")
+    assert [request["RequestID"] for request in index.inCanteen("deck")] == [requests[0]["RequestID"], requests[2]["RequestID"]]
+    assert [request["RequestID"] for request in index.inCanteen("frontier")] == [requests[1]["RequestID"]]
+    assert "Failed to warm the open requests at 'pgpr'" in caplog.text
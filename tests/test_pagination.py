@@ -0,0 +1,269 @@
+import asyncio
+import bisect
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+import BackfillStatusCreatedAt
+import DynamoDB
+import OpenRequests
+import Storage
+from fakes import makeRequest
+
+SEEDED_REQUESTS = 50000
+
+# Stand-in for the Dabao4Me_Requests boto3 Table, answering queries on the canteen-status_created_at-index like DynamoDB does:
+# items in sort key order, at most page_items per response (in place of the 1 MB limit), and a LastEvaluatedKey while more remain.
+class LocalRequestTable:
+    def __init__(self, requests, page_items = 1000):
+        self.name = DynamoDB.tableName
+        self.page_items = page_items
+        self.queries = 0
+
+        self.items = sorted((dict(request, status_created_at = Storage.statusCreatedAt(request["request_status"], request["RequestID"])) for request in requests),
+                            key = lambda item: (item["canteen"], item["status_created_at"]))
+        self.keys = [(item["canteen"], item["status_created_at"]) for item in self.items]
+
+    def query(self, IndexName, KeyConditionExpression, ExpressionAttributeValues, Limit = None, ExclusiveStartKey = None):
+        assert IndexName == "canteen-status_created_at-index"
+
+        self.queries += 1
+
+        canteen = ExpressionAttributeValues[":canteen"]
+        prefix = ExpressionAttributeValues[":status"]
+
+        if ExclusiveStartKey is None:
+            start = bisect.bisect_left(self.keys, (canteen, prefix))
+        else:
+            start = bisect.bisect_right(self.keys, (canteen, ExclusiveStartKey["status_created_at"]))
+
+        pageSize = min(Limit or self.page_items, self.page_items)
+        page = []
+
+        for item in self.items[start:]:
+            if item["canteen"] != canteen or not item["status_created_at"].startswith(prefix) or len(page) == pageSize + 1:
+                break
+
+            page.append(dict(item))
+
+        response = {"Items": page[:pageSize], "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        if len(page) > pageSize:
+            response["LastEvaluatedKey"] = Storage.pageKey(page[pageSize - 1])
+
+        return response
+
+def seed():
+    random.seed(7)
+
+    requests = []
+
+    for number in range(SEEDED_REQUESTS):
+        request = makeRequest(requester_chat_id = number % 500, canteen = random.choice(["deck", "frontier"]))
+        request["request_status"] = "Available" if random.random() < 0.8 else "In Progress"
+        requests.append(request)
+
+    return requests
+
+requests = seed()
+
+def availableAt(canteen):
+    return sorted((request for request in requests if request["canteen"] == canteen and request["request_status"] == "Available"), key = Storage.sortKey)
+
+# Every open request at a canteen is yielded, oldest first, by following LastEvaluatedKey past the first page.
+def test_iter_by_canteen_reads_every_page():
+    table = LocalRequestTable(requests)
+    store = Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(table, "RequestID"))
+
+    async def readAll():
+        return [request["RequestID"] async for request in store.iterByCanteen("deck")]
+
+    expected = [request["RequestID"] for request in availableAt("deck")]
+
+    assert asyncio.run(readAll()) == expected
+    assert table.queries == len(expected) // table.page_items + 1
+
+# Stopping after the first few items only fetches the first page.
+def test_query_stops_after_max_items():
+    table = LocalRequestTable(requests)
+    asyncTable = DynamoDB.AsyncTable(table, "RequestID")
+
+    async def firstItems():
+        query = Storage.DynamoDBRequestStore(asyncTable).canteenQuery("frontier")
+        return [item["RequestID"] async for item in asyncTable.query_items(max_items = 5, **query)]
+
+    assert asyncio.run(firstItems()) == [request["RequestID"] for request in availableAt("frontier")[:5]]
+    assert table.queries == 1
+
+# Pages of a listing continue from the key of the page before, with one query each.
+def test_page_by_canteen_continues_from_the_key():
+    table = LocalRequestTable(requests)
+    store = Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(table, "RequestID"))
+
+    async def firstPages(count):
+        pages = []
+        startKey = None
+
+        for _ in range(count):
+            page, startKey = await store.pageByCanteen("deck", startKey, 5)
+            pages.append([request["RequestID"] for request in page])
+
+        return pages, startKey
+
+    pages, nextKey = asyncio.run(firstPages(20))
+    expected = [request["RequestID"] for request in availableAt("deck")[:100]]
+
+    assert [RequestID for page in pages for RequestID in page] == expected
+    assert nextKey == Storage.pageKey(availableAt("deck")[99])
+    assert table.queries == 20
+
+# The last page has no next key.
+def test_last_page_has_no_next_key():
+    seeded = [request for request in requests if request["canteen"] == "deck"][:7]
+    table = LocalRequestTable(seeded)
+    store = Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(table, "RequestID"))
+
+    expected = [request["RequestID"] for request in sorted(seeded, key = Storage.sortKey) if request["request_status"] == "Available"]
+    page, nextKey = asyncio.run(store.pageByCanteen("deck", None, 10))
+
+    assert [request["RequestID"] for request in page] == expected
+    assert nextKey is None
+
+# A listing of several canteens (the fulfiller's nearby canteens) is paged oldest first across all of them,
+# with every request listed exactly once, whether the pages come from the open request index or the request store.
+def test_listing_pages_interleave_canteens_by_age(stores, monkeypatch):
+    import FulfillerDetails
+    import OpenRequests
+
+    canteens = ["deck", "frontier", "technoedge"]
+    seeded = [makeRequest(requester_chat_id = number, canteen = canteens[number % 7 % 3]) for number in range(23)]
+
+    async def walk(fromIndex):
+        for request in seeded:
+            await Storage.requestStore.create(request)
+
+        if not fromIndex:
+            monkeypatch.setattr(OpenRequests, "getCanteenPage", lambda *args: asyncio.sleep(0))
+
+        pages = []
+        startKey = None
+
+        while True:
+            page, startKey = await FulfillerDetails.getListingPage(canteens, startKey, 5)
+            pages.append([request["RequestID"] for request in page])
+
+            if startKey is None:
+                return pages
+
+    expected = [request["RequestID"] for request in sorted(seeded, key = Storage.sortKey)]
+
+    for fromIndex in [True, False]:
+        pages = asyncio.run(walk(fromIndex))
+
+        assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+        assert [RequestID for page in pages for RequestID in page] == expected
+
+# ULID requests, each followed a millisecond later by one with a legacy RequestID ("<unix timestamp>#<user id>").
+def mixedRequests():
+    requests = []
+
+    for number in range(6):
+        request = makeRequest(requester_chat_id = number)
+
+        # Half a millisecond in, so reading it back as a float doesn't round it down into the millisecond before.
+        created = Storage.createdAt(request["RequestID"]) + 1
+        legacyID = f"{created // 1000}.{created % 1000:03d}500#{number}"
+
+        requests += [request, dict(request, RequestID = legacyID, created_at = Storage.createdAt(legacyID))]
+        time.sleep(0.003)
+
+    return requests
+
+# Legacy RequestIDs and ULIDs are listed in the order they were made: by the DynamoDB index, which sorts status_created_at as text,
+# and by the open request index and the other backends, which sort by Storage.sortKey().
+def test_mixed_request_ids_page_in_creation_order(stores):
+    seeded = mixedRequests()
+    table = LocalRequestTable(seeded)
+    dynamodbStore = Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(table, "RequestID"))
+
+    index = OpenRequests.OpenRequestIndex(100)
+    index.load("deck", seeded)
+
+    async def walk(pageByCanteen):
+        listed = []
+        startKey = None
+
+        while True:
+            page, startKey = await pageByCanteen("deck", startKey, 3)
+            listed += [request["RequestID"] for request in page]
+
+            if startKey is None:
+                return listed
+
+    async def indexPage(canteen, startKey, limit):
+        return index.page(canteen, startKey, limit)
+
+    async def scenario():
+        for request in seeded:
+            await Storage.requestStore.create(request)
+
+        return [await walk(pageByCanteen) for pageByCanteen in (dynamodbStore.pageByCanteen, Storage.requestStore.pageByCanteen, indexPage)]
+
+    expected = [request["RequestID"] for request in seeded]
+
+    assert sorted(seeded, key = Storage.sortKey) == seeded
+    assert asyncio.run(scenario()) == [expected] * 3
+
+# Stand-in for the Dabao4Me_Requests boto3 Table answering the scans and conditional updates of the backfill, a few items per page.
+# The scans see the items as they were when it was created, so a status changed afterwards looks like one changed during the backfill.
+class ScanTable:
+    def __init__(self, items, page_items = 3):
+        self.items = {item["RequestID"]: dict(item) for item in items}
+        self.scanned = [dict(item) for item in items]
+        self.page_items = page_items
+
+    def scan(self, ProjectionExpression, ExclusiveStartKey = None):
+        start = 0 if ExclusiveStartKey is None else [item["RequestID"] for item in self.scanned].index(ExclusiveStartKey["RequestID"]) + 1
+        names = ProjectionExpression.split(", ")
+
+        page = [{name: item[name] for name in names if name in item} for item in self.scanned[start:start + self.page_items]]
+        response = {"Items": page}
+
+        if start + self.page_items < len(self.scanned):
+            response["LastEvaluatedKey"] = {"RequestID": page[-1]["RequestID"]}
+
+        return response
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        assert UpdateExpression == "SET status_created_at = :status_created_at" and ConditionExpression == "request_status = :status"
+
+        item = self.items[Key["RequestID"]]
+
+        if item["request_status"] != ExpressionAttributeValues[":status"]:
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+
+        item["status_created_at"] = ExpressionAttributeValues[":status_created_at"]
+
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+# The backfill sets status_created_at on the requests written without it, and rewrites the legacy ones written as "<status>#<RequestID>".
+# A request whose status changed since it was scanned is left alone, and is the only one updated when it is run again.
+def test_backfill_sets_status_created_at():
+    seeded = mixedRequests()
+
+    for request in seeded[:4]:
+        request["status_created_at"] = f"{request['request_status']}#{request['RequestID']}"
+
+    table = ScanTable(seeded)
+    table.items[seeded[5]["RequestID"]]["request_status"] = "In Progress"
+
+    assert asyncio.run(BackfillStatusCreatedAt.backfill(DynamoDB.AsyncTable(table, "RequestID"))) == len(seeded) - 3
+    assert "status_created_at" not in table.items[seeded[5]["RequestID"]]
+
+    rerun = ScanTable(table.items.values())
+
+    assert asyncio.run(BackfillStatusCreatedAt.backfill(DynamoDB.AsyncTable(rerun, "RequestID"))) == 1
+
+    for item in rerun.items.values():
+        assert item["status_created_at"] == Storage.statusCreatedAt(item["request_status"], item["RequestID"])
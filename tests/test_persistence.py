@@ -0,0 +1,110 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+import DynamoDB
+import MainMenu
+import Persistence
+from benchmark import report, timeAsync
+from fakes import makeRequest
+
+# A failed write keeps the staged changes, and a change staged while the write was failing isn't overwritten by the older one.
+def test_failed_flush_keeps_pending_changes(tmp_path, monkeypatch):
+    persistence = Persistence.SQLitePersistence(str(tmp_path / "state.sqlite"), flush_delay = 60)
+    writeRows = persistence.writeRows
+
+    def failingWrite(rows):
+        raise OSError("disk full")
+
+    async def scenario():
+        await persistence.update_user_data(1, {"step": "old"})
+        await persistence.update_user_data(2, {"step": "kept"})
+
+        monkeypatch.setattr(persistence, "writeRows", failingWrite)
+
+        with pytest.raises(OSError):
+            await persistence.flushPending()
+
+        await persistence.update_user_data(1, {"step": "new"})
+
+        monkeypatch.setattr(persistence, "writeRows", writeRows)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+
+    reloaded = Persistence.SQLitePersistence(str(tmp_path / "state.sqlite"))
+
+    assert asyncio.run(reloaded.get_user_data()) == {1: {"step": "new"}, 2: {"step": "kept"}}
+
+CONVERSATIONS = 10000
+
+# The persistent ConversationHandlers of MainMenu, and the states of a requester chatting with their fulfiller.
+HANDLERS = ["conv_handler", "requester_init", "requester_in_conv", "fulfiller_init", "fulfiller_in_conv", "modifyRequest_handler"]
+LIVE_STATES = {"conv_handler": MainMenu.ROLE, "requester_init": MainMenu.REQUESTER_IN_CONVO, "requester_in_conv": MainMenu.REQUESTER_IN_CONVO}
+
+def liveConversation(chat_id):
+    request = makeRequest(requester_chat_id = chat_id)
+    request.update(request_status = "In Progress", fulfiller_chat_id = str(chat_id + 1), fulfiller_user_name = f"@user{chat_id + 1}")
+
+    return {MainMenu.ROLE: "requester", MainMenu.CANTEEN: request["canteen"], MainMenu.FOOD: request["food"], MainMenu.REQUEST_MADE: request}
+
+# Read everything the Application reads from its persistence on startup.
+async def rehydrate(persistence):
+    userData = await persistence.get_user_data()
+    conversations = {name: await persistence.get_conversations(name) for name in HANDLERS}
+
+    return userData, conversations
+
+# Stand-in for the boto3 Table of the DynamoDB persistence: query answers in pages of page_items rows, each taking latency seconds.
+class PersistenceTable:
+    def __init__(self, rows, page_items = 1000, latency = 0.005):
+        self.items = [{"kind": kind, "persistence_key": key, "value": Binary(value)} for kind, key, value in rows]
+        self.page_items = page_items
+        self.latency = latency
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, ExclusiveStartKey = None):
+        time.sleep(self.latency)
+
+        items = [item for item in self.items if item["kind"] == ExpressionAttributeValues[":kind"]]
+        start = 0 if ExclusiveStartKey is None else ExclusiveStartKey["index"]
+        response = {"Items": items[start:start + self.page_items]}
+
+        if start + self.page_items < len(items):
+            response["LastEvaluatedKey"] = {"index": start + self.page_items}
+
+        return response
+
+# Time to load 10k live conversations (user_data and conversation states) on a restart, from SQLite and from DynamoDB.
+def test_rehydration_benchmark(tmp_path, monkeypatch):
+    sqlitePersistence = Persistence.SQLitePersistence(str(tmp_path / "state.sqlite"), flush_size = CONVERSATIONS * 10)
+
+    async def save():
+        for chat_id in range(CONVERSATIONS):
+            await sqlitePersistence.update_user_data(chat_id, liveConversation(chat_id))
+
+            for name, state in LIVE_STATES.items():
+                await sqlitePersistence.update_conversation(name, (chat_id, chat_id), state)
+
+        await sqlitePersistence.flush()
+
+    asyncio.run(save())
+
+    monkeypatch.setattr(DynamoDB, "getResource", lambda: SimpleNamespace(Table = lambda tableName: PersistenceTable(sqlitePersistence.loadRows())))
+
+    rows = []
+
+    for persistence in [Persistence.SQLitePersistence(str(tmp_path / "state.sqlite")), Persistence.DynamoDBPersistence("Dabao4Me_Persistence")]:
+        (userData, conversations), seconds = timeAsync(rehydrate, persistence)
+
+        assert len(userData) == CONVERSATIONS
+        assert userData[42][MainMenu.REQUEST_MADE]["fulfiller_chat_id"] == "43"
+        assert all(conversations[name][(42, 42)] == state and len(conversations[name]) == CONVERSATIONS for name, state in LIVE_STATES.items())
+
+        rows.append((type(persistence).__name__, f"{seconds * 1000:.0f} ms"))
+
+    report(f"Rehydrating {CONVERSATIONS} live conversations ({CONVERSATIONS * (1 + len(LIVE_STATES))} rows)", rows)
+
+    assert seconds < 10
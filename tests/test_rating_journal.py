@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+import Storage
+import UserRatings
+
+def journalEntries(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+# Replaying the journal gives back exactly the counts still pending: those added, less those written to the rating store.
+def test_replay_restores_pending_counts(stores, tmp_path):
+    journalPath = tmp_path / "ratings.journal"
+
+    async def scenario():
+        aggregator = UserRatings.RatingAggregator(str(journalPath), 100)
+
+        await aggregator.add(1, {"good_given": 1})
+        await aggregator.add(2, {"good_received": 1})
+        await aggregator.add(1, {"good_given": 1, "bad_received": 1})
+        await aggregator.flushUser("2", {"good_received": 1})
+
+        return aggregator.pending
+
+    pending = asyncio.run(scenario())
+
+    replayed = UserRatings.RatingAggregator(str(journalPath), 100)
+
+    assert replayed.pending == pending == {"1": {"good_given": 2, "bad_received": 1}}
+
+# A final line cut short by a crash is dropped, and cut off so the next line appended isn't joined to it.
+def test_replay_drops_truncated_final_line(tmp_path):
+    journalPath = tmp_path / "ratings.journal"
+    journalPath.write_text(json.dumps({"chat_id": "1", "counts": {"good_given": 1}}) + "\n" + '{"chat_id": "2", "coun')
+
+    aggregator = UserRatings.RatingAggregator(str(journalPath), 100)
+
+    assert aggregator.pending == {"1": {"good_given": 1}}
+
+    asyncio.run(aggregator.add(3, {"bad_given": 1}))
+
+    replayed = UserRatings.RatingAggregator(str(journalPath), 100)
+
+    assert replayed.pending == {"1": {"good_given": 1}, "3": {"bad_given": 1}}
+
+# After a flush the journal holds only one line per user still pending.
+def test_flush_compacts_journal(stores, tmp_path):
+    journalPath = tmp_path / "ratings.journal"
+    aggregator = UserRatings.RatingAggregator(str(journalPath), 100)
+
+    async def scenario():
+        for number in range(20):
+            await aggregator.add(number % 4, {"good_given": 1})
+
+        await aggregator.flush()
+
+    asyncio.run(scenario())
+
+    assert journalEntries(journalPath) == []
+    assert aggregator.pending == {}
+
+    items = asyncio.run(Storage.ratingStore.getMany(range(4)))
+
+    assert all(items[str(number)]["good_given"] == 5 for number in range(4))
+
+# Counts that fail to be written stay pending and in the journal, and are written by the next flush.
+def test_failed_flush_keeps_counts(stores, tmp_path, monkeypatch):
+    journalPath = tmp_path / "ratings.journal"
+    aggregator = UserRatings.RatingAggregator(str(journalPath), 100)
+
+    increment = Storage.ratingStore.increment
+
+    async def failingIncrement(chat_id, counts):
+        if chat_id == "2":
+            raise RuntimeError("rating store unavailable")
+
+        await increment(chat_id, counts)
+
+    async def scenario():
+        await aggregator.add(1, {"good_given": 1})
+        await aggregator.add(2, {"good_received": 1})
+
+        monkeypatch.setattr(Storage.ratingStore, "increment", failingIncrement)
+        await aggregator.flush()
+
+    asyncio.run(scenario())
+
+    assert aggregator.pending == {"2": {"good_received": 1}}
+    assert journalEntries(journalPath) == [{"chat_id": "2", "counts": {"good_received": 1}}]
+
+    monkeypatch.setattr(Storage.ratingStore, "increment", increment)
+    asyncio.run(aggregator.flush())
+
+    items = asyncio.run(Storage.ratingStore.getMany(["1", "2"]))
+
+    assert aggregator.pending == {}
+    assert items["1"]["good_given"] == 1 and items["2"]["good_received"] == 1
+
+# Lines added while a batch is being written go out together with the next one, so concurrent adds share fsyncs.
+def test_concurrent_adds_share_journal_writes(tmp_path, monkeypatch):
+    journalPath = tmp_path / "ratings.journal"
+    aggregator = UserRatings.RatingAggregator(str(journalPath), 1000)
+
+    batches = []
+    appendLines = aggregator.appendLines
+
+    def countedAppendLines(lines):
+        batches.append(len(lines))
+        appendLines(lines)
+
+    monkeypatch.setattr(aggregator, "appendLines", countedAppendLines)
+
+    async def scenario():
+        await asyncio.gather(*(aggregator.add(number, {"good_given": 1}) for number in range(50)))
+
+    asyncio.run(scenario())
+
+    assert sum(batches) == 50
+    assert len(batches) < 50
+    assert len(journalEntries(journalPath)) == 50
+
+# A journal write that fails isn't acknowledged, and its line is written with the next batch.
+def test_failed_journal_write_is_retried(tmp_path, monkeypatch):
+    journalPath = tmp_path / "ratings.journal"
+    aggregator = UserRatings.RatingAggregator(str(journalPath), 1000)
+
+    appendLines = aggregator.appendLines
+
+    def failingAppendLines(lines):
+        raise OSError("disk full")
+
+    async def scenario():
+        monkeypatch.setattr(aggregator, "appendLines", failingAppendLines)
+
+        with pytest.raises(OSError):
+            await aggregator.add(1, {"good_given": 1})
+
+        monkeypatch.setattr(aggregator, "appendLines", appendLines)
+        await aggregator.add(2, {"bad_given": 1})
+
+    asyncio.run(scenario())
+
+    assert journalEntries(journalPath) == [{"chat_id": "1", "counts": {"good_given": 1}}, {"chat_id": "2", "counts": {"bad_given": 1}}]
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+import DynamoDB
+import Storage
+import UserRatings
+from benchmark import report
+
+RATINGS_TABLE = "Dabao4Me_User_Ratings"
+
+class ResponseBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+def cancelled(*reasons):
+    return 400, {"__type": "com.amazonaws.dynamodb.v20120810#TransactionCanceledException", "message": "Transaction cancelled",
+                 "CancellationReasons": [{"Code": reason} for reason in reasons]}
+
+# A DynamoDBRatingStore using a real boto3 resource, whose HTTP requests are answered by a before-send hook instead of DynamoDB:
+# with the given (status, body) outcomes in turn, then with success. Returns the store and the JSON bodies of the requests sent.
+def ratingStore(monkeypatch, outcomes):
+    monkeypatch.setattr(DynamoDB, "session", boto3.session.Session(region_name = "ap-southeast-1", aws_access_key_id = "test", aws_secret_access_key = "test"))
+    monkeypatch.setattr(DynamoDB, "resource", None)
+    monkeypatch.setattr(Storage.random, "uniform", lambda low, high: 0)
+
+    requests = []
+
+    def send(request, **kwargs):
+        requests.append(json.loads(request.body))
+        status, body = outcomes.pop(0) if outcomes else (200, {})
+
+        return AWSResponse(request.url, status, {}, ResponseBody(json.dumps(body).encode()))
+
+    DynamoDB.getResource().meta.client.meta.events.register("before-send.dynamodb.TransactWriteItems", send)
+
+    table = DynamoDB.AsyncTable(DynamoDB.getResource().Table(RATINGS_TABLE), "user_chat_id")
+
+    return Storage.DynamoDBRatingStore(table, DynamoDB.tableName), requests
+
+def record(store):
+    return asyncio.run(store.recordRating("request", 1, 2, "good"))
+
+# The request body holds each value in DynamoDB's low-level format exactly once.
+def test_request_body_is_serialized_once(monkeypatch):
+    store, requests = ratingStore(monkeypatch, [])
+
+    assert record(store) is True
+
+    markRated, giver, receiver = (item["Update"] for item in requests[0]["TransactItems"])
+
+    assert markRated["TableName"] == DynamoDB.tableName
+    assert markRated["Key"] == {"RequestID": {"S": "request"}}
+    assert markRated["ExpressionAttributeValues"] == {":giverSet": {"SS": ["1"]}, ":giver": {"S": "1"}}
+
+    assert [update["TableName"] for update in (giver, receiver)] == [RATINGS_TABLE, RATINGS_TABLE]
+    assert [update["Key"] for update in (giver, receiver)] == [{"user_chat_id": {"S": "1"}}, {"user_chat_id": {"S": "2"}}]
+    assert [update["ExpressionAttributeValues"] for update in (giver, receiver)] == [{":inc": {"N": "1"}}, {":inc": {"N": "1"}}]
+    assert [update["UpdateExpression"] for update in (giver, receiver)] == ["ADD good_given :inc", "ADD good_received :inc"]
+
+# The condition on the request failing means the giver has already rated it.
+def test_already_rated(monkeypatch):
+    store, requests = ratingStore(monkeypatch, [cancelled("ConditionalCheckFailed", "None", "None")])
+
+    assert record(store) is False
+    assert len(requests) == 1
+
+# The other user rating the same request at the same time, or throttling, doesn't drop the rating.
+def test_conflict_and_throttling_are_retried(monkeypatch):
+    store, requests = ratingStore(monkeypatch, [cancelled("TransactionConflict", "None", "None"), cancelled("None", "ThrottlingError", "None")])
+
+    assert record(store) is True
+    assert len(requests) == 3
+
+def test_other_cancellations_are_raised(monkeypatch):
+    store, requests = ratingStore(monkeypatch, [cancelled("None", "ValidationError", "None")])
+
+    with pytest.raises(ClientError):
+        record(store)
+
+def test_gives_up_after_retries(monkeypatch):
+    store, requests = ratingStore(monkeypatch, [cancelled("TransactionConflict", "None", "None") for _ in range(Storage.transaction_retries + 1)])
+
+    with pytest.raises(ClientError):
+        record(store)
+
+    assert len(requests) == Storage.transaction_retries + 1
+
+RATINGS = 50
+
+# Seconds each DynamoDB call takes.
+LATENCY = 0.005
+
+# Time per rating, with every DynamoDB call taking LATENCY: the two update_item calls made before the transaction,
+# the single TransactWriteItems of the "direct" mode, and the "write_behind" mode (the rated_by update, with the counts journaled).
+def test_rating_latency_benchmark(monkeypatch, tmp_path):
+    store, requests = ratingStore(monkeypatch, [])
+
+    def respond(request, **kwargs):
+        time.sleep(LATENCY)
+        return AWSResponse(request.url, 200, {}, ResponseBody(b"{}"))
+
+    DynamoDB.getResource().meta.client.meta.events.register("before-send.dynamodb.UpdateItem", respond)
+    DynamoDB.getResource().meta.client.meta.events.register_first("before-send.dynamodb.TransactWriteItems", lambda request, **kwargs: time.sleep(LATENCY))
+
+    monkeypatch.setattr(Storage, "ratingStore", store, raising = False)
+    monkeypatch.setattr(Storage, "requestStore", Storage.DynamoDBRequestStore(DynamoDB.AsyncTable(DynamoDB.getResource().Table(DynamoDB.tableName), "RequestID")), raising = False)
+
+    async def twoUpdates(RequestID):
+        await store.increment(1, {"good_given": 1})
+        await store.increment(2, {"good_received": 1})
+
+    async def viaUpdateRatingTable(RequestID):
+        assert await UserRatings.updateRatingTable(RequestID, 1, 2, UserRatings.GOOD)
+
+    async def timeRatings(rate):
+        start = time.perf_counter()
+
+        for number in range(RATINGS):
+            await rate(f"request{number}")
+
+        return (time.perf_counter() - start) / RATINGS
+
+    times = {"two update_item calls (before)": asyncio.run(timeRatings(twoUpdates))}
+
+    monkeypatch.setattr(UserRatings, "aggregator", None)
+    times["direct (TransactWriteItems)"] = asyncio.run(timeRatings(viaUpdateRatingTable))
+
+    async def writeBehind():
+        UserRatings.aggregator = UserRatings.RatingAggregator(str(tmp_path / "ratings.journal"), RATINGS * 10)
+        return await timeRatings(viaUpdateRatingTable)
+
+    times["write_behind"] = asyncio.run(writeBehind())
+
+    report(f"Time per rating, {LATENCY * 1000:.0f} ms per DynamoDB call", [(label, f"{seconds * 1000:.1f} ms") for label, seconds in times.items()])
+
+    assert times["direct (TransactWriteItems)"] < times["two update_item calls (before)"] * 0.75
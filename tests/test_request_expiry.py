@@ -0,0 +1,76 @@
+import asyncio
+import json
+import time
+
+import Canteens
+import RequestExpiry
+import Storage
+from fakes import FakeApplication, FakeContext, makeRequest
+
+# Finished requests are archived once their archive_at has passed, and not before. Open requests are never archived.
+def test_archives_only_due_finished_requests(stores, tmp_path, monkeypatch):
+    archivePath = tmp_path / "archive.jsonl"
+    sweeper = RequestExpiry.RequestSweeper(str(archivePath))
+
+    due = [makeRequest(requester_chat_id = number) for number in range(3)]
+    later = makeRequest(requester_chat_id = 10)
+    open_ = makeRequest(requester_chat_id = 11)
+
+    async def scenario():
+        for request in due + [later, open_]:
+            await Storage.requestStore.create(request)
+
+        monkeypatch.setattr(Storage, "finished_ttl", 0)
+
+        for request, status in zip(due, ["Complete", "Closed", "Complete"]):
+            await Storage.requestStore.setStatus(request["RequestID"], status)
+
+        monkeypatch.setattr(Storage, "finished_ttl", 3600)
+        await Storage.requestStore.setStatus(later["RequestID"], "Complete")
+
+        await sweeper.archiveFinished("deck", time.time() + 1)
+
+        return [await Storage.requestStore.get(request["RequestID"]) for request in due + [later, open_]]
+
+    stored = asyncio.run(scenario())
+
+    archived = [json.loads(line) for line in archivePath.read_text().splitlines()]
+
+    assert sorted(request["RequestID"] for request in archived) == sorted(request["RequestID"] for request in due)
+    assert stored[:3] == [None, None, None]
+    assert stored[3]["request_status"] == "Complete" and stored[4]["request_status"] == "Available"
+    assert sweeper.archived == 3
+
+# Requests at a canteen removed from the catalogue are still expired and archived: the sweeper also sweeps the canteens in the request store.
+def test_sweeps_canteens_removed_from_catalogue(stores, tmp_path, monkeypatch):
+    monkeypatch.setattr(RequestExpiry, "open_ttl", 0.01)
+    monkeypatch.setattr(Canteens, "ids", lambda: ["deck"])
+
+    archivePath = tmp_path / "archive.jsonl"
+    sweeper = RequestExpiry.RequestSweeper(str(archivePath))
+
+    open_ = makeRequest(requester_chat_id = 1, canteen = "old_canteen")
+    finished = makeRequest(requester_chat_id = 2, canteen = "other_old_canteen")
+
+    async def scenario():
+        for request in [open_, finished]:
+            await Storage.requestStore.create(request)
+
+        monkeypatch.setattr(Storage, "finished_ttl", 0)
+        await Storage.requestStore.setStatus(finished["RequestID"], "Complete")
+
+        # So the open request isn't archived as soon as it expires.
+        monkeypatch.setattr(Storage, "finished_ttl", 3600)
+        await asyncio.sleep(0.02)
+
+        await sweeper.sweep(FakeContext(FakeApplication(), 1))
+
+        return await Storage.requestStore.get(open_["RequestID"]), await Storage.requestStore.get(finished["RequestID"])
+
+    expired, archived = asyncio.run(scenario())
+
+    assert expired["request_status"] == "Expired"
+    assert archived is None
+    assert [json.loads(line)["RequestID"] for line in archivePath.read_text().splitlines()] == [finished["RequestID"]]
+    assert sweeper.expired == 1 and sweeper.archived == 1
+    assert sweeper.canteens == {"deck", "old_canteen", "other_old_canteen"}
@@ -0,0 +1,49 @@
+import asyncio
+
+import MainMenu
+import MatchingUsers
+import OpenRequests
+import RequestStream
+from fakes import FakeApplication, FakeContext, makeRequest
+
+class ListSource:
+    def __init__(self, records):
+        self.records = records
+
+    async def getRecords(self):
+        records, self.records = self.records, []
+        return records
+
+# A worker that doesn't send the notifications still applies every change: the claimed request leaves its open request index,
+# the pairing registry follows the request until it is closed, and the requester's conversation is moved along.
+def test_every_worker_applies_changes_but_only_one_sends(stores):
+    request = makeRequest(requester_chat_id = 1)
+    claimed = dict(request, request_status = "In Progress", fulfiller_chat_id = "2", fulfiller_user_name = "@user2")
+    confirmed = dict(claimed, requester_complete = "true")
+    closed = dict(confirmed, request_status = "Closed", closed_by = "fulfiller")
+
+    OpenRequests.index.add(request)
+
+    application = FakeApplication()
+    context = FakeContext(application, 0)
+    records = [(None, request), (request, claimed), (claimed, confirmed)]
+
+    async def poll(consumer):
+        await consumer.poll(context)
+
+    asyncio.run(poll(RequestStream.RequestStatusConsumer(ListSource(records), sendNotifications = False)))
+
+    assert request["RequestID"] not in OpenRequests.index
+    assert MatchingUsers.activePairings[request["RequestID"]]["requester_complete"] == "true"
+    assert application.user_data[1][MainMenu.REQUEST_MADE]["request_status"] == "In Progress"
+    assert 1 in application.markedUsers
+
+    asyncio.run(poll(RequestStream.RequestStatusConsumer(ListSource([(confirmed, closed)]), sendNotifications = False)))
+
+    assert MatchingUsers.activePairings[request["RequestID"]]["request_status"] == "Closed"
+    assert application.bot.sent == []
+
+    # The worker that sends the notifications tells the requester the fulfiller ended the conversation.
+    asyncio.run(poll(RequestStream.RequestStatusConsumer(ListSource([(confirmed, closed)]), sendNotifications = True)))
+
+    assert [message["chat_id"] for message in application.bot.sent] == ["1"]
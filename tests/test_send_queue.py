@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import time
+
+from telegram import Bot, Message
+
+import SendQueue
+from benchmark import report
+from fakes import FakeBotAPI
+
+class FlakyBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if text == "broken":
+            raise RuntimeError("unexpected failure")
+
+        self.sent.append((chat_id, text))
+        return text
+
+# An unexpected error drops the message, and the chat's next messages are still sent.
+def test_unexpected_error_releases_the_chat(monkeypatch):
+    monkeypatch.setattr(SendQueue, "chat_rate", 1000)
+    monkeypatch.setattr(SendQueue, "chat_burst", 1000)
+
+    async def scenario():
+        bot = FlakyBot()
+        queue = SendQueue.OutboundQueue(bot)
+        queue.start()
+
+        results = [queue.put(SendQueue.NOTIFICATION, "send_message", 7, {"text": text}) for text in ("broken", "first", "second")]
+        results = await asyncio.wait_for(asyncio.gather(*results), timeout = 5)
+
+        await queue.stop(timeout = 1)
+
+        return bot, queue, results
+
+    bot, queue, results = asyncio.run(scenario())
+
+    assert results == [None, "first", "second"]
+    assert bot.sent == [(7, "first"), (7, "second")]
+    assert queue.busyChats == set() and queue.parked == {}
+    assert queue.dropped == 1 and queue.deliveries == set()
+
+MESSAGES = 450
+CHATS = 90
+
+# The flood limits of the Bot API stand-in below, scaled up ten times from Telegram's so the benchmark runs quickly.
+API_GLOBAL_RATE = 300
+API_CHAT_RATE = 10
+API_CHAT_BURST = 3
+
+# A Bot API stand-in that enforces flood limits like Telegram: a call over the global or per-chat limit gets a 429 with retry_after.
+# Every call takes latency seconds.
+class RateLimitedBotAPI(FakeBotAPI):
+    def __init__(self, global_rate, latency = 0.005):
+        super().__init__()
+
+        self.globalBucket = SendQueue.TokenBucket(global_rate, global_rate)
+        self.chatBuckets = {}
+        self.latency = latency
+        self.tooManyRequests = 0
+
+    async def respond(self, apiMethod, parameters):
+        await asyncio.sleep(self.latency)
+
+        if apiMethod == "sendMessage":
+            now = time.monotonic()
+            chatBucket = self.chatBuckets.setdefault(parameters["chat_id"], SendQueue.TokenBucket(API_CHAT_RATE, API_CHAT_BURST))
+
+            if self.globalBucket.waitTime(now) > 0 or chatBucket.waitTime(now) > 0:
+                self.tooManyRequests += 1
+                return 429, json.dumps({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1}}).encode()
+
+            self.globalBucket.take(now)
+            chatBucket.take(now)
+
+        return await super().respond(apiMethod, parameters)
+
+# Send MESSAGES messages to CHATS chats at once, straight from the handlers (as before the queue) or through the queue.
+# Returns the number of messages delivered, the seconds it took and the number of 429s.
+async def sendBurst(api, queued):
+    async with Bot("123456:TEST", request = api, get_updates_request = FakeBotAPI()) as bot:
+        start = time.perf_counter()
+        messages = [(chat_id % CHATS, f"message {chat_id}") for chat_id in range(MESSAGES)]
+
+        if queued:
+            queue = SendQueue.OutboundQueue(bot)
+            queue.start()
+
+            results = await asyncio.gather(*[queue.put(SendQueue.NOTIFICATION, "send_message", chat_id, {"text": text}) for chat_id, text in messages])
+            await queue.stop(timeout = 1)
+        else:
+            results = await asyncio.gather(*[bot.send_message(chat_id = chat_id, text = text) for chat_id, text in messages], return_exceptions = True)
+
+        delivered = sum(isinstance(result, Message) for result in results)
+
+        return delivered, time.perf_counter() - start, api.tooManyRequests
+
+# Sustained throughput against the Bot API stand-in, and how it degrades when the API's global limit is below the queue's rate
+# (e.g. other bots on the same IP), so the queue keeps running into 429s.
+def test_send_throughput_benchmark(monkeypatch, caplog):
+    caplog.set_level(logging.ERROR)
+
+    monkeypatch.setattr(SendQueue, "global_rate", API_GLOBAL_RATE * 0.9)
+    monkeypatch.setattr(SendQueue, "chat_rate", API_CHAT_RATE * 0.9)
+    monkeypatch.setattr(SendQueue, "chat_burst", API_CHAT_BURST)
+    monkeypatch.setattr(SendQueue, "max_in_flight", 16)
+
+    runs = {
+        "direct sends": (RateLimitedBotAPI(API_GLOBAL_RATE), False),
+        "send queue": (RateLimitedBotAPI(API_GLOBAL_RATE), True),
+        "send queue, API at half its rate": (RateLimitedBotAPI(API_GLOBAL_RATE / 2), True)
+    }
+
+    results = {label: asyncio.run(sendBurst(api, queued)) for label, (api, queued) in runs.items()}
+
+    report(f"{MESSAGES} messages to {CHATS} chats, Bot API limits {API_GLOBAL_RATE}/s overall and {API_CHAT_RATE}/s per chat", [
+        (label, f"{delivered}/{MESSAGES} delivered, {delivered / seconds:.0f} msg/s, {tooMany} x 429")
+        for label, (delivered, seconds, tooMany) in results.items()
+    ])
+
+    assert results["direct sends"][0] < MESSAGES
+    assert results["send queue"][0] == MESSAGES and results["send queue"][2] == 0
+    assert results["send queue, API at half its rate"][0] == MESSAGES
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import socket
+import time
+from datetime import datetime
+
+import httpx
+from telegram import Chat, Message, Update, User
+from telegram.ext import Application, MessageHandler, filters
+
+from ChatUpdateProcessor import PerChatUpdateProcessor
+from benchmark import percentile, report
+from fakes import FakeBotAPI
+
+SECRET_TOKEN = "load-test-secret"
+
+UPDATES = 200
+CHATS = 100
+
+# Updates POSTed per second by the load generator.
+RATE = 200
+
+# Seconds each update's handler waits, as on a DynamoDB call, before it replies.
+HANDLER_TIME = 0.01
+
+def freePort():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+# The JSON Telegram POSTs to the webhook for a text message from a user in a private chat.
+def updateJSON(update_id, chat_id):
+    user = User(id = chat_id, is_bot = False, first_name = f"user{chat_id}")
+    message = Message(message_id = update_id, date = datetime.now(), chat = Chat(id = chat_id, type = Chat.PRIVATE), from_user = user, text = "hello")
+
+    return Update(update_id = update_id, message = message).to_dict()
+
+# Serve the bot's webhook on a local port, as MainMenu does in "webhook" mode, against a stand-in for the Bot API,
+# and POST UPDATES synthetic updates at it, RATE per second. Returns the seconds from each POST until its handler had replied,
+# and the status codes of a POST without the secret token and of one with it.
+async def loadWebhook(concurrent_updates):
+    botAPI = FakeBotAPI()
+    application = (Application.builder().token("123456:TEST").request(botAPI).get_updates_request(FakeBotAPI())
+                   .concurrent_updates(PerChatUpdateProcessor(concurrent_updates)).build())
+
+    posted = {}
+    latencies = []
+
+    async def handle(update, context):
+        await asyncio.sleep(HANDLER_TIME)
+        await context.bot.send_message(chat_id = update.effective_chat.id, text = "ok")
+
+        latencies.append(time.perf_counter() - posted[update.update_id])
+
+    application.add_handler(MessageHandler(filters.TEXT, handle))
+
+    port = freePort()
+    url = f"http://127.0.0.1:{port}/telegram"
+
+    await application.initialize()
+    await application.start()
+    await application.updater.start_webhook(listen = "127.0.0.1", port = port, url_path = "telegram", secret_token = SECRET_TOKEN)
+
+    try:
+        async with httpx.AsyncClient() as client:
+            rejected = await client.post(url, json = updateJSON(0, 1), headers = {"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+
+            async def post(update_id):
+                posted[update_id] = time.perf_counter()
+                return await client.post(url, json = updateJSON(update_id, 1 + update_id % CHATS), headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN})
+
+            posts = []
+
+            for update_id in range(1, UPDATES + 1):
+                posts.append(asyncio.create_task(post(update_id)))
+                await asyncio.sleep(1 / RATE)
+
+            responses = await asyncio.gather(*posts)
+
+        while len(latencies) < UPDATES:
+            await asyncio.sleep(0.01)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+    assert len(botAPI.sent) == UPDATES
+
+    return latencies, rejected.status_code, {response.status_code for response in responses}
+
+# Only POSTs carrying the secret token are accepted, and every accepted update is handled.
+def test_webhook_requires_the_secret_token(caplog):
+    caplog.set_level(logging.WARNING)
+
+    latencies, rejected, accepted = asyncio.run(loadWebhook(32))
+
+    assert rejected == 403
+    assert accepted == {200}
+    assert len(latencies) == UPDATES
+
+# Handler latency (p50/p99) under a burst of updates, processing one update at a time (as run_polling did before)
+# and up to 32 at once.
+def test_webhook_latency_benchmark(caplog):
+    caplog.set_level(logging.WARNING)
+
+    p99 = {}
+    rows = []
+
+    for concurrent_updates in [1, 32]:
+        latencies, _, _ = asyncio.run(loadWebhook(concurrent_updates))
+        p99[concurrent_updates] = percentile(latencies, 99)
+
+        rows.append((f"concurrent_updates = {concurrent_updates}: p50 / p99", f"{percentile(latencies, 50) * 1000:.0f} ms / {p99[concurrent_updates] * 1000:.0f} ms"))
+
+    report(f"{UPDATES} webhook updates from {CHATS} chats at {RATE}/s, {HANDLER_TIME * 1000:.0f} ms handlers", rows)
+
+    assert p99[32] * 3 < p99[1]